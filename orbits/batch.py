@@ -0,0 +1,239 @@
+"""
+Many small systems integrated at once along a leading "system" axis.
+
+State arrays are shaped (M systems, N bodies, D): one vectorized force
+pass and one kick/drift per substep advance every system together, so ten
+thousand three-body problems cost about as much per step as one large
+numpy operation instead of ten thousand Python loops.  Each system has its
+own timestep and end time, and systems that have finished or lost a body
+are masked out of later steps.
+"""
+import numpy as np
+
+from .forces import BLOCK_ELEMENTS, G
+from .integrators import INTEGRATORS, Composition
+
+
+def batched_accelerations(positions, masses, G=G, softening=0.0, out=None):
+    """
+    Direct-sum self-gravity of each of M independent systems.
+
+    :param positions: (M, N, D) positions
+    :type positions: np.ndarray
+    :param masses: (M, N) masses
+    :type masses: np.ndarray
+    :param G: Gravitational constant
+    :type G: float
+    :param softening: Plummer softening length
+    :type softening: float
+    :param out: Optional (M, N, D) array to write the result into
+    :type out: np.ndarray
+    :return: (M, N, D) accelerations
+    :rtype: np.ndarray
+    """
+    positions = np.asarray(positions, dtype=float)
+    masses = np.asarray(masses, dtype=float)
+    if out is None:
+        out = np.empty_like(positions)
+    m, n, dim = positions.shape
+    eps2 = softening ** 2
+    block = max(1, BLOCK_ELEMENTS // (n * n * dim))
+    for start in range(0, m, block):
+        stop = start + block
+        x = positions[start:stop]
+        # diff[s, i, j] points from body i towards body j of system s
+        diff = x[:, np.newaxis, :, :] - x[:, :, np.newaxis, :]
+        r2 = np.einsum('sijk,sijk->sij', diff, diff)
+        if eps2:
+            r2 += eps2
+        inv_r3 = np.zeros_like(r2)
+        np.power(r2, -1.5, out=inv_r3, where=r2 > 0)
+        inv_r3 *= masses[start:stop, np.newaxis, :]
+        np.einsum('sij,sijk->sik', inv_r3, diff, out=out[start:stop])
+    out *= G
+    return out
+
+
+def batched_energy(positions, velocities, masses, G=G, softening=0.0):
+    """
+    :param positions: (M, N, D) positions
+    :param velocities: (M, N, D) velocities
+    :param masses: (M, N) masses
+    :param G: Gravitational constant
+    :param softening: Plummer softening length
+    :return: (M,) total energy of each system (J)
+    :rtype: np.ndarray
+    """
+    kinetic = 0.5 * np.einsum('si,sik,sik->s', masses, velocities,
+                              velocities)
+    diff = positions[:, np.newaxis] - positions[:, :, np.newaxis]
+    r2 = np.einsum('sijk,sijk->sij', diff, diff)
+    # No self pairs, or pairs at zero separation, softened or not
+    inv_r = np.zeros_like(r2)
+    np.power(r2 + softening ** 2, -0.5, out=inv_r, where=r2 > 0)
+    potential = -0.5 * G * np.einsum('si,sij,sj->s', masses, inv_r, masses)
+    return kinetic + potential
+
+
+class Batch:
+    """
+    M systems of N bodies advanced together with a symplectic composition
+    scheme ('leapfrog' or 'yoshida4').
+
+    Attributes are (M, ...) arrays: positions, velocities, accelerations,
+    masses, dt, t_end, time, steps, and the masks active, finished and
+    ejected.  Inactive systems are left untouched by step().
+    """
+
+    def __init__(self, positions, velocities, masses, dt, t_end=np.inf,
+                 G=G, softening=0.0, integrator='leapfrog'):
+        """
+        :param positions: (M, N, D) positions
+        :type positions: np.ndarray
+        :param velocities: (M, N, D) velocities
+        :type velocities: np.ndarray
+        :param masses: (M, N) masses
+        :type masses: np.ndarray
+        :param dt: Timestep (s), scalar or (M,)
+        :param t_end: Time at which each system finishes (s), scalar or (M,)
+        :param G: Gravitational constant
+        :type G: float
+        :param softening: Plummer softening length
+        :type softening: float
+        :param integrator: 'leapfrog' or 'yoshida4'
+        :type integrator: str
+        :return: None
+        :rtype: None
+        """
+        self.positions = np.array(positions, dtype=float)
+        self.velocities = np.array(velocities, dtype=float)
+        self.masses = np.array(masses, dtype=float)
+        if self.positions.ndim != 3 or \
+                self.velocities.shape != self.positions.shape or \
+                self.masses.shape != self.positions.shape[:2]:
+            raise ValueError('expected (M, N, D) positions and velocities '
+                             'and (M, N) masses')
+        m = len(self.positions)
+        self.accelerations = np.zeros_like(self.positions)
+        self.dt = np.array(np.broadcast_to(dt, m), dtype=float)
+        self.t_end = np.array(np.broadcast_to(t_end, m), dtype=float)
+        self.time = np.zeros(m)
+        self.steps = np.zeros(m, int)
+        self.active = np.ones(m, bool)
+        self.finished = np.zeros(m, bool)
+        self.ejected = np.zeros(m, bool)
+        self.G = G
+        self.softening = softening
+        cls = INTEGRATORS.get(integrator)
+        if cls is None or not issubclass(cls, Composition):
+            raise ValueError('batches integrate with a composition scheme '
+                             '(leapfrog or yoshida4), not ' + repr(integrator))
+        self.coefficients = cls.coefficients
+        self.fresh = False
+
+    @classmethod
+    def from_stores(cls, stores, dt, **options):
+        """
+        Stack BodyStores with equal numbers of bodies into a batch.
+        :param stores: The systems
+        :type stores: list[BodyStore]
+        :param dt: Timestep (s), scalar or one per store
+        :param options: Further keyword arguments of Batch
+        :return: A batch of len(stores) systems
+        :rtype: Batch
+        """
+        if len(set(len(s) for s in stores)) > 1:
+            raise ValueError('stores have different numbers of bodies')
+        return cls([s.positions for s in stores],
+                   [s.velocities for s in stores],
+                   [s.masses for s in stores], dt, **options)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def step(self):
+        """
+        Advance every active system by its own dt, or less where that would
+        pass its t_end, which finishes it.
+        :return: Number of systems advanced
+        :rtype: int
+        """
+        rows = np.flatnonzero(self.active)
+        if not len(rows):
+            return 0
+        whole = len(rows) == len(self)
+        if whole:
+            x, v, a, m = (self.positions, self.velocities,
+                          self.accelerations, self.masses)
+        else:
+            x, v, a, m = (self.positions[rows], self.velocities[rows],
+                          self.accelerations[rows], self.masses[rows])
+        if not self.fresh:
+            batched_accelerations(x, m, self.G, self.softening, out=a)
+        remaining = self.t_end[rows] - self.time[rows]
+        last = self.dt[rows] >= remaining
+        h = np.where(last, remaining, self.dt[rows])[:, None, None]
+        for c in self.coefficients:
+            v += a * (c * h / 2)
+            x += v * (c * h)
+            batched_accelerations(x, m, self.G, self.softening, out=a)
+            v += a * (c * h / 2)
+        if not whole:
+            self.positions[rows], self.velocities[rows] = x, v
+            self.accelerations[rows] = a
+        self.fresh = True
+        self.time[rows] = np.where(last, self.t_end[rows],
+                                   self.time[rows] + h[:, 0, 0])
+        self.steps[rows] += 1
+        self.finished[rows[last]] = True
+        self.active[rows[last]] = False
+        return len(rows)
+
+    def eject(self, radius):
+        """
+        Deactivate systems with a body farther than radius from their
+        barycentre.
+        :param radius: Escape radius (m), scalar or (M,)
+        :return: Mask of the systems ejected by this call
+        :rtype: np.ndarray
+        """
+        total = self.masses.sum(axis=1)
+        centre = np.einsum('si,sik->sk', self.masses, self.positions) / \
+            np.where(total > 0, total, 1)[:, None]
+        d = self.positions - centre[:, None]
+        far = np.einsum('sik,sik->si', d, d).max(axis=1) > \
+            np.square(np.broadcast_to(radius, len(self)))
+        new = far & self.active
+        self.ejected |= new
+        self.active &= ~new
+        return new
+
+    def energy(self):
+        """
+        :return: (M,) total energy of each system (J)
+        :rtype: np.ndarray
+        """
+        return batched_energy(self.positions, self.velocities, self.masses,
+                              self.G, self.softening)
+
+    def run(self, steps=None, escape_radius=None, callback=None):
+        """
+        Step until every system is inactive, or for at most steps steps.
+        :param steps: Maximum number of steps (unbounded if None; then every
+            system needs a finite t_end or an escape radius)
+        :type steps: int
+        :param escape_radius: Eject systems beyond this radius after every
+            step
+        :param callback: Called as callback(self) after every step
+        :return: Number of steps taken
+        :rtype: int
+        """
+        taken = 0
+        while (steps is None or taken < steps) and self.active.any():
+            self.step()
+            taken += 1
+            if escape_radius is not None:
+                self.eject(escape_radius)
+            if callback is not None:
+                callback(self)
+        return taken
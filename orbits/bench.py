@@ -0,0 +1,252 @@
+"""
+Benchmarks of throughput, memory and accuracy for every force backend and
+integrator on the canonical scenarios.
+
+    python -m orbits bench --output bench.json
+    python -m orbits bench --output new.json --baseline bench.json
+
+Each case integrates a scenario for a fixed simulated time and reports
+steps per second, wall time per pair interaction, peak memory of the
+numpy temporaries and the relative drift of energy and angular momentum.
+Pairs are counted as targets times massive sources for every backend, so
+for Barnes-Hut the figure is the cost per pair a direct sum would need.
+Results are written as JSON; comparing them with a stored baseline lists
+the cases that became slower or less accurate.
+"""
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import jit
+from .diagnostics import angular_momentum, energy
+from .forces import make_backend
+from .integrators import make_integrator
+from .scenarios import make_scenario
+from .simulation import Simulation
+
+# name: (scenario, generator options, dt (s), steps); the simulated time
+# is the same for every engine
+SCENARIOS = {
+    'sun-earth': ('sun-earth', {}, 3600.0, 24 * 365),
+    'solar': ('solar', {}, 3600.0, 24 * 30),
+    'binary': ('binary', {}, 3600.0, 24 * 365),
+    'particles-100': ('particles', {'count': 100, 'seed': 0}, 10.0, 100),
+    'particles-1000': ('particles', {'count': 1000, 'seed': 0}, 10.0, 20),
+    'particles-10000': ('particles', {'count': 10000, 'seed': 0}, 10.0, 4),
+    'particles-100000': ('particles', {'count': 100000, 'seed': 0}, 10.0, 2),
+    'belt-10000': ('belt', {'count': 10000, 'seed': 0}, 86400.0, 30),
+}
+QUICK = ('sun-earth', 'solar', 'binary', 'particles-100', 'particles-1000')
+BACKENDS = ('direct', 'barnes-hut', 'numba', 'parallel')
+INTEGRATORS = ('euler', 'leapfrog', 'verlet', 'yoshida4', 'block',
+               'wisdom-holman', 'hierarchical', 'test-particles')
+# Integrators that need one dominant central body
+CENTRAL = ('wisdom-holman', 'hierarchical')
+# Systems larger than this skip the O(N^2) energy evaluation
+ENERGY_BODIES = 20000
+
+
+class CountingForces:
+    """
+    Force backend wrapper counting the pair interactions asked of it.
+    """
+
+    def __init__(self, forces):
+        self.forces = forces
+        self.pairs = 0
+
+    def __getattr__(self, name):
+        return getattr(self.forces, name)
+
+    def accelerations(self, positions, masses, out=None):
+        self.pairs += len(positions) * np.count_nonzero(masses)
+        return self.forces.accelerations(positions, masses, out=out)
+
+    def subset_accelerations(self, positions, masses, rows):
+        self.pairs += np.arange(len(positions))[rows].size * \
+            np.count_nonzero(masses)
+        return self.forces.subset_accelerations(positions, masses, rows)
+
+
+def drift(before, after):
+    """
+    :return: |after - before| / |before|, or the absolute change when
+        before is zero
+    :rtype: float
+    """
+    change = float(np.linalg.norm(np.subtract(after, before)))
+    size = float(np.linalg.norm(before))
+    return change / size if size else change
+
+
+def applicable(scenario, integrator):
+    """
+    Whether integrator makes sense for scenario: the central-body schemes
+    are skipped for particle swarms.
+    """
+    return not (integrator in CENTRAL and scenario.startswith('particles'))
+
+
+def missing(forces):
+    """
+    Why the backend forces cannot be benchmarked here: without numba the
+    'numba' backend would only repeat 'direct'.
+    :return: The reason, or None if it can
+    :rtype: str
+    """
+    if forces == 'numba' and not jit.available():
+        return 'numba is not installed'
+    return None
+
+
+def run_case(scenario, forces='direct', integrator='leapfrog', steps=None):
+    """
+    Benchmark one scenario with one backend and integrator.
+    :param scenario: Key of SCENARIOS
+    :type scenario: str
+    :param forces: Force backend name
+    :type forces: str
+    :param integrator: Integrator name
+    :type integrator: str
+    :param steps: Override the number of steps
+    :type steps: int
+    :return: Scenario, engine and measurements
+    :rtype: dict
+    """
+    name, options, dt, default_steps = SCENARIOS[scenario]
+    steps = default_steps if steps is None else steps
+
+    def simulation():
+        backend = CountingForces(make_backend(forces))
+        return Simulation(make_scenario(name, **options), backend,
+                          make_integrator(integrator), dt)
+
+    sim = simulation()
+    store = sim.store
+    energetic = len(store) <= ENERGY_BODIES
+
+    e0 = energy(store, sim.forces) if energetic else None
+    l0 = angular_momentum(store)
+    start = time.perf_counter()
+    sim.run(steps)
+    wall = time.perf_counter() - start
+    # Integrators evaluating some pairs themselves (test particles) count
+    # them too
+    pairs = int(sim.forces.pairs) + getattr(sim.integrator, 'pairs', 0)
+    sim.close()
+    # Memory is measured on a separate short run, as tracing slows it down
+    traced = simulation()
+    tracemalloc.start()
+    try:
+        traced.run(min(steps, 2))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        traced.close()
+    return {'scenario': scenario, 'bodies': len(store), 'forces': forces,
+            'integrator': integrator, 'steps': steps, 'dt': dt,
+            'simulated_time': steps * dt, 'wall_time': wall,
+            'steps_per_s': steps / wall if wall else float('inf'),
+            'pairs': pairs, 'ns_per_pair': 1e9 * wall / pairs if pairs
+            else None, 'peak_memory': peak,
+            'energy_drift': drift(e0, energy(store, sim.forces))
+            if energetic else None,
+            'angular_momentum_drift': drift(l0,
+                                            angular_momentum(store))}
+
+
+def run_suite(scenarios=None, backends=BACKENDS, integrators=INTEGRATORS,
+              report=None):
+    """
+    Benchmark every applicable combination.
+    :param scenarios: Keys of SCENARIOS (the QUICK set if None)
+    :param backends: Force backend names
+    :param integrators: Integrator names
+    :param report: Called with each result as it is measured
+    :return: Machine description, the list of results and the backends
+        skipped, with the reason
+    :rtype: dict
+    """
+    results = []
+    skipped = {}
+    for forces in backends:
+        reason = missing(forces)
+        if reason is not None:
+            skipped[forces] = reason
+    backends = [forces for forces in backends if forces not in skipped]
+    for scenario in QUICK if scenarios is None else scenarios:
+        for forces in backends:
+            for integrator in integrators:
+                if not applicable(scenario, integrator):
+                    continue
+                result = run_case(scenario, forces, integrator)
+                results.append(result)
+                if report is not None:
+                    report(result)
+    return {'machine': {'python': platform.python_version(),
+                        'numpy': np.__version__,
+                        'platform': platform.platform(),
+                        'processor': platform.processor()},
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results,
+            'skipped': skipped}
+
+
+def compare(results, baseline, slower=0.2, drift_factor=10.0):
+    """
+    Cases of results that regressed against baseline.
+
+    A case regresses if its steps per second fell by more than the
+    fraction slower, or if its energy or angular momentum drift grew by
+    more than drift_factor (beyond rounding).
+
+    :param results: Output of run_suite
+    :type results: dict
+    :param baseline: Earlier output of run_suite
+    :type baseline: dict
+    :param slower: Tolerated fractional loss of throughput
+    :type slower: float
+    :param drift_factor: Tolerated growth of the drifts
+    :type drift_factor: float
+    :return: One message per regression
+    :rtype: list[str]
+    """
+    def key(r):
+        return r['scenario'], r['forces'], r['integrator']
+
+    old = {key(r): r for r in baseline['results']}
+    regressions = []
+    for new in results['results']:
+        ref = old.get(key(new))
+        if ref is None:
+            continue
+        label = '/'.join(key(new))
+        if new['steps_per_s'] < (1 - slower) * ref['steps_per_s']:
+            regressions.append('{0}: {1:.1f} steps/s, baseline {2:.1f}'.format(
+                label, new['steps_per_s'], ref['steps_per_s']))
+        for quantity in ('energy_drift', 'angular_momentum_drift'):
+            # Older baselines have no angular_momentum_drift
+            if new[quantity] is None or ref.get(quantity) is None:
+                continue
+            if new[quantity] > drift_factor * ref[quantity] + 1e-14:
+                regressions.append('{0}: {1} {2:.3e}, baseline {3:.3e}'.format(
+                    label, quantity, new[quantity], ref[quantity]))
+    return regressions
+
+
+def save(results, path):
+    """
+    Write the output of run_suite to a JSON file.
+    """
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+
+
+def load(path):
+    """
+    Read a JSON file written by save.
+    """
+    with open(path) as f:
+        return json.load(f)
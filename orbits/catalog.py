@@ -0,0 +1,328 @@
+"""
+Scenario files: small hand-written systems and bulk catalogues.
+
+    store = load_catalog('solar.toml')
+    store = make_scenario('asteroids.csv')
+
+Hand-written systems are JSON or TOML documents with a list of bodies; each
+body has a name, mass, radius, position and velocity (zero if omitted) and
+may give them relative to an earlier body named as its parent:
+
+    dim = 2
+    [units]
+    length = "AU"
+    speed = "km/s"
+
+    [[bodies]]
+    name = "Sol"
+    mass = 1.9891e30
+
+    [[bodies]]
+    name = "E"
+    mass = 5.97e24
+    position = [0.983, 0]
+    velocity = [0, 30.29]
+
+Bulk catalogues are CSV files with a header naming the columns (x, y, vx,
+vy and mass; optionally z, vz, radius and name), or .npz files holding
+positions, velocities and masses arrays (optionally radii and names), e.g.
+as written by save_catalog or 'orbits run --output'.  They are in SI units.
+
+Parsing a text catalogue of a million rows takes seconds, so the parsed
+arrays are compiled to .npy files in a cache directory, keyed by a hash of
+the file's contents, and later loads memory-map them instead of parsing.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .scenarios import AU, M_SOL
+from .state import BodyStore
+
+FORMATS = ('.json', '.toml', '.csv', '.npz')
+# Bump when the compiled layout changes, so stale caches are not read
+CACHE_VERSION = 1
+ARRAYS = ('positions', 'velocities', 'masses', 'radii')
+UNITS = {'length': {'m': 1.0, 'km': 1e3, 'AU': AU},
+         'speed': {'m/s': 1.0, 'km/s': 1e3, 'AU/day': AU / 86400.0},
+         'mass': {'kg': 1.0, 'M_sol': M_SOL, 'M_earth': 5.972e24}}
+
+
+def cache_directory():
+    """
+    :return: Where compiled catalogues are kept: $ORBITS_CACHE, or
+        ~/.cache/orbits
+    :rtype: str
+    """
+    return os.environ.get('ORBITS_CACHE') or \
+        os.path.join(os.path.expanduser('~'), '.cache', 'orbits')
+
+
+def file_hash(path):
+    """
+    :return: Hex digest of the contents of path
+    :rtype: str
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_system(document):
+    """
+    State arrays of a hand-written system.
+    :param document: Parsed JSON or TOML, see the module description
+    :type document: dict
+    :return: positions, velocities, masses, radii and names
+    :rtype: dict
+    """
+    units = document.get('units', {})
+    scale = {}
+    for quantity, table in UNITS.items():
+        unit = units.get(quantity, next(iter(table)))
+        if unit not in table:
+            raise ValueError('unknown {0} unit: {1!r}'.format(quantity, unit))
+        scale[quantity] = table[unit]
+    bodies = document.get('bodies', [])
+    dim = int(document.get('dim', 2))
+    n = len(bodies)
+    arrays = {'positions': np.zeros((n, dim)),
+              'velocities': np.zeros((n, dim)), 'masses': np.zeros(n),
+              'radii': np.zeros(n), 'names': []}
+    rows = {}
+    for i, body in enumerate(bodies):
+        name = str(body.get('name', 'Body #' + str(i)))
+        for key, quantity in (('position', 'positions'),
+                              ('velocity', 'velocities')):
+            value = body.get(key, [0.0] * dim)
+            if len(value) != dim:
+                raise ValueError('{0} of {1!r} needs {2} components'.format(
+                    key, name, dim))
+            unit = scale['length' if key == 'position' else 'speed']
+            arrays[quantity][i] = np.asarray(value, dtype=float) * unit
+        parent = body.get('parent')
+        if parent is not None:
+            if parent not in rows:
+                raise ValueError('parent {0!r} of {1!r} must come before '
+                                 'it'.format(parent, name))
+            arrays['positions'][i] += arrays['positions'][rows[parent]]
+            arrays['velocities'][i] += arrays['velocities'][rows[parent]]
+        arrays['masses'][i] = float(body.get('mass', 0.0)) * scale['mass']
+        arrays['radii'][i] = float(body.get('radius', 0.0)) * \
+            scale['length']
+        arrays['names'].append(name)
+        rows[name] = i
+    return arrays
+
+
+def read_json(path):
+    """
+    :return: State arrays of the system in a JSON file
+    :rtype: dict
+    """
+    with open(path) as f:
+        return parse_system(json.load(f))
+
+
+def read_toml(path):
+    """
+    :return: State arrays of the system in a TOML file
+    :rtype: dict
+    """
+    try:
+        import tomllib
+    except ImportError:
+        # Python < 3.11
+        import tomli as tomllib
+    with open(path, 'rb') as f:
+        return parse_system(tomllib.load(f))
+
+
+def read_csv(path):
+    """
+    :return: State arrays of the catalogue in a CSV file
+    :rtype: dict
+    """
+    with open(path, newline='') as f:
+        header = [c.strip() for c in next(csv.reader(f))]
+    dim = 3 if 'z' in header else 2
+    columns = ['x', 'y', 'z'][:dim] + ['vx', 'vy', 'vz'][:dim] + ['mass']
+    if 'radius' in header:
+        columns.append('radius')
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise ValueError('{0} lacks columns {1}'.format(path, missing))
+    # Names may contain '#', loadtxt's default comment character
+    data = np.loadtxt(path, delimiter=',', skiprows=1, quotechar='"',
+                      comments=None, ndmin=2,
+                      usecols=[header.index(c) for c in columns])
+    arrays = {'positions': data[:, :dim], 'velocities': data[:, dim:2 * dim],
+              'masses': data[:, 2 * dim]}
+    if 'radius' in header:
+        arrays['radii'] = data[:, 2 * dim + 1]
+    if 'name' in header:
+        arrays['names'] = np.loadtxt(path, delimiter=',', skiprows=1,
+                                     quotechar='"', comments=None, dtype=str,
+                                     ndmin=1,
+                                     usecols=[header.index('name')]).tolist()
+    return arrays
+
+
+def read_npz(path):
+    """
+    :return: State arrays of the catalogue in an .npz file
+    :rtype: dict
+    """
+    with np.load(path) as data:
+        arrays = {k: data[k] for k in ARRAYS if k in data}
+        if 'names' in data:
+            arrays['names'] = data['names'].tolist()
+    return arrays
+
+
+READERS = {'.json': read_json, '.toml': read_toml, '.csv': read_csv}
+
+
+def save_compiled(arrays, directory):
+    """
+    Write parsed arrays as .npy files (names as one per line in
+    names.txt) into directory, atomically.
+    :param arrays: positions, velocities, masses, and optionally radii and
+        names
+    :type arrays: dict
+    :param directory: Directory to create
+    :type directory: str
+    :return: None
+    :rtype: None
+    """
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    partial = tempfile.mkdtemp(dir=parent, prefix='.partial-')
+    try:
+        for key in ARRAYS:
+            if key in arrays:
+                np.save(os.path.join(partial, key + '.npy'),
+                        np.ascontiguousarray(arrays[key], dtype=float))
+        if 'names' in arrays:
+            with open(os.path.join(partial, 'names.txt'), 'w',
+                      encoding='utf-8') as f:
+                f.write('\n'.join(arrays['names']))
+        os.replace(partial, directory)
+    except OSError:
+        # Another process compiled the same file first
+        shutil.rmtree(partial, ignore_errors=True)
+        if not os.path.isdir(directory):
+            raise
+
+
+def load_compiled(directory):
+    """
+    Memory-map the arrays written by save_compiled.
+    :param directory: Compiled catalogue
+    :type directory: str
+    :return: Read-only positions, velocities, masses, and radii and names
+        if present
+    :rtype: dict
+    """
+    arrays = {}
+    for key in ARRAYS:
+        path = os.path.join(directory, key + '.npy')
+        if os.path.exists(path):
+            arrays[key] = np.load(path, mmap_mode='r')
+    path = os.path.join(directory, 'names.txt')
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        arrays['names'] = text.split('\n') if len(arrays['masses']) else []
+    return arrays
+
+
+def compiled_path(path, cache_dir=None):
+    """
+    :return: Directory the compiled form of the catalogue path is kept in
+    :rtype: str
+    """
+    key = 'v{0}-{1}'.format(CACHE_VERSION, file_hash(path))
+    return os.path.join(cache_dir or cache_directory(), key)
+
+
+def load_catalog(path, cache=True, cache_dir=None):
+    """
+    Build a store from a scenario file.
+    :param path: .json, .toml, .csv or .npz file
+    :type path: str
+    :param cache: Use (and fill) the compiled cache for text formats
+    :type cache: bool
+    :param cache_dir: Cache directory (default cache_directory())
+    :type cache_dir: str
+    :return: The bodies
+    :rtype: BodyStore
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError('unknown scenario file format: ' + repr(path))
+    if extension == '.npz':
+        arrays = read_npz(path)
+    elif not cache:
+        arrays = READERS[extension](path)
+    else:
+        compiled = compiled_path(path, cache_dir)
+        if os.path.isdir(compiled):
+            arrays = load_compiled(compiled)
+        else:
+            arrays = READERS[extension](path)
+            save_compiled(arrays, compiled)
+    return BodyStore.from_arrays(arrays['positions'], arrays['velocities'],
+                                 arrays['masses'], arrays.get('radii'),
+                                 arrays.get('names'))
+
+
+def save_catalog(store, path):
+    """
+    Write a store as a scenario file: .npz, .csv or .json by extension.
+    :param store: The bodies
+    :type store: BodyStore
+    :param path: Output file
+    :type path: str
+    :return: None
+    :rtype: None
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npz':
+        np.savez(path, positions=store.positions,
+                 velocities=store.velocities, masses=store.masses,
+                 radii=store.radii, names=np.array(store.names, str))
+    elif extension == '.csv':
+        axes = 'xyz'[:store.dim]
+        header = ['name'] + list(axes) + ['v' + a for a in axes] + \
+            ['mass', 'radius']
+        numbers = io.StringIO()
+        np.savetxt(numbers, np.column_stack([store.positions,
+                                             store.velocities, store.masses,
+                                             store.radii]),
+                   fmt='%.17g', delimiter=',')
+        names = ['"' + name.replace('"', '""') + '"' for name in store.names]
+        with open(path, 'w', newline='') as f:
+            f.write(','.join(header) + '\n')
+            if names:
+                f.write('\n'.join(n + ',' + row for n, row in
+                                  zip(names, numbers.getvalue().splitlines()))
+                        + '\n')
+    elif extension == '.json':
+        bodies = [{'name': name, 'mass': float(store.masses[i]),
+                   'radius': float(store.radii[i]),
+                   'position': store.positions[i].tolist(),
+                   'velocity': store.velocities[i].tolist()}
+                  for i, name in enumerate(store.names)]
+        with open(path, 'w') as f:
+            json.dump({'dim': store.dim, 'bodies': bodies}, f, indent=1)
+    else:
+        raise ValueError('cannot write scenario files as ' + repr(path))
@@ -0,0 +1,215 @@
+"""
+Checkpoints of complete simulation state, restart, and seeking in time.
+
+A checkpoint is an uncompressed .npz file holding the body arrays (including
+the accelerations integrators carry from one step to the next), the
+integrator's own state (e.g. block-timestep levels) and a JSON description
+of the clock, force backend and integrator.  Restarting from a checkpoint
+continues bit-for-bit as if the run had never stopped.
+"""
+import glob
+import json
+import os
+
+import numpy as np
+
+from .forces import make_backend
+from .integrators import make_integrator
+from .simulation import Simulation
+from .state import BodyStore
+
+VERSION = 1
+PATTERN = 'checkpoint-%012d.npz'
+
+
+def save_checkpoint(sim, path):
+    """
+    Write the state of sim to path, atomically.
+    :param sim: The simulation
+    :type sim: Simulation
+    :param path: Output .npz file
+    :type path: str
+    :return: None
+    :rtype: None
+    """
+    store = sim.store
+    arrays = {'positions': store.positions, 'velocities': store.velocities,
+              'accelerations': store.accelerations, 'masses': store.masses,
+              'radii': store.radii, 'names': np.array(store.names, str)}
+    flags = {}
+    for key, value in sim.integrator.get_state().items():
+        if isinstance(value, np.ndarray):
+            arrays['integrator.' + key] = value
+        else:
+            flags[key] = value
+    meta = {'version': VERSION, 'dt': sim.dt, 'sim_steps': sim.sim_steps,
+            'time_elapsed': sim.time_elapsed,
+            'forces': {'name': sim.forces.name,
+                       'options': sim.forces.options()},
+            'integrator': {'name': sim.integrator.name,
+                           'options': sim.integrator.options(),
+                           'state': flags}}
+    arrays['meta'] = np.array(json.dumps(meta))
+    partial = path + '.partial'
+    with open(partial, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(partial, path)
+
+
+def read_meta(path):
+    """
+    :param path: Checkpoint file
+    :type path: str
+    :return: The checkpoint's description (clock, backend, integrator)
+    :rtype: dict
+    """
+    with np.load(path) as data:
+        return json.loads(str(data['meta']))
+
+
+def restore_checkpoint(sim, path):
+    """
+    Load a checkpoint into an existing simulation, in place.
+
+    The store is overwritten row by row, so objects holding rows of it
+    (the Body classes of the scripts) stay valid; the checkpoint must have
+    as many bodies as the store.
+
+    :param sim: The simulation to overwrite
+    :type sim: Simulation
+    :param path: Checkpoint file
+    :type path: str
+    :return: None
+    :rtype: None
+    """
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        if len(data['masses']) != len(sim.store):
+            raise ValueError('checkpoint has %d bodies, simulation has %d' %
+                             (len(data['masses']), len(sim.store)))
+        store = sim.store
+        store.positions = data['positions']
+        store.velocities = data['velocities']
+        store.accelerations = data['accelerations']
+        store.masses = data['masses']
+        store.radii = data['radii']
+        store.names[:] = [str(name) for name in data['names']]
+        state = dict(meta['integrator']['state'])
+        for key in data.files:
+            if key.startswith('integrator.'):
+                state[key[len('integrator.'):]] = data[key]
+    sim.forces = make_backend(meta['forces']['name'],
+                              **meta['forces']['options'])
+    sim.integrator = make_integrator(meta['integrator']['name'],
+                                     **meta['integrator']['options'])
+    sim.integrator.set_state(state)
+    sim.dt = meta['dt']
+    sim.sim_steps = meta['sim_steps']
+    sim.time_elapsed = meta['time_elapsed']
+
+
+def load_checkpoint(path):
+    """
+    Build a new simulation from a checkpoint.
+    :param path: Checkpoint file
+    :type path: str
+    :return: The restored simulation
+    :rtype: Simulation
+    """
+    with np.load(path) as data:
+        store = BodyStore.from_arrays(data['positions'], data['velocities'],
+                                      data['masses'])
+    sim = Simulation(store)
+    restore_checkpoint(sim, path)
+    return sim
+
+
+def list_checkpoints(directory):
+    """
+    :param directory: Checkpoint directory
+    :type directory: str
+    :return: Checkpoint files in directory, oldest (fewest steps) first
+    :rtype: list[str]
+    """
+    return sorted(glob.glob(os.path.join(directory, 'checkpoint-*.npz')))
+
+
+def latest_checkpoint(directory):
+    """
+    :param directory: Checkpoint directory
+    :type directory: str
+    :return: The most advanced checkpoint in directory, or None
+    :rtype: str
+    """
+    paths = list_checkpoints(directory)
+    return paths[-1] if paths else None
+
+
+def seek(directory, t):
+    """
+    The state of a checkpointed run at simulation time t.
+
+    Restores the last checkpoint at or before t and integrates forward only
+    the remainder, with the run's own timestep.
+
+    :param directory: Checkpoint directory
+    :type directory: str
+    :param t: Simulation time (s)
+    :type t: float
+    :return: A simulation at (the step nearest to) time t
+    :rtype: Simulation
+    """
+    best = None
+    for path in list_checkpoints(directory):
+        if read_meta(path)['time_elapsed'] <= t:
+            best = path
+        else:
+            break
+    if best is None:
+        raise ValueError('no checkpoint at or before t = %r' % t)
+    sim = load_checkpoint(best)
+    sim.run(int(round((t - sim.time_elapsed) / sim.dt)))
+    return sim
+
+
+class Checkpointer:
+    """
+    Simulation callback writing a checkpoint every `every` steps.
+    """
+
+    def __init__(self, directory, every=1000, keep=None):
+        """
+        :param directory: Where to write checkpoints (created by the first
+            save if missing)
+        :type directory: str
+        :param every: Steps between checkpoints
+        :type every: int
+        :param keep: Keep only this many most recent checkpoints (all if None)
+        :type keep: int
+        :return: None
+        :rtype: None
+        """
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+
+    def save(self, sim):
+        """
+        Write a checkpoint of sim now and prune old ones.
+        :param sim: The simulation
+        :type sim: Simulation
+        :return: Path of the new checkpoint
+        :rtype: str
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = os.path.join(self.directory, PATTERN % sim.sim_steps)
+        save_checkpoint(sim, path)
+        if self.keep:
+            for old in list_checkpoints(self.directory)[:-self.keep]:
+                os.remove(old)
+        return path
+
+    def __call__(self, sim):
+        if sim.sim_steps % self.every == 0:
+            self.save(sim)
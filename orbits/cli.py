@@ -0,0 +1,374 @@
+"""
+Command line entry point for headless runs:
+
+    python -m orbits run --scenario solar --steps 8760 --dt 3600 --output out.npz
+
+No display library is imported; the simulation runs as fast as the CPU
+allows and the final state is written to --output.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from . import bench, ensemble
+from .checkpoint import Checkpointer, latest_checkpoint, load_checkpoint, \
+    seek
+from .collisions import RESPONSES, Collisions
+from .diagnostics import ACTIONS, Monitor, ToleranceExceeded
+from .forces import make_backend
+from .integrators import INTEGRATORS, make_integrator
+from .profiler import PhaseTimer, TimedForces
+from .recorder import TrajectoryRecorder
+from .scenarios import SCENARIOS, is_scenario_file, make_scenario
+from .simulation import Simulation
+
+
+def scenario_name(text):
+    """
+    argparse type of --scenario: a generator name or an existing file.
+    """
+    if text in SCENARIOS or (is_scenario_file(text) and
+                             os.path.isfile(text)):
+        return text
+    raise argparse.ArgumentTypeError(
+        'not a scenario name or scenario file: ' + repr(text))
+
+
+def build_parser():
+    """
+    :return: The argument parser of the orbits command
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+        prog='orbits', description='Experiments with principles of orbital '
+                                   'mechanics.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    run = commands.add_parser('run', help='run a simulation headless')
+    run.add_argument('--scenario', default='solar', type=scenario_name,
+                     help='one of {0}, or a .json, .toml, .csv or .npz '
+                          'scenario file'.format(', '.join(sorted(SCENARIOS))))
+    run.add_argument('--count', type=int, default=1000,
+                     help='number of particles (disk, cluster, particles, '
+                          'belt)')
+    run.add_argument('--seed', type=int, default=None,
+                     help='random seed (disk, cluster, particles, belt)')
+    run.add_argument('--steps', type=int, default=1000)
+    run.add_argument('--dt', type=float, default=3600.0, help='timestep (s)')
+    run.add_argument('--integrator', default='leapfrog',
+                     choices=sorted(INTEGRATORS))
+    run.add_argument('--forces', default='direct',
+                     choices=['direct', 'barnes-hut', 'numba', 'parallel'])
+    run.add_argument('--theta', type=float, default=0.5,
+                     help='Barnes-Hut opening angle')
+    run.add_argument('--threads', type=int, default=None,
+                     help='threads of the parallel backend (default: all '
+                          'cores)')
+    run.add_argument('--softening', type=float, default=0.0,
+                     help='Plummer softening length (m)')
+    run.add_argument('--output', default=None,
+                     help='write the final state to this .npz file')
+    run.add_argument('--record', default=None,
+                     help='stream the trajectory to this .npy file')
+    run.add_argument('--every', type=int, default=1,
+                     help='record one frame every this many steps')
+    run.add_argument('--checkpoint-dir', default=None,
+                     help='write checkpoints to this directory')
+    run.add_argument('--checkpoint-every', type=int, default=10000,
+                     help='steps between checkpoints')
+    run.add_argument('--restart', action='store_true',
+                     help='continue from the latest checkpoint in '
+                          '--checkpoint-dir; --steps counts from t = 0')
+    run.add_argument('--collisions', default=None, choices=RESPONSES,
+                     help='detect collisions between bodies of finite radius '
+                          'and merge, bounce or delete them')
+    run.add_argument('--monitor', type=int, default=None, metavar='K',
+                     help='report the drift of energy, momentum, angular '
+                          'momentum and barycentre every K steps')
+    run.add_argument('--tolerance', type=float, default=None,
+                     help='largest acceptable relative energy drift')
+    run.add_argument('--on-drift', default='stop', choices=ACTIONS,
+                     help='what to do when --tolerance is exceeded: stop, '
+                          'halve dt, or only report')
+    run.add_argument('--profile', default=None,
+                     help='write per-phase timings (p50/p99 of forces, '
+                          'step and callbacks) to this .json or .csv file')
+    run.add_argument('--profile-window', type=int, default=600,
+                     help='steps the --profile percentiles are taken over, '
+                          'the most recent (default 600)')
+    find = commands.add_parser('seek', help='state of a checkpointed run at '
+                                            'a given time')
+    find.add_argument('--checkpoint-dir', required=True)
+    find.add_argument('--time', type=float, required=True,
+                      help='simulation time (s)')
+    find.add_argument('--output', required=True,
+                      help='write the state to this .npz file')
+    sweep = commands.add_parser('sweep', help='run an ensemble of varied '
+                                              'initial conditions in parallel')
+    sweep.add_argument('--scenario', default='binary', type=scenario_name,
+                       help='scenario name or file, as for run')
+    sweep.add_argument('--count', type=int, default=1000,
+                       help='number of particles (disk, cluster, '
+                            'particles, belt)')
+    sweep.add_argument('--seed', type=int, default=None,
+                       help='random seed (disk, cluster, particles, belt)')
+    sweep.add_argument('--steps', type=int, default=1000)
+    sweep.add_argument('--dt', type=float, default=3600.0,
+                       help='timestep (s)')
+    sweep.add_argument('--integrator', default='leapfrog',
+                       choices=sorted(INTEGRATORS))
+    sweep.add_argument('--forces', default='direct',
+                       choices=['direct', 'barnes-hut', 'numba', 'parallel'])
+    sweep.add_argument('--grid', action='append', default=[],
+                       metavar='NAME=V1,V2,...',
+                       help='vary a parameter over the given values; '
+                            'repeat for a multi-dimensional grid')
+    sweep.add_argument('--sample', action='append', default=[],
+                       metavar='NAME=LOW:HIGH',
+                       help='draw a parameter uniformly from [LOW, HIGH)')
+    sweep.add_argument('--members', type=int, default=100,
+                       help='number of random samples')
+    sweep.add_argument('--sample-seed', type=int, default=None)
+    sweep.add_argument('--workers', type=int, default=None,
+                       help='processes (default: all cores)')
+    sweep.add_argument('--batch', action='store_true',
+                       help="integrate each worker's members together "
+                            '(direct forces, leapfrog or yoshida4)')
+    sweep.add_argument('--every', type=int, default=None,
+                       help='keep trajectories sampled every this many steps')
+    sweep.add_argument('--output', required=True,
+                       help='write the ensemble table to this .npz file')
+    perf = commands.add_parser('bench', help='benchmark force backends and '
+                                             'integrators')
+    perf.add_argument('--scenario', action='append', default=None,
+                      choices=sorted(bench.SCENARIOS) + ['all'],
+                      help='scenario to run, repeatable (default: the quick '
+                           'set, all: every scenario up to N = 1e5)')
+    perf.add_argument('--forces', action='append', default=None,
+                      choices=list(bench.BACKENDS))
+    perf.add_argument('--integrator', action='append', default=None,
+                      choices=list(bench.INTEGRATORS))
+    perf.add_argument('--output', default=None,
+                      help='write the results to this JSON file')
+    perf.add_argument('--baseline', default=None,
+                      help='compare with the results in this JSON file and '
+                           'fail on regressions')
+    perf.add_argument('--slower', type=float, default=0.2,
+                      help='tolerated fractional loss of steps/s')
+    return parser
+
+
+def parse_value(text):
+    """
+    :param text: A number from the command line
+    :type text: str
+    :return: int if it is written as one, else float
+    :rtype: int | float
+    """
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def sweep_members(args):
+    """
+    Members of the sweep command: the grid, crossed with the random samples
+    when both are given.
+    """
+    axes = {}
+    for spec in args.grid:
+        name, values = spec.split('=', 1)
+        axes[name] = [parse_value(v) for v in values.split(',')]
+    members = ensemble.grid(**axes)
+    if args.sample:
+        ranges = {}
+        for spec in args.sample:
+            name, bounds = spec.split('=', 1)
+            low, high = bounds.split(':')
+            ranges[name] = (float(low), float(high))
+        samples = ensemble.sample(args.members, args.sample_seed, **ranges)
+        members = [dict(m, **s) for m in members for s in samples]
+    return members
+
+
+def scenario_options(args):
+    """
+    Generator keyword arguments implied by the command line.
+    """
+    if args.scenario in ('disk', 'cluster', 'particles', 'belt'):
+        return {'count': args.count, 'seed': args.seed}
+    return {}
+
+
+def build_simulation(args):
+    """
+    :param args: Parsed arguments of the run command
+    :return: A simulation ready to run
+    :rtype: Simulation
+    """
+    store = make_scenario(args.scenario, **scenario_options(args))
+    options = {'softening': args.softening}
+    if args.forces == 'barnes-hut':
+        options['theta'] = args.theta
+    elif args.forces == 'parallel':
+        options['workers'] = args.threads
+    forces = make_backend(args.forces, **options)
+    return Simulation(store, forces, make_integrator(args.integrator),
+                      args.dt)
+
+
+def save_state(sim, path):
+    """
+    Write the state of sim to an .npz file.
+    :param sim: The simulation
+    :type sim: Simulation
+    :param path: File name
+    :type path: str
+    :return: None
+    :rtype: None
+    """
+    store = sim.store
+    np.savez(path, positions=store.positions, velocities=store.velocities,
+             masses=store.masses, radii=store.radii,
+             names=np.array(store.names), time_elapsed=sim.time_elapsed,
+             sim_steps=sim.sim_steps, dt=sim.dt)
+
+
+def report_drift(sim, drifts):
+    print('step {0} (dt {1:g} s): dE/E {energy:.3e}, dP {momentum:.3e}, '
+          'dL {angular_momentum:.3e}, barycentre {barycentre:.3e} '
+          'm'.format(sim.sim_steps, sim.dt, **drifts))
+
+
+def run(args):
+    sim = None
+    if args.restart and args.checkpoint_dir:
+        path = latest_checkpoint(args.checkpoint_dir)
+        if path is not None:
+            sim = load_checkpoint(path)
+    if sim is None:
+        sim = build_simulation(args)
+    callbacks = []
+    collisions = None
+    if args.collisions:
+        # A recording needs the number of rows to stay fixed
+        collisions = Collisions(args.collisions, compact=not args.record)
+        callbacks.append(collisions)
+    recorder = None
+    if args.record:
+        recorder = TrajectoryRecorder(args.record, sim.store, sim.dt,
+                                      args.every, t0=sim.time_elapsed)
+        recorder.record(sim.store)
+        callbacks.append(recorder)
+    if args.checkpoint_dir:
+        callbacks.append(Checkpointer(args.checkpoint_dir,
+                                      args.checkpoint_every))
+    if args.monitor or args.tolerance is not None:
+        callbacks.append(Monitor(args.monitor or 100, args.tolerance,
+                                 args.on_drift, report=report_drift))
+
+    profile = PhaseTimer(window=args.profile_window, enabled=True) \
+        if args.profile else None
+
+    def callback(sim):
+        if profile is None:
+            for c in callbacks:
+                c(sim)
+            return
+        with profile.phase('callbacks'):
+            for c in callbacks:
+                c(sim)
+        profile.frame(1)
+
+    if profile is not None:
+        sim.forces = TimedForces(sim.forces, profile)
+        profile.frame()
+    first = sim.sim_steps
+    steps = args.steps - first if args.restart else args.steps
+    start = time.time()
+    try:
+        sim.run(max(steps, 0), callback)
+    except ToleranceExceeded as e:
+        print('stopped: ' + str(e))
+        steps = sim.sim_steps - first
+    finally:
+        if recorder is not None:
+            recorder.close()
+        sim.close()
+    elapsed = time.time() - start
+    print('{0}: {1} bodies, {2} steps of {3} s in {4:.3f} s '
+          '({5:.1f} steps/s, {6:.2f} simulated days)'.format(
+              args.scenario, len(sim.store), steps, sim.dt, elapsed,
+              steps / elapsed if elapsed else float('inf'),
+              sim.time_elapsed / 86400))
+    if collisions is not None:
+        print('{0} collisions'.format(len(collisions.events)))
+    if profile is not None:
+        sim.forces = sim.forces.forces
+        profile.save(args.profile)
+        print('\n'.join(profile.lines()))
+    if args.output:
+        save_state(sim, args.output)
+    return sim
+
+
+def run_bench(args):
+    """
+    :return: Exit status, 1 if the results regressed against the baseline
+    :rtype: int
+    """
+    scenarios = args.scenario
+    if scenarios and 'all' in scenarios:
+        scenarios = list(bench.SCENARIOS)
+
+    def report(r):
+        print('{scenario:<17} {forces:<10} {integrator:<13} '
+              '{steps_per_s:10.1f} steps/s {0:>9} ns/pair {1:7.1f} MB '
+              'dE {2:<9} dL {angular_momentum_drift:.1e}'.format(
+                  '-' if r['ns_per_pair'] is None else
+                  '%.1f' % r['ns_per_pair'], r['peak_memory'] / 2 ** 20,
+                  '-' if r['energy_drift'] is None else
+                  '%.1e' % r['energy_drift'], **r))
+
+    results = bench.run_suite(scenarios, args.forces or bench.BACKENDS,
+                              args.integrator or bench.INTEGRATORS, report)
+    for forces, reason in sorted(results['skipped'].items()):
+        print('skipped {0}: {1}'.format(forces, reason))
+    if args.output:
+        bench.save(results, args.output)
+    if args.baseline:
+        regressions = bench.compare(results, bench.load(args.baseline),
+                                    args.slower)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        return 1 if regressions else 0
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'seek':
+        save_state(seek(args.checkpoint_dir, args.time), args.output)
+    elif args.command == 'sweep':
+        members = sweep_members(args)
+        start = time.time()
+        table = ensemble.run_ensemble(
+            args.scenario, members, args.steps, args.dt, args.integrator,
+            args.forces, scenario_options(args), args.every, args.workers,
+            args.batch)
+        ensemble.save_ensemble(table, args.output)
+        print('{0}: {1} members of {2} steps in {3:.3f} s'.format(
+            args.scenario, len(members), args.steps, time.time() - start))
+    elif args.command == 'bench':
+        return run_bench(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+Collision detection between bodies of finite radius, and the responses to
+a collision.
+
+    sim.run(steps, Collisions('merge'))
+
+Every step each body sweeps a capsule from its position before the step to
+its position after it.  The broad phase sorts the bounding boxes of these
+capsules along the axis the bodies are most spread out on and pairs up the
+boxes that overlap (sweep and prune), which costs O(N log N) plus the
+number of candidate pairs rather than O(N^2).  The narrow phase treats the
+relative motion of a candidate pair as linear over the step and finds
+whether, and when, the two spheres first touch, so fast bodies that pass
+through each other between two steps are caught as well.
+
+Bodies of zero radius never collide.
+"""
+import numpy as np
+
+RESPONSES = ('merge', 'bounce', 'delete')
+
+
+def sweep_and_prune(lo, hi):
+    """
+    Pairs of axis-aligned boxes that overlap.
+    :param lo: (N, D) lower corners
+    :type lo: np.ndarray
+    :param hi: (N, D) upper corners
+    :type hi: np.ndarray
+    :return: Indices i, j (i != j) of the overlapping pairs, each pair once
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    n = len(lo)
+    if n < 2:
+        return np.zeros(0, int), np.zeros(0, int)
+    axis = np.argmax(np.var(lo + hi, axis=0))
+    order = np.argsort(lo[:, axis], kind='stable')
+    start, stop = lo[order, axis], hi[order, axis]
+    # Boxes after k in sorted order whose interval starts before k's ends
+    end = np.searchsorted(start, stop, side='right')
+    counts = end - np.arange(n) - 1
+    first = np.repeat(np.arange(n), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    i, j = order[first], order[first + 1 + offsets]
+    overlap = np.all((lo[i] <= hi[j]) & (lo[j] <= hi[i]), axis=1)
+    return i[overlap], j[overlap]
+
+
+def contacts(before, after, radii, i, j):
+    """
+    Narrow phase: which of the pairs (i, j) touch during the step, and when.
+
+    Each body is assumed to move in a straight line from before to after.
+
+    :param before: (N, D) positions at the start of the step
+    :type before: np.ndarray
+    :param after: (N, D) positions at the end of the step
+    :type after: np.ndarray
+    :param radii: (N,) radii
+    :type radii: np.ndarray
+    :param i: First body of each candidate pair
+    :type i: np.ndarray
+    :param j: Second body of each candidate pair
+    :type j: np.ndarray
+    :return: Mask of the pairs that touch, and the fraction of the step at
+        which they first do (0 if they already overlapped)
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    d0 = before[j] - before[i]
+    dd = (after[j] - before[j]) - (after[i] - before[i])
+    reach = radii[i] + radii[j]
+    a = np.einsum('ij,ij->i', dd, dd)
+    b = np.einsum('ij,ij->i', d0, dd)
+    c = np.einsum('ij,ij->i', d0, d0) - reach ** 2
+    # Closest approach within the step
+    t = np.zeros_like(a)
+    np.divide(-b, a, out=t, where=a > 0)
+    t = np.clip(t, 0.0, 1.0)
+    hit = (radii[i] > 0) & (radii[j] > 0) & (c + t * (2 * b + t * a) <= 0)
+    # First root of |d0 + t dd|^2 = reach^2
+    first = np.zeros_like(a)
+    moving = hit & (c > 0)
+    root = np.sqrt(np.maximum(b[moving] ** 2 - a[moving] * c[moving], 0.0))
+    first[moving] = (-b[moving] - root) / a[moving]
+    return hit, np.clip(first, 0.0, 1.0)
+
+
+def find_collisions(before, after, radii):
+    """
+    Every pair of bodies that touches during a step.
+    :param before: (N, D) positions at the start of the step
+    :type before: np.ndarray
+    :param after: (N, D) positions at the end of the step
+    :type after: np.ndarray
+    :param radii: (N,) radii
+    :type radii: np.ndarray
+    :return: Bodies i, j of each colliding pair and the fraction of the
+        step at which they touch, in order of that time
+    :rtype: tuple[np.ndarray, np.ndarray, np.ndarray]
+    """
+    before = np.asarray(before, dtype=float)
+    after = np.asarray(after, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+    solid = np.flatnonzero(radii > 0)
+    x0, x1, r = before[solid], after[solid], radii[solid][:, None]
+    i, j = sweep_and_prune(np.minimum(x0, x1) - r, np.maximum(x0, x1) + r)
+    i, j = solid[i], solid[j]
+    hit, t = contacts(before, after, radii, i, j)
+    i, j, t = i[hit], j[hit], t[hit]
+    order = np.lexsort((j, i, t))
+    return i[order], j[order], t[order]
+
+
+class Collisions:
+    """
+    Simulation callback resolving the collisions of each step.
+
+    Responses:
+
+    - 'merge': the lighter body is absorbed by the heavier one, conserving
+      mass, momentum and the centre of mass; the radius grows to keep the
+      combined volume
+    - 'bounce': the pair exchanges momentum along the line of centres at
+      contact, with coefficient of restitution restitution
+    - 'delete': the lighter body is removed and the heavier one is left
+      untouched
+
+    Removed bodies are deleted from the store, so it shrinks.  Consumers
+    that need a fixed number of rows, such as a TrajectoryRecorder, need
+    compact=False, which instead leaves them behind as massless bodies of
+    zero radius that no longer collide.
+    """
+
+    def __init__(self, response='merge', restitution=1.0, compact=True):
+        """
+        :param response: 'merge', 'bounce' or 'delete'
+        :type response: str
+        :param restitution: Ratio of separating to approaching speed of a
+            bounce
+        :type restitution: float
+        :param compact: Delete removed bodies from the store
+        :type compact: bool
+        :return: None
+        :rtype: None
+        """
+        if response not in RESPONSES:
+            raise ValueError('unknown collision response: ' + repr(response))
+        self.response = response
+        self.restitution = restitution
+        self.compact = compact
+        self.previous = None
+        self.events = []  # (sim_steps, time, survivor name, other name)
+
+    def __call__(self, sim):
+        """
+        :param sim: The simulation, after a step
+        :type sim: Simulation
+        :return: Number of collisions resolved
+        :rtype: int
+        """
+        store = sim.store
+        before = self.previous
+        if before is None or len(before) != len(store):
+            before = store.positions
+        i, j, t = find_collisions(before, store.positions, store.radii)
+        resolved = self.resolve(sim, before, i, j, t) if len(i) else 0
+        self.previous = store.positions.copy()
+        return resolved
+
+    def resolve(self, sim, before, i, j, t):
+        """
+        Apply the response to the colliding pairs, earliest first.  A body
+        removed by one collision takes part in no later one of the step.
+        :return: Number of collisions resolved
+        :rtype: int
+        """
+        store = sim.store
+        x, v, m, r = store.positions, store.velocities, store.masses, \
+            store.radii
+        removed = {}  # row -> row that absorbed it
+        resolved = 0
+        for a, b, when in zip(i, j, t):
+            if a in removed or b in removed:
+                continue
+            if m[b] > m[a]:
+                a, b = b, a
+            if self.response == 'bounce':
+                normal = (1 - when) * (before[b] - before[a]) + \
+                    when * (x[b] - x[a])
+                if not self.bounce(normal, v, m, a, b):
+                    continue
+            else:
+                if self.response == 'merge':
+                    self.merge(x, v, m, r, a, b)
+                removed[b] = a
+                m[b] = r[b] = 0.0
+            resolved += 1
+            self.events.append((sim.sim_steps, sim.time_elapsed,
+                                store.names[a], store.names[b]))
+        if removed:
+            if self.compact:
+                kept = store.remove(list(removed))
+                self.remap_parents(sim.integrator, kept, removed)
+            sim.integrator.reset()
+        elif resolved:
+            sim.integrator.reset()
+        return resolved
+
+    @staticmethod
+    def merge(x, v, m, r, a, b):
+        """
+        Absorb body b into body a in place.
+        """
+        total = m[a] + m[b]
+        if total > 0:
+            x[a] = (m[a] * x[a] + m[b] * x[b]) / total
+            v[a] = (m[a] * v[a] + m[b] * v[b]) / total
+        else:
+            x[a] = (x[a] + x[b]) / 2
+            v[a] = (v[a] + v[b]) / 2
+        m[a] = total
+        r[a] = np.cbrt(r[a] ** 3 + r[b] ** 3)
+
+    def bounce(self, normal, v, m, a, b):
+        """
+        Exchange momentum between a and b along normal (from a towards b)
+        in place.
+        :return: Whether they were approaching, and so bounced
+        :rtype: bool
+        """
+        length = np.linalg.norm(normal)
+        if not length:
+            return False
+        n = normal / length
+        approach = np.dot(v[b] - v[a], n)
+        if approach >= 0:
+            return False
+        total = m[a] + m[b]
+        # Shares of the velocity change; equal for two massless bodies
+        share_a = m[b] / total if total else 0.5
+        share_b = m[a] / total if total else 0.5
+        impulse = (1 + self.restitution) * approach * n
+        v[a] += share_a * impulse
+        v[b] -= share_b * impulse
+        return True
+
+    @staticmethod
+    def remap_parents(integrator, kept, removed):
+        """
+        Renumber the explicit parents of a Hierarchical integrator after
+        rows were deleted; moons of an absorbed body follow its absorber.
+        """
+        parents = getattr(integrator, 'parents', None)
+        if parents is None:
+            return
+        index = np.full(len(parents), -1)
+        index[kept] = np.arange(len(kept))
+        new = []
+        for row in kept:
+            p = parents[row]
+            while p in removed:
+                p = removed[p]
+            new.append(int(index[p]) if p >= 0 and p != row else -1)
+        integrator.parents = new
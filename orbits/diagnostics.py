@@ -0,0 +1,247 @@
+"""
+Conserved quantities of a BodyStore and a monitor of their drift.
+
+    monitor = Monitor(every=100, tolerance=1e-6, action='shrink')
+    sim.run(steps, monitor)
+
+Energy, linear and angular momentum are conserved by the equations of
+motion, and the barycentre moves uniformly; how far an integration strays
+from that measures its error.  The monitor samples them every few steps.
+With a direct-sum backend the potential energy comes from the potentials
+the backend kept during its last force pass, so a check costs O(N) rather
+than another O(N^2) sweep whenever the integrator's last evaluation was
+at the current positions (leapfrog, verlet, yoshida4).  Otherwise the
+potential is summed afresh.
+"""
+import numpy as np
+
+from .forces import G, potential_energy
+
+ACTIONS = ('report', 'stop', 'shrink')
+
+
+class ToleranceExceeded(RuntimeError):
+    """
+    Raised by a Monitor with action 'stop' when the energy drift exceeds
+    its tolerance.
+    """
+
+    def __init__(self, message, drift):
+        RuntimeError.__init__(self, message)
+        self.drift = drift
+
+
+def kinetic_energy(store):
+    """
+    :return: Total kinetic energy of store (J)
+    :rtype: float
+    """
+    v = store.velocities
+    return 0.5 * store.masses.dot(np.einsum('ij,ij->i', v, v))
+
+
+def energy(store, forces=None, G=G, softening=0.0):
+    """
+    Total (kinetic plus potential) energy.
+    :param store: The bodies
+    :type store: BodyStore
+    :param forces: Force backend; its G and softening are used, and the
+        potentials of its last pass if they belong to the current state
+    :param G: Gravitational constant, if forces is None
+    :type G: float
+    :param softening: Plummer softening length, if forces is None
+    :type softening: float
+    :return: Energy (J)
+    :rtype: float
+    """
+    potential = None
+    if forces is not None:
+        G, softening = forces.G, forces.softening
+        cached = getattr(forces, 'last_potential_energy', None)
+        if cached is not None:
+            potential = cached(store.positions, store.masses)
+        # Backends with compiled kernels (see jit) have a faster pair pass
+        compiled = getattr(forces, 'potential_energy', None)
+        if potential is None and compiled is not None:
+            potential = compiled(store.positions, store.masses)
+    if potential is None:
+        potential = potential_energy(store.positions, store.masses, G,
+                                     softening)
+    return kinetic_energy(store) + potential
+
+
+def momentum(store):
+    """
+    :return: (D,) total linear momentum (kg m/s)
+    :rtype: np.ndarray
+    """
+    return store.masses.dot(store.velocities)
+
+
+def angular_momentum(store):
+    """
+    :return: Total angular momentum about the origin: a scalar in 2D, a
+        vector in 3D
+    :rtype: np.ndarray
+    """
+    x, p = store.positions, store.velocities * store.masses[:, None]
+    if store.dim == 2:
+        return np.sum(x[:, 0] * p[:, 1] - x[:, 1] * p[:, 0])
+    return np.cross(x, p).sum(axis=0)
+
+
+def barycentre(store):
+    """
+    :return: (D,) position and (D,) velocity of the centre of mass
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    total = store.masses.sum()
+    if not total:
+        return np.zeros(store.dim), np.zeros(store.dim)
+    return (store.masses.dot(store.positions) / total,
+            store.masses.dot(store.velocities) / total)
+
+
+def conserved(store, forces=None):
+    """
+    :param store: The bodies
+    :type store: BodyStore
+    :param forces: Force backend, see energy()
+    :return: 'energy', 'momentum', 'angular_momentum', 'barycentre' and
+        'barycentre_velocity', plus the scales 'momentum_scale' (sum of
+        |m v|) and 'angular_momentum_scale' (sum of |r x m v|) that the
+        momentum drifts are measured against, as they often sum to zero
+    :rtype: dict
+    """
+    x, v, m = store.positions, store.velocities, store.masses
+    speed = np.sqrt(np.einsum('ij,ij->i', v, v))
+    radius = np.sqrt(np.einsum('ij,ij->i', x, x))
+    centre, velocity = barycentre(store)
+    return {'energy': energy(store, forces),
+            'momentum': momentum(store),
+            'angular_momentum': angular_momentum(store),
+            'barycentre': centre, 'barycentre_velocity': velocity,
+            'momentum_scale': m.dot(speed),
+            'angular_momentum_scale': m.dot(radius * speed)}
+
+
+def drifts(before, after, elapsed):
+    """
+    Relative change of the conserved quantities between two samples.
+    :param before: Earlier result of conserved()
+    :type before: dict
+    :param after: Later result of conserved()
+    :type after: dict
+    :param elapsed: Simulated time between them (s)
+    :type elapsed: float
+    :return: 'energy' (|dE / E0|), 'momentum' and 'angular_momentum'
+        (change over the sample's scale) and 'barycentre' (distance from
+        uniform motion, m)
+    :rtype: dict
+    """
+    def relative(name, scale):
+        change = float(np.linalg.norm(np.subtract(after[name], before[name])))
+        return change / scale if scale else change
+
+    expected = before['barycentre'] + before['barycentre_velocity'] * elapsed
+    return {'energy': relative('energy', abs(before['energy'])),
+            'momentum': relative('momentum', before['momentum_scale']),
+            'angular_momentum': relative('angular_momentum',
+                                         before['angular_momentum_scale']),
+            'barycentre': float(np.linalg.norm(after['barycentre'] -
+                                               expected))}
+
+
+def _backend(forces):
+    # Wrappers (TimedForces, CountingForces) keep the backend in .forces
+    while hasattr(forces, 'forces'):
+        forces = forces.forces
+    return forces
+
+
+class Monitor:
+    """
+    Simulation callback checking the conserved quantities every few steps.
+
+    The first check records the reference values; every later one appends
+    the drifts to history and passes them to report.  When the energy drift
+    exceeds tolerance the monitor either only reports ('report'), raises
+    ToleranceExceeded ('stop'), or multiplies the simulation's dt by shrink
+    and takes the current state as the new reference ('shrink'), stopping
+    once dt would fall below min_dt.
+    """
+
+    def __init__(self, every=100, tolerance=None, action='report',
+                 shrink=0.5, min_dt=0.0, report=None):
+        """
+        :param every: Steps between checks
+        :type every: int
+        :param tolerance: Largest acceptable relative energy drift (no
+            limit if None)
+        :type tolerance: float
+        :param action: 'report', 'stop' or 'shrink'
+        :type action: str
+        :param shrink: Factor dt is multiplied by under 'shrink'
+        :type shrink: float
+        :param min_dt: Smallest dt 'shrink' may reach
+        :type min_dt: float
+        :param report: Called as report(sim, drifts) after every check
+        :return: None
+        :rtype: None
+        """
+        if action not in ACTIONS:
+            raise ValueError('unknown drift action: ' + repr(action))
+        if every < 1:
+            raise ValueError('every must be positive')
+        self.every = every
+        self.tolerance = tolerance
+        self.action = action
+        self.shrink = shrink
+        self.min_dt = min_dt
+        self.report = report
+        self.reference = None
+        self.reference_time = 0.0
+        self.history = []  # (sim_steps, time_elapsed, drifts)
+        self.last = None
+
+    def rebase(self, sim):
+        """
+        Take the current state of sim as the reference.
+        :return: None
+        :rtype: None
+        """
+        self.reference = conserved(sim.store, sim.forces)
+        self.reference_time = sim.time_elapsed
+
+    def __call__(self, sim):
+        """
+        :param sim: The simulation, after a step
+        :type sim: Simulation
+        :return: None
+        :rtype: None
+        """
+        backend = _backend(sim.forces)
+        if hasattr(backend, 'keep_potentials'):
+            # Potentials for the next check are kept by the preceding pass
+            backend.keep_potentials = (sim.sim_steps + 1) % self.every == 0
+        if self.reference is None:
+            self.rebase(sim)
+            return
+        if sim.sim_steps % self.every:
+            return
+        now = conserved(sim.store, sim.forces)
+        self.last = drifts(self.reference, now,
+                           sim.time_elapsed - self.reference_time)
+        self.history.append((sim.sim_steps, sim.time_elapsed, self.last))
+        if self.report is not None:
+            self.report(sim, self.last)
+        if self.tolerance is None or self.last['energy'] <= self.tolerance:
+            return
+        message = 'energy drift {0:.3e} exceeds {1:.1e} at step {2}'.format(
+            self.last['energy'], self.tolerance, sim.sim_steps)
+        if self.action == 'stop' or (self.action == 'shrink' and
+                                     sim.dt * self.shrink < self.min_dt):
+            raise ToleranceExceeded(message, self.last['energy'])
+        if self.action == 'shrink':
+            sim.dt *= self.shrink
+            self.reference, self.reference_time = now, sim.time_elapsed
@@ -0,0 +1,298 @@
+"""
+Parameter sweeps and ensembles of independent runs on a process pool.
+
+An ensemble member is a dict of parameters.  Keys without a dot are passed
+to the scenario generator (seed, count, ...); keys of the form
+'<body>.<field>' overwrite a field of the named body after the scenario is
+built, e.g. {'Star_1.mass': 2e30, 'E.vy': 3.1e4}.  Fields are 'mass',
+'radius', 'x', 'y', 'z', 'vx', 'vy' and 'vz'.
+
+    members = grid(**{'Star_1.mass': [1.9e30, 2.0e30], 'Star_2.vy': [-4e3, -5e3]})
+    result = run_ensemble('binary', members, steps=1000, workers=8)
+
+The members run in parallel and come back as one table: a dict of arrays
+whose first axis is the member.  With batch=True each worker integrates its
+share of the members together as one Batch, which is much faster for
+ensembles of small systems.
+"""
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .batch import Batch
+from .diagnostics import energy
+from .forces import G, make_backend
+from .integrators import make_integrator
+from .scenarios import make_scenario
+from .simulation import Simulation
+
+FIELDS = {'mass': ('masses', None), 'radius': ('radii', None),
+          'x': ('positions', 0), 'y': ('positions', 1), 'z': ('positions', 2),
+          'vx': ('velocities', 0), 'vy': ('velocities', 1),
+          'vz': ('velocities', 2)}
+# Workers are started from a clean process, not forked from this one,
+# which may be running threads (numba's, or those of a thread-pool backend)
+# that do not survive a fork
+START_METHOD = 'forkserver' if 'forkserver' in \
+    multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def grid(**axes):
+    """
+    Every combination of the given parameter values.
+    :param axes: Parameter name -> sequence of values
+    :return: One member per combination, the last axis varying fastest
+    :rtype: list[dict]
+    """
+    names = list(axes)
+    return [dict(zip(names, values))
+            for values in itertools.product(*[axes[n] for n in names])]
+
+
+def sample(count, seed=None, **ranges):
+    """
+    Members with parameters drawn uniformly at random.
+    :param count: Number of members
+    :type count: int
+    :param seed: Random seed
+    :type seed: int
+    :param ranges: Parameter name -> (low, high)
+    :return: count members
+    :rtype: list[dict]
+    """
+    rng = np.random.default_rng(seed)
+    columns = {name: rng.uniform(low, high, count)
+               for name, (low, high) in ranges.items()}
+    return [{name: float(column[i]) for name, column in columns.items()}
+            for i in range(count)]
+
+
+def apply_parameters(store, parameters):
+    """
+    Overwrite body fields of store from '<body>.<field>' parameters; other
+    parameters are ignored.
+    :param store: The bodies
+    :type store: BodyStore
+    :param parameters: One member's parameters
+    :type parameters: dict
+    :return: None
+    :rtype: None
+    """
+    for key, value in parameters.items():
+        if '.' not in key:
+            continue
+        body, field = key.rsplit('.', 1)
+        if body not in store.names:
+            raise ValueError('no body named ' + repr(body))
+        if field not in FIELDS:
+            raise ValueError('unknown body field: ' + repr(field))
+        array, axis = FIELDS[field]
+        row = store.names.index(body)
+        if axis is None:
+            getattr(store, array)[row] = value
+        else:
+            getattr(store, array)[row, axis] = value
+
+
+def _build(scenario, parameters, scenario_options):
+    options = dict(scenario_options or {})
+    options.update((k, v) for k, v in parameters.items() if '.' not in k)
+    store = make_scenario(scenario, **options)
+    apply_parameters(store, parameters)
+    return store
+
+
+def run_member(scenario, parameters, steps, dt, integrator='leapfrog',
+               forces='direct', scenario_options=None, every=None):
+    """
+    Build and run one ensemble member; the unit of work of the pool.
+    :param scenario: Scenario name
+    :type scenario: str
+    :param parameters: The member's parameters
+    :type parameters: dict
+    :param steps: Number of steps
+    :type steps: int
+    :param dt: Timestep (s)
+    :type dt: float
+    :param integrator: Integrator name
+    :type integrator: str
+    :param forces: Force backend name
+    :type forces: str
+    :param scenario_options: Generator arguments shared by all members
+    :type scenario_options: dict
+    :param every: Keep a trajectory frame every this many steps (none if
+        None)
+    :type every: int
+    :return: Final state, summary statistics and optional trajectory
+    :rtype: dict
+    """
+    store = _build(scenario, parameters, scenario_options)
+    sim = Simulation(store, make_backend(forces), make_integrator(integrator),
+                     dt)
+    e0 = energy(store, sim.forces)
+    frames = []
+
+    def record(sim):
+        if sim.sim_steps % every == 0:
+            frames.append(np.hstack([sim.store.positions,
+                                     sim.store.velocities]))
+
+    if every:
+        record(sim)
+    start = time.time()
+    sim.run(steps, record if every else None)
+    wall_time = time.time() - start
+    sim.close()
+    e1 = energy(store, sim.forces)
+    centre = store.masses @ store.positions / store.masses.sum()
+    d = store.positions - centre
+    result = {'positions': store.positions.copy(),
+              'velocities': store.velocities.copy(),
+              'masses': store.masses.copy(),
+              'energy_error': abs((e1 - e0) / e0) if e0 else abs(e1 - e0),
+              'max_radius': np.sqrt(np.einsum('ij,ij->i', d, d)).max(),
+              'wall_time': wall_time}
+    if every:
+        result['trajectory'] = np.array(frames)
+    return result
+
+
+def run_batch(scenario, members, steps, dt, integrator='leapfrog',
+              forces='direct', scenario_options=None, every=None):
+    """
+    Run several members together as one Batch; arguments as run_member.
+    :return: One result per member, as from run_member; wall_time is each
+        member's share of the batch
+    :rtype: list[dict]
+    """
+    if forces != 'direct':
+        raise ValueError('batched runs use direct summation')
+    batch = Batch.from_stores([_build(scenario, m, scenario_options)
+                               for m in members], dt, G=G,
+                              integrator=integrator)
+    e0 = batch.energy()
+    frames = []
+
+    def record(batch):
+        if batch.steps[0] % every == 0:
+            frames.append(np.concatenate([batch.positions, batch.velocities],
+                                         axis=2))
+
+    if every:
+        record(batch)
+    start = time.time()
+    batch.run(steps, callback=record if every else None)
+    wall_time = (time.time() - start) / len(members)
+    e1 = batch.energy()
+    error = np.abs(e1 - e0) / np.where(e0 != 0, np.abs(e0), 1)
+    centre = np.einsum('si,sik->sk', batch.masses, batch.positions) / \
+        batch.masses.sum(axis=1)[:, None]
+    d = batch.positions - centre[:, None]
+    radius = np.sqrt(np.einsum('sik,sik->si', d, d).max(axis=1))
+    results = []
+    for i in range(len(members)):
+        result = {'positions': batch.positions[i],
+                  'velocities': batch.velocities[i],
+                  'masses': batch.masses[i], 'energy_error': error[i],
+                  'max_radius': radius[i], 'wall_time': wall_time}
+        if every:
+            result['trajectory'] = np.array([f[i] for f in frames])
+        results.append(result)
+    return results
+
+
+def _run_member(job):
+    return run_member(*job)
+
+
+def _run_batch(job):
+    return run_batch(*job)
+
+
+def run_ensemble(scenario, members, steps=1000, dt=3600.0,
+                 integrator='leapfrog', forces='direct', scenario_options=None,
+                 every=None, workers=None, batch=False):
+    """
+    Run every member and aggregate the results.
+
+    Members are distributed over a process pool in chunks, so thousands of
+    short runs keep every core busy.
+
+    :param scenario: Scenario name, see scenarios.SCENARIOS
+    :type scenario: str
+    :param members: Parameters of each member, e.g. from grid() or sample()
+    :type members: list[dict]
+    :param steps: Steps per member
+    :type steps: int
+    :param dt: Timestep (s)
+    :type dt: float
+    :param integrator: Integrator name
+    :type integrator: str
+    :param forces: Force backend name
+    :type forces: str
+    :param scenario_options: Generator arguments shared by all members
+    :type scenario_options: dict
+    :param every: Also return trajectories sampled every this many steps
+    :type every: int
+    :param workers: Processes to use (all cores if None; 1 runs in this
+        process)
+    :type workers: int
+    :param batch: Integrate each worker's members together as one Batch
+        (direct forces and leapfrog or yoshida4 only)
+    :type batch: bool
+    :return: Table of M members: 'parameters' (name -> (M,) array),
+        'positions' and 'velocities' (M, N, D), 'masses' (M, N),
+        'energy_error', 'max_radius' and 'wall_time' (M,), and
+        'trajectory' (M, frames, N, 2 D) if every is given
+    :rtype: dict
+    """
+    if not members:
+        return {'parameters': {}}
+    workers = workers or os.cpu_count() or 1
+    if batch:
+        share = -(-len(members) // workers)
+        jobs = [(scenario, members[i:i + share], steps, dt, integrator,
+                 forces, scenario_options, every)
+                for i in range(0, len(members), share)]
+        run, chunk = _run_batch, 1
+    else:
+        jobs = [(scenario, m, steps, dt, integrator, forces,
+                 scenario_options, every) for m in members]
+        run, chunk = _run_member, max(1, len(jobs) // (4 * workers))
+    if workers == 1:
+        results = [run(job) for job in jobs]
+    else:
+        context = multiprocessing.get_context(START_METHOD)
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            results = list(pool.map(run, jobs, chunksize=chunk))
+    if batch:
+        results = [r for share in results for r in share]
+    if len(set(len(r['masses']) for r in results)) > 1:
+        raise ValueError('ensemble members have different numbers of bodies')
+    names = sorted(set(k for m in members for k in m))
+    table = {'parameters': {n: np.array([m.get(n, np.nan) for m in members])
+                            for n in names}}
+    for key in results[0] if results else ():
+        table[key] = np.array([r[key] for r in results])
+    return table
+
+
+def save_ensemble(table, path):
+    """
+    Write an ensemble table to an .npz file, parameters as
+    'parameter:<name>' columns.
+    :param table: Result of run_ensemble
+    :type table: dict
+    :param path: File name
+    :type path: str
+    :return: None
+    :rtype: None
+    """
+    arrays = {'parameter:' + name: column
+              for name, column in table['parameters'].items()}
+    arrays.update((k, v) for k, v in table.items() if k != 'parameters')
+    np.savez(path, **arrays)
@@ -0,0 +1,288 @@
+"""
+Gravitational force kernels operating on whole state arrays.
+
+Rather than each body walking every other body in Python, the direct-sum
+kernel evaluates all pairwise accelerations in a few batched numpy
+operations.  Targets are processed in row blocks so the (block, N, D)
+temporaries stay a few megabytes even for thousands of bodies.
+"""
+import numpy as np
+
+G = 6.67384e-11  # m^3 * kg^-1 * s^-2
+
+# Upper bound on the number of elements in a block's (b, N, D) temporaries
+BLOCK_ELEMENTS = 2 ** 18
+
+
+def direct_sum(positions, masses, G=G, softening=0.0, targets=None, out=None,
+               potentials=None):
+    """
+    Gravitational acceleration at each target due to every massive source.
+
+    Zero-mass sources are dropped before the pair pass, and pairs at zero
+    separation (a body acting on itself) contribute nothing, so passing the
+    same array as positions and targets gives the usual N-body accelerations.
+
+    :param positions: (N, D) source positions
+    :type positions: np.ndarray
+    :param masses: (N,) source masses
+    :type masses: np.ndarray
+    :param G: Gravitational constant
+    :type G: float
+    :param softening: Plummer softening length
+    :type softening: float
+    :param targets: (M, D) points to evaluate at; defaults to positions
+    :type targets: np.ndarray
+    :param out: Optional (M, D) array to write the result into
+    :type out: np.ndarray
+    :param potentials: Optional (M,) array to write the gravitational
+        potential at each target into (J/kg), from the same pair distances
+    :type potentials: np.ndarray
+    :return: (M, D) accelerations
+    :rtype: np.ndarray
+    """
+    positions = np.asarray(positions, dtype=float)
+    masses = np.asarray(masses, dtype=float)
+    if targets is None:
+        targets = positions
+    else:
+        targets = np.asarray(targets, dtype=float)
+    if out is None:
+        out = np.empty_like(targets)
+    massive = masses > 0
+    if not massive.all():
+        positions = positions[massive]
+        masses = masses[massive]
+    n_src = len(masses)
+    if n_src == 0:
+        out[:] = 0.0
+        if potentials is not None:
+            potentials[:] = 0.0
+        return out
+    eps2 = softening ** 2
+    block = max(1, BLOCK_ELEMENTS // (n_src * positions.shape[1]))
+    for start in range(0, len(targets), block):
+        stop = start + block
+        # diff[i, j] points from target i towards source j
+        diff = positions[np.newaxis, :, :] - targets[start:stop, np.newaxis, :]
+        r2 = np.einsum('ijk,ijk->ij', diff, diff)
+        # A body does not act on itself (or on one at the same position),
+        # softened or not
+        apart = r2 > 0
+        if eps2:
+            r2 += eps2
+        inv_r3 = np.zeros_like(r2)
+        np.power(r2, -1.5, out=inv_r3, where=apart)
+        if potentials is not None:
+            # r^-3 * r^2 = 1 / r, without a second power
+            potentials[start:stop] = -(inv_r3 * r2).dot(masses)
+        inv_r3 *= masses
+        np.einsum('ij,ijk->ik', inv_r3, diff, out=out[start:stop])
+    out *= G
+    if potentials is not None:
+        potentials *= G
+    return out
+
+
+def direct_jerk(positions, velocities, masses, G=G, softening=0.0):
+    """
+    Time derivative of the direct-sum accelerations (the jerk) of each body.
+
+    :param positions: (N, D) positions
+    :type positions: np.ndarray
+    :param velocities: (N, D) velocities
+    :type velocities: np.ndarray
+    :param masses: (N,) masses
+    :type masses: np.ndarray
+    :param G: Gravitational constant
+    :type G: float
+    :param softening: Plummer softening length
+    :type softening: float
+    :return: (N, D) jerks
+    :rtype: np.ndarray
+    """
+    positions = np.asarray(positions, dtype=float)
+    velocities = np.asarray(velocities, dtype=float)
+    masses = np.asarray(masses, dtype=float)
+    out = np.empty_like(positions)
+    n, dim = positions.shape
+    block = max(1, BLOCK_ELEMENTS // (n * dim))
+    for start in range(0, n, block):
+        stop = start + block
+        dr = positions[np.newaxis] - positions[start:stop, np.newaxis]
+        dv = velocities[np.newaxis] - velocities[start:stop, np.newaxis]
+        r2 = np.einsum('ijk,ijk->ij', dr, dr) + softening ** 2
+        rv = np.einsum('ijk,ijk->ij', dr, dv)
+        inv_r3 = np.zeros_like(r2)
+        np.power(r2, -1.5, out=inv_r3, where=r2 > 0)
+        inv_r3 *= masses
+        coef = np.zeros_like(r2)
+        np.divide(3 * rv, r2, out=coef, where=r2 > 0)
+        out[start:stop] = np.einsum('ij,ijk->ik', inv_r3, dv) - \
+            np.einsum('ij,ijk->ik', inv_r3 * coef, dr)
+    out *= G
+    return out
+
+
+def potential_energy(positions, masses, G=G, softening=0.0):
+    """
+    Total gravitational potential energy of the system, every pair once.
+
+    :param positions: (N, D) positions
+    :type positions: np.ndarray
+    :param masses: (N,) masses
+    :type masses: np.ndarray
+    :param G: Gravitational constant
+    :type G: float
+    :param softening: Plummer softening length
+    :type softening: float
+    :return: Potential energy (J)
+    :rtype: float
+    """
+    positions = np.asarray(positions, dtype=float)
+    masses = np.asarray(masses, dtype=float)
+    massive = masses > 0
+    positions, masses = positions[massive], masses[massive]
+    n = len(masses)
+    if n < 2:
+        return 0.0
+    total = 0.0
+    block = max(1, BLOCK_ELEMENTS // (n * positions.shape[1]))
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        diff = positions[np.newaxis] - positions[start:stop, np.newaxis]
+        r2 = np.einsum('ijk,ijk->ij', diff, diff)
+        # Only pairs j > i, none at zero separation (see direct_sum)
+        upper = np.arange(n)[np.newaxis] > np.arange(start, stop)[:, None]
+        inv_r = np.zeros_like(r2)
+        np.power(r2 + softening ** 2, -0.5, out=inv_r, where=upper & (r2 > 0))
+        total -= masses[start:stop].dot(inv_r.dot(masses))
+    return G * total
+
+
+class DirectSum:
+    """
+    Force backend evaluating every pair exactly, see direct_sum().
+
+    Backends share one interface: accelerations(positions, masses, out=None)
+    returns the (N, D) self-gravity of the system, and
+    subset_accelerations(positions, masses, rows) that of the given rows
+    only, for integrators that update a few bodies at a time.
+
+    With keep_potentials set, every full accelerations() pass also keeps
+    the potential at each body, so that last_potential_energy() can give
+    the potential energy of the evaluated state without a second pair pass.
+    """
+    name = 'direct'
+    keep_potentials = False
+
+    def __init__(self, G=G, softening=0.0):
+        """
+        :param G: Gravitational constant
+        :type G: float
+        :param softening: Plummer softening length
+        :type softening: float
+        :return: None
+        :rtype: None
+        """
+        self.G = G
+        self.softening = softening
+        self.potentials = None
+        self._potential_state = None
+
+    def options(self):
+        """
+        :return: Keyword arguments recreating this backend with make_backend
+        :rtype: dict
+        """
+        return {'G': self.G, 'softening': self.softening}
+
+    def accelerations(self, positions, masses, out=None):
+        """
+        :param positions: (N, D) positions
+        :type positions: np.ndarray
+        :param masses: (N,) masses
+        :type masses: np.ndarray
+        :param out: Optional (N, D) array to write the result into
+        :type out: np.ndarray
+        :return: (N, D) accelerations
+        :rtype: np.ndarray
+        """
+        if not self.keep_potentials:
+            return self.evaluate(positions, masses, out=out)
+        if self.potentials is None or len(self.potentials) != len(positions):
+            self.potentials = np.empty(len(positions))
+        out = self.evaluate(positions, masses, out=out,
+                            potentials=self.potentials)
+        self._potential_state = (np.array(positions, dtype=float),
+                                 np.array(masses, dtype=float))
+        return out
+
+    def last_potential_energy(self, positions, masses):
+        """
+        Potential energy of the system from the potentials kept by the last
+        accelerations() pass.
+        :param positions: (N, D) positions
+        :type positions: np.ndarray
+        :param masses: (N,) masses
+        :type masses: np.ndarray
+        :return: Potential energy (J), or None unless the last pass was made
+            at exactly these positions and masses
+        :rtype: float
+        """
+        if self._potential_state is None:
+            return None
+        x, m = self._potential_state
+        if not (np.array_equal(x, positions) and np.array_equal(m, masses)):
+            return None
+        return 0.5 * m.dot(self.potentials)
+
+    def subset_accelerations(self, positions, masses, rows):
+        """
+        :param positions: (N, D) positions
+        :type positions: np.ndarray
+        :param masses: (N,) masses
+        :type masses: np.ndarray
+        :param rows: Indices (or boolean mask) of the bodies to evaluate
+        :type rows: np.ndarray
+        :return: (len(rows), D) accelerations
+        :rtype: np.ndarray
+        """
+        return self.evaluate(positions, masses, targets=positions[rows])
+
+    def evaluate(self, positions, masses, targets=None, out=None,
+                 potentials=None):
+        """
+        The kernel behind the backend: direct_sum() with this backend's G
+        and softening.
+        """
+        return direct_sum(positions, masses, self.G, self.softening,
+                          targets=targets, out=out, potentials=potentials)
+
+
+def make_backend(name='direct', **options):
+    """
+    Construct a force backend by name.
+
+    Backends other than direct summation live in their own modules and are
+    only imported when asked for.
+
+    :param name: 'direct', 'barnes-hut', 'numba' (direct summation
+        compiled with numba, or the numpy kernels if numba is missing) or
+        'parallel' (direct summation on a thread pool)
+    :type name: str
+    :param options: Keyword arguments for the backend (G, softening, ...)
+    :return: A force backend
+    """
+    if name == 'direct':
+        return DirectSum(**options)
+    if name == 'barnes-hut':
+        from .barneshut import BarnesHut
+        return BarnesHut(**options)
+    if name == 'numba':
+        from .jit import NumbaDirect
+        return NumbaDirect(**options)
+    if name == 'parallel':
+        from .parallel import ParallelDirect
+        return ParallelDirect(**options)
+    raise ValueError('unknown force backend: ' + repr(name))
@@ -0,0 +1,853 @@
+"""
+Time integrators advancing a BodyStore under a force backend.
+
+Every integrator exposes step(store, forces, dt), which advances the
+positions and velocities of the store by dt and leaves the accelerations
+at the new positions in store.accelerations.  Integrators reuse those
+accelerations at the start of the next step ("first same as last"), so a
+second-order step costs one force evaluation; call reset() whenever the
+positions or masses are changed from outside.
+
+The symplectic schemes (everything but 'euler') keep the energy error
+bounded instead of letting it drift, which is what allows timesteps many
+times larger than explicit Euler for the same long-term accuracy.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .forces import G, direct_jerk, direct_sum
+from .kepler import kepler_drift
+from .state import BodyStore
+
+
+class Integrator:
+    """
+    Base class of all integrators.
+    """
+    name = None
+    order = None
+    evaluations = 1  # force evaluations per step
+
+    def __init__(self):
+        self.fresh = False
+
+    def reset(self):
+        """
+        Mark the accelerations held in the store as stale.
+        :return: None
+        :rtype: None
+        """
+        self.fresh = False
+
+    def options(self):
+        """
+        :return: Keyword arguments recreating this integrator with
+            make_integrator
+        :rtype: dict
+        """
+        return {}
+
+    def get_state(self):
+        """
+        Everything besides the store needed to continue exactly where this
+        integrator left off.
+        :return: Flags and arrays by name
+        :rtype: dict
+        """
+        return {'fresh': self.fresh}
+
+    def set_state(self, state):
+        """
+        Restore a state returned by get_state.
+        :param state: Flags and arrays by name
+        :type state: dict
+        :return: None
+        :rtype: None
+        """
+        self.fresh = bool(state['fresh'])
+
+    def accelerate(self, store, forces):
+        """
+        Evaluate the forces at the current positions into store.accelerations.
+        :param store: The bodies
+        :type store: BodyStore
+        :param forces: A force backend
+        :return: None
+        :rtype: None
+        """
+        forces.accelerations(store.positions, store.masses,
+                             out=store.accelerations)
+        self.fresh = True
+
+    def prime(self, store, forces):
+        """
+        Make sure store.accelerations belong to the current positions.
+        :param store: The bodies
+        :type store: BodyStore
+        :param forces: A force backend
+        :return: None
+        :rtype: None
+        """
+        if not self.fresh:
+            self.accelerate(store, forces)
+
+    def step(self, store, forces, dt):
+        """
+        Advance store by dt.
+        :param store: The bodies
+        :type store: BodyStore
+        :param forces: A force backend
+        :param dt: Timestep (s)
+        :type dt: float
+        :return: None
+        :rtype: None
+        """
+        raise NotImplementedError
+
+
+class Euler(Integrator):
+    """
+    Semi-implicit (symplectic) Euler: kick with the current forces, then
+    drift with the new velocities.  This is what the scripts originally did.
+    """
+    name = 'euler'
+    order = 1
+
+    def step(self, store, forces, dt):
+        self.accelerate(store, forces)
+        store.velocities += store.accelerations * dt
+        store.positions += store.velocities * dt
+        self.fresh = False
+
+
+class Composition(Integrator):
+    """
+    A sequence of kick-drift-kick leapfrog substeps of lengths c_i * dt.
+
+    With a single coefficient of 1 this is plain leapfrog; higher-order
+    schemes are built from symmetric sequences of coefficients.  The closing
+    kick of each substep and the opening kick of the next share one force
+    evaluation.
+    """
+    coefficients = (1.0,)
+
+    @property
+    def evaluations(self):
+        return len(self.coefficients)
+
+    def step(self, store, forces, dt):
+        self.prime(store, forces)
+        # Backends with compiled kernels (see jit) fuse the whole substep
+        substep = getattr(forces, 'leapfrog_substep', None)
+        for c in self.coefficients:
+            h = c * dt
+            if substep is not None:
+                substep(store, h, forces)
+                self.fresh = True
+                continue
+            store.velocities += store.accelerations * (h / 2)
+            store.positions += store.velocities * h
+            self.accelerate(store, forces)
+            store.velocities += store.accelerations * (h / 2)
+
+
+class Leapfrog(Composition):
+    """
+    Kick-drift-kick leapfrog, second order.
+    """
+    name = 'leapfrog'
+    order = 2
+
+
+class VelocityVerlet(Integrator):
+    """
+    Velocity Verlet, second order.
+
+    Algebraically the same map as kick-drift-kick leapfrog, written as a
+    position update from the old velocity and acceleration followed by a
+    velocity update from the average of the old and new accelerations.
+    """
+    name = 'verlet'
+    order = 2
+
+    def step(self, store, forces, dt):
+        self.prime(store, forces)
+        old = store.accelerations.copy()
+        store.positions += store.velocities * dt + old * (dt * dt / 2)
+        self.accelerate(store, forces)
+        store.velocities += (old + store.accelerations) * (dt / 2)
+
+
+_CBRT2 = 2 ** (1.0 / 3.0)
+
+
+class Yoshida4(Composition):
+    """
+    Fourth-order symplectic scheme of Forest & Ruth (1990) and Yoshida
+    (1990): three leapfrog substeps, the middle one backwards in time.
+    Three force evaluations per step.
+    """
+    name = 'yoshida4'
+    order = 4
+    coefficients = (1 / (2 - _CBRT2), -_CBRT2 / (2 - _CBRT2), 1 / (2 - _CBRT2))
+
+
+class BlockTimesteps(Integrator):
+    """
+    Velocity Verlet (leapfrog) with individual, hierarchical timesteps.
+
+    Each body i advances with its own step dt / 2**level[i], chosen from its
+    acceleration and jerk as eta * |a| / |j| rounded down to a power-of-two
+    fraction of dt.  Within a call to step() the integrator jumps from one
+    block boundary to the next: the positions of all bodies are predicted to
+    that time (x0 + v0 t + a0 t^2 / 2, cheap), but forces are only evaluated
+    for the "active" bodies whose step ends there.  Fast inner moons are
+    thus sub-cycled finely while outer planets take one force evaluation
+    per dt.
+
+    Levels may become finer at any of a body's own boundaries, and one
+    level coarser where the coarser step is aligned.  After the first step
+    the jerk is estimated from the change in acceleration over the body's
+    last step; the initial levels use the analytic direct-sum jerk.
+    """
+    name = 'block'
+    order = 2
+
+    def __init__(self, eta=0.02, max_level=12):
+        """
+        :param eta: Accuracy parameter; steps are eta / (orbital frequency)
+        :type eta: float
+        :param max_level: Finest level, i.e. steps down to dt / 2**max_level
+        :type max_level: int
+        :return: None
+        :rtype: None
+        """
+        Integrator.__init__(self)
+        self.eta = eta
+        self.max_level = max_level
+        self.levels = None
+        self.body_evaluations = 0  # per-body force evaluations, last step
+
+    def reset(self):
+        Integrator.reset(self)
+        self.levels = None
+
+    def options(self):
+        return {'eta': self.eta, 'max_level': self.max_level}
+
+    def get_state(self):
+        state = Integrator.get_state(self)
+        if self.levels is not None:
+            state['levels'] = self.levels.copy()
+        return state
+
+    def set_state(self, state):
+        Integrator.set_state(self, state)
+        levels = state.get('levels')
+        self.levels = None if levels is None else np.array(levels, int)
+
+    def _levels(self, dt, acc, jerk):
+        """
+        Level whose step is the largest power-of-two fraction of dt below
+        the eta * |a| / |j| criterion.
+        """
+        a = np.sqrt(np.einsum('ij,ij->i', acc, acc))
+        j = np.sqrt(np.einsum('ij,ij->i', jerk, jerk))
+        wanted = np.full(len(a), np.inf)
+        np.divide(self.eta * a, j, out=wanted, where=j > 0)
+        ratio = np.full(len(a), 1.0)
+        np.divide(dt, wanted, out=ratio, where=wanted > 0)
+        levels = np.ceil(np.log2(np.maximum(ratio, 1.0)))
+        return np.minimum(levels, self.max_level).astype(int)
+
+    def step(self, store, forces, dt):
+        pos, vel, acc = store.positions, store.velocities, store.accelerations
+        if not self.fresh or self.levels is None or \
+                len(self.levels) != len(store):
+            self.accelerate(store, forces)
+            jerk = direct_jerk(pos, vel, store.masses, forces.G,
+                               forces.softening)
+            self.levels = self._levels(dt, acc, jerk)
+        # Integer ticks of the finest level; a body's step is 2**(K - level)
+        ticks = 1 << self.max_level
+        size = 1 << (self.max_level - self.levels)
+        h = dt / ticks
+        # State of every body at the start of its current step
+        x0, v0, a0 = pos.copy(), vel.copy(), acc.copy()
+        t0 = np.zeros(len(size), int)
+        tick = 0
+        self.body_evaluations = 0
+        while tick < ticks:
+            tick = (t0 + size).min()
+            tau = ((tick - t0) * h)[:, None]
+            pos[:] = x0 + v0 * tau + a0 * (tau * tau / 2)
+            active = np.flatnonzero(t0 + size == tick)
+            self.body_evaluations += len(active)
+            acc[active] = forces.subset_accelerations(pos, store.masses,
+                                                      active)
+            step = (size[active] * h)[:, None]
+            vel[active] = v0[active] + (a0[active] + acc[active]) * (step / 2)
+            jerk = (acc[active] - a0[active]) / step
+            x0[active], v0[active], a0[active] = pos[active], vel[active], \
+                acc[active]
+            t0[active] = tick
+            old = self.levels[active]
+            new = self._levels(dt, acc[active], jerk)
+            # Coarsen by at most one level, and only onto an aligned boundary
+            coarser = np.maximum(old - 1, 0)
+            aligned = tick % (1 << (self.max_level - coarser)) == 0
+            new = np.where(new < old, np.where(aligned, coarser, old), new)
+            self.levels[active] = new
+            size[active] = 1 << (self.max_level - new)
+        self.fresh = True
+
+
+class WisdomHolman(Integrator):
+    """
+    Wisdom-Holman mixed-variable symplectic map for systems dominated by one
+    central body, in democratic heliocentric coordinates (Duncan, Levison
+    and Lee 1998).
+
+    Positions are taken relative to the central body and velocities
+    relative to the barycentre.  The Hamiltonian then splits into a Kepler
+    orbit about the central body for each other body (solved exactly by
+    kepler_drift), the mutual attraction of the other bodies (kicks from
+    the force backend, which never sees the central body) and a small
+    "jump" term moving the central body.  The step is
+
+        kick(dt/2) jump(dt/2) kepler(dt) jump(dt/2) kick(dt/2)
+
+    and its error is proportional to the ratio of the planetary to the
+    central mass as well as to dt^2, so steps of ~1/20 of the innermost
+    orbital period keep planetary energies bounded to ~1e-7 indefinitely.
+    Bodies bound to something other than the central body (moons) need
+    steps short enough to resolve their own orbits.
+
+    The kicks of one step's end are reused at the start of the next; the
+    total accelerations are written to store.accelerations as usual.
+    """
+    name = 'wisdom-holman'
+    order = 2
+
+    def __init__(self, central=None):
+        """
+        :param central: Index of the central body (the heaviest if None)
+        :type central: int
+        :return: None
+        :rtype: None
+        """
+        Integrator.__init__(self)
+        self.central = central
+        self.kicks = None
+
+    def reset(self):
+        Integrator.reset(self)
+        self.kicks = None
+
+    def options(self):
+        return {'central': self.central}
+
+    def get_state(self):
+        state = Integrator.get_state(self)
+        if self.kicks is not None:
+            state['kicks'] = self.kicks.copy()
+        return state
+
+    def set_state(self, state):
+        Integrator.set_state(self, state)
+        kicks = state.get('kicks')
+        self.kicks = None if kicks is None else np.array(kicks, float)
+
+    def step(self, store, forces, dt):
+        m = store.masses
+        c = int(np.argmax(m)) if self.central is None else self.central
+        if m[c] <= 0:
+            raise ValueError('the central body must have a positive mass')
+        others = np.flatnonzero(np.arange(len(store)) != c)
+        mo = m[others]
+        mu = forces.G * m[c]
+        total = m.sum()
+        pos, vel = store.positions, store.velocities
+        x_cm = m @ pos / total
+        v_cm = m @ vel / total
+        q = pos[others] - pos[c]
+        u = vel[others] - v_cm
+        if not self.fresh or self.kicks is None or \
+                len(self.kicks) != len(others):
+            self.kicks = forces.accelerations(q, mo)
+        u += self.kicks * (dt / 2)
+        q += (mo @ u) * (dt / 2 / m[c])
+        q, u = kepler_drift(q, u, mu, dt)
+        q += (mo @ u) * (dt / 2 / m[c])
+        self.kicks = forces.accelerations(q, mo)
+        u += self.kicks * (dt / 2)
+        # Back to the barycentric frame, which drifts uniformly
+        x_cm += v_cm * dt
+        pos[c] = x_cm - mo @ q / total
+        pos[others] = q + pos[c]
+        vel[c] = v_cm - mo @ u / m[c]
+        vel[others] = u + v_cm
+        r = np.sqrt(np.einsum('ij,ij->i', q, q))[:, None]
+        pull = q / (r * r * r)
+        store.accelerations[others] = self.kicks - mu * pull
+        store.accelerations[c] = forces.G * (mo @ pull)
+        self.fresh = True
+
+
+def hill_parents(positions, velocities, masses, G=G, candidates=32):
+    """
+    Assign satellites to the bodies they are bound to, inside their Hill
+    sphere.
+
+    The heaviest body is the centre of the system.  Only the heaviest
+    `candidates` other bodies are considered as parents, heaviest first, and
+    a body that is itself a satellite cannot have satellites.
+
+    :param positions: (N, D) positions
+    :type positions: np.ndarray
+    :param velocities: (N, D) velocities
+    :type velocities: np.ndarray
+    :param masses: (N,) masses
+    :type masses: np.ndarray
+    :param G: Gravitational constant
+    :type G: float
+    :param candidates: Number of possible parents
+    :type candidates: int
+    :return: (N,) index of each body's parent, -1 for top-level bodies
+    :rtype: np.ndarray
+    """
+    central = int(np.argmax(masses))
+    parents = np.full(len(masses), -1)
+    order = [p for p in np.argsort(masses)[::-1][:candidates + 1]
+             if p != central and masses[p] > 0]
+    for p in order:
+        if parents[p] >= 0:
+            continue
+        d = positions - positions[p]
+        w = velocities - velocities[p]
+        r2 = np.einsum('ij,ij->i', d, d)
+        hill = np.sqrt(r2[central]) * \
+            (masses[p] / (3 * masses[central])) ** (1 / 3.0)
+        inside = r2 < hill * hill
+        inside[[p, central]] = False
+        with np.errstate(divide='ignore'):
+            inside &= 0.5 * np.einsum('ij,ij->i', w, w) < \
+                G * (masses[p] + masses) / np.sqrt(r2)
+        inside &= (parents < 0) & (masses <= masses[p])
+        parents[inside] = p
+    # Parents that turned out to be satellites lose their own
+    parents[np.isin(parents, np.flatnonzero(parents >= 0))] = -1
+    return parents
+
+
+def _save_level(state, prefix, store, integrator):
+    """
+    Add the arrays of a sub-store and the state of the integrator advancing
+    it to state, under keys starting with prefix.
+    """
+    state[prefix + 'positions'] = store.positions.copy()
+    state[prefix + 'velocities'] = store.velocities.copy()
+    state[prefix + 'accelerations'] = store.accelerations.copy()
+    state[prefix + 'masses'] = store.masses.copy()
+    for key, value in integrator.get_state().items():
+        state[prefix + 'integrator.' + key] = value
+
+
+def _load_level(state, prefix, name):
+    """
+    The sub-store and integrator saved by _save_level under prefix.
+    """
+    store = BodyStore.from_arrays(state[prefix + 'positions'],
+                                  state[prefix + 'velocities'],
+                                  state[prefix + 'masses'])
+    store.accelerations = state[prefix + 'accelerations']
+    integrator = make_integrator(name)
+    prefix += 'integrator.'
+    integrator.set_state({key[len(prefix):]: value
+                          for key, value in state.items()
+                          if key.startswith(prefix)})
+    return store, integrator
+
+
+def _weights(masses):
+    """
+    Barycentric weights of a group of bodies (equal if all are massless).
+    """
+    mass = masses.sum()
+    if mass > 0:
+        return masses / mass
+    return np.ones(len(masses)) / len(masses)
+
+
+class Hierarchical(Integrator):
+    """
+    Planets and their moons integrated as nested sub-systems.
+
+    Each planet with satellites forms a group.  The outer level integrates
+    the top-level bodies with every group replaced by its barycentre, with
+    one step of dt; each group is integrated in its own barycentric frame
+    under its internal gravity, sub-stepped to resolve its fastest orbit.
+    The groups feel the tidal field of the outer bodies (the acceleration
+    of each member relative to that of the barycentre) as half kicks
+    around every group sub-step, with the outer positions interpolated
+    across the outer step:
+
+        outer(dt); per group n times: tide(h/2) group(h) tide(h/2)
+
+    which is second order, and leaves the barycentres to the outer level.
+    Adding moons costs one row of outer forces per moon plus their own
+    sub-steps; the planets keep their long step.  Group coordinates are
+    kept relative, so moons do not lose precision to large heliocentric
+    positions; call reset() after changing the store from outside.  The
+    groups and their relative coordinates are part of the checkpointed
+    state, so a restarted run continues bit-for-bit.
+    """
+    name = 'hierarchical'
+    order = 2
+
+    def __init__(self, parents=None, outer='wisdom-holman',
+                 inner='wisdom-holman', per_orbit=50):
+        """
+        :param parents: Index of each body's planet, -1 for top-level bodies
+            (found from Hill spheres if None)
+        :type parents: list[int]
+        :param outer: Integrator of the outer level
+        :type outer: str
+        :param inner: Integrator of the groups
+        :type inner: str
+        :param per_orbit: Minimum group steps per shortest orbital period
+        :type per_orbit: float
+        :return: None
+        :rtype: None
+        """
+        Integrator.__init__(self)
+        self.parents = None if parents is None else \
+            [int(p) for p in parents]
+        self.outer = outer
+        self.inner = inner
+        self.per_orbit = per_orbit
+        self.substeps = []  # group steps per step, per group, last step
+        self._groups = None
+
+    def reset(self):
+        Integrator.reset(self)
+        self._groups = None
+
+    def options(self):
+        return {'parents': self.parents, 'outer': self.outer,
+                'inner': self.inner, 'per_orbit': self.per_orbit}
+
+    def get_state(self):
+        state = Integrator.get_state(self)
+        if self._groups is None:
+            return state
+        state['parents'] = self._parents.copy()
+        _save_level(state, 'outer.', self._outer, self._outer_integrator)
+        for i, group in enumerate(self._groups):
+            prefix = 'group%d.' % i
+            _save_level(state, prefix, group['store'], group['integrator'])
+            state[prefix + 'period'] = float(group['period'])
+            if 'tidal' in group:
+                state[prefix + 'tidal'] = group['tidal'].copy()
+        return state
+
+    def set_state(self, state):
+        Integrator.set_state(self, state)
+        self._groups = None
+        if 'parents' not in state:
+            return
+        self._parents = np.array(state['parents'], int)
+        self._top = np.flatnonzero(self._parents < 0)
+        self._outer, self._outer_integrator = _load_level(state, 'outer.',
+                                                          self.outer)
+        self._groups = []
+        for row, members in self._split(self._parents):
+            if len(members) == 1:
+                continue
+            prefix = 'group%d.' % len(self._groups)
+            inner, integrator = _load_level(state, prefix, self.inner)
+            group = {'row': row, 'members': members,
+                     'weights': _weights(inner.masses), 'store': inner,
+                     'period': state[prefix + 'period'],
+                     'integrator': integrator}
+            if prefix + 'tidal' in state:
+                group['tidal'] = np.array(state[prefix + 'tidal'], float)
+            self._groups.append(group)
+
+    def _split(self, parents):
+        """
+        (row on the outer level, members) of every top-level body, the
+        top-level body first among its members.
+        """
+        for row, k in enumerate(np.flatnonzero(parents < 0)):
+            yield row, np.append(k, np.flatnonzero(parents == k))
+
+    def _build(self, store, forces):
+        """
+        Split the store into the outer level and the groups.
+        """
+        if self.parents is None:
+            parents = hill_parents(store.positions, store.velocities,
+                                   store.masses, forces.G)
+        else:
+            parents = np.array(self.parents, int)
+        if len(parents) != len(store):
+            raise ValueError('parents must name a parent for every body')
+        if np.any(parents[parents >= 0] >= 0) and \
+                np.any(parents[parents[parents >= 0]] >= 0):
+            raise ValueError('satellites of satellites are not supported')
+        top = np.flatnonzero(parents < 0)
+        m = store.masses
+        self._parents = parents
+        self._top = top
+        self._groups = []
+        outer = BodyStore(store.dim, len(top))
+        for row, members in self._split(parents):
+            k = members[0]
+            mass = m[members].sum()
+            weights = _weights(m[members])
+            x = weights @ store.positions[members]
+            v = weights @ store.velocities[members]
+            outer.add(x, v, mass, store.radii[k], store.names[k])
+            if len(members) == 1:
+                continue
+            group = BodyStore.from_arrays(store.positions[members] - x,
+                                          store.velocities[members] - v,
+                                          m[members])
+            d = group.positions[1:] - group.positions[0]
+            r = np.sqrt(np.einsum('ij,ij->i', d, d))
+            period = (2 * np.pi * np.sqrt(r ** 3 / (forces.G * mass))).min()
+            self._groups.append({'row': row, 'members': members,
+                                 'weights': weights, 'store': group,
+                                 'period': period,
+                                 'integrator': make_integrator(self.inner)})
+        self._outer = outer
+        self._outer_integrator = make_integrator(self.outer)
+
+    def _tidal(self, group, positions, forces):
+        """
+        Tidal accelerations of the outer bodies, at the given positions, on
+        the members of a group.
+        """
+        outer, row, members = self._outer, group['row'], group['members']
+        x = group['store'].positions + positions[row]
+        masses = np.append(outer.masses, np.zeros(len(members)))
+        masses[row] = 0.0
+        rows = np.arange(len(outer), len(masses))
+        pull = forces.subset_accelerations(np.vstack([positions, x]), masses,
+                                           rows)
+        return pull - group['weights'] @ pull
+
+    def step(self, store, forces, dt):
+        if not self.fresh or self._groups is None:
+            self._build(store, forces)
+        outer = self._outer
+        x0, v0 = outer.positions.copy(), outer.velocities.copy()
+        self._outer_integrator.step(outer, forces, dt)
+        x1, v1 = outer.positions, outer.velocities
+        self.substeps = []
+        for group in self._groups:
+            inner = group['store']
+            n = max(1, int(np.ceil(dt * self.per_orbit / group['period'])))
+            h = dt / n
+            if 'tidal' not in group:
+                group['tidal'] = self._tidal(group, x0, forces)
+            for j in range(n):
+                inner.velocities += group['tidal'] * (h / 2)
+                group['integrator'].step(inner, forces, h)
+                # Cubic Hermite interpolation of the outer bodies
+                s = (j + 1.0) / n
+                x = (2 * s ** 3 - 3 * s ** 2 + 1) * x0 + \
+                    (s ** 3 - 2 * s ** 2 + s) * dt * v0 + \
+                    (3 * s ** 2 - 2 * s ** 3) * x1 + \
+                    (s ** 3 - s ** 2) * dt * v1
+                group['tidal'] = self._tidal(group, x, forces)
+                inner.velocities += group['tidal'] * (h / 2)
+            self.substeps.append(n)
+        store.positions[self._top] = outer.positions
+        store.velocities[self._top] = outer.velocities
+        store.accelerations[self._top] = outer.accelerations
+        for group in self._groups:
+            row, members, inner = group['row'], group['members'], \
+                group['store']
+            store.positions[members] = inner.positions + outer.positions[row]
+            store.velocities[members] = inner.velocities + \
+                outer.velocities[row]
+            store.accelerations[members] = inner.accelerations + \
+                group['tidal'] + outer.accelerations[row]
+        self.fresh = True
+
+
+class TestParticles(Integrator):
+    """
+    Massive bodies with an inner integrator, and massless bodies (test
+    particles) as a swarm that only feels the massive ones.
+
+    The massive bodies are advanced on their own, once per step, so the
+    inner integrator never sees the swarm.  The test particles then take a
+    kick-drift-kick step against the massive positions X0 and X1 at the
+    start and end of the step:
+
+        v += a(x; X0) dt/2;  x += v dt;  v += a(x; X1) dt/2
+
+    which costs N_massive x N_test pairs, in chunks of chunk particles so
+    the temporaries stay small however large the swarm, spread over
+    workers threads if asked.  The chunks do not depend on workers, so
+    neither do the results.  Test particles are integrated to second order
+    whatever the inner integrator; call reset() after changing the store
+    from outside, e.g. giving a test particle mass.  Checkpoints keep the
+    massive level, so restarts continue bit-for-bit.
+    """
+    name = 'test-particles'
+    order = 2
+
+    def __init__(self, inner='leapfrog', chunk=65536, workers=1):
+        """
+        :param inner: Integrator of the massive bodies
+        :type inner: str
+        :param chunk: Test particles advanced at a time
+        :type chunk: int
+        :param workers: Threads advancing chunks
+        :type workers: int
+        :return: None
+        :rtype: None
+        """
+        Integrator.__init__(self)
+        if chunk < 1 or workers < 1:
+            raise ValueError('chunk and workers must be at least 1')
+        self.inner = inner
+        self.chunk = chunk
+        self.workers = workers
+        # Test particle - massive body pairs evaluated, in total; the
+        # backend only sees the massive bodies
+        self.pairs = 0
+        self._massive = None
+        self._pool = None
+
+    def reset(self):
+        Integrator.reset(self)
+        self._massive = None
+
+    def options(self):
+        return {'inner': self.inner, 'chunk': self.chunk,
+                'workers': self.workers}
+
+    def close(self):
+        """
+        Stop the worker threads; they are started again when needed.
+        :return: None
+        :rtype: None
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def get_state(self):
+        state = Integrator.get_state(self)
+        if self._massive is not None:
+            state['rows'] = self._rows.copy()
+            state['bodies'] = int(self._bodies)
+            _save_level(state, 'massive.', self._massive, self._integrator)
+        return state
+
+    def set_state(self, state):
+        Integrator.set_state(self, state)
+        self._massive = None
+        if 'rows' not in state:
+            return
+        massive = np.zeros(int(state['bodies']), bool)
+        massive[np.array(state['rows'], int)] = True
+        self._split(massive)
+        self._massive, self._integrator = _load_level(state, 'massive.',
+                                                      self.inner)
+
+    def _split(self, massive):
+        """
+        Rows of the massive bodies, and chunks of test particles.
+        """
+        self._bodies = len(massive)
+        self._rows = np.flatnonzero(massive)
+        tests = np.flatnonzero(~massive)
+        if len(tests) and tests[-1] - tests[0] + 1 == len(tests):
+            # Contiguous test particles are updated in place, through views
+            self._chunks = [slice(start, min(start + self.chunk,
+                                             tests[-1] + 1))
+                            for start in range(tests[0], tests[-1] + 1,
+                                               self.chunk)]
+        else:
+            self._chunks = [tests[start:start + self.chunk]
+                            for start in range(0, len(tests), self.chunk)]
+
+    def _build(self, store):
+        """
+        Split the store into the massive bodies and chunks of test
+        particles.
+        """
+        self._split(store.masses > 0)
+        rows = self._rows
+        self._massive = BodyStore.from_arrays(store.positions[rows],
+                                              store.velocities[rows],
+                                              store.masses[rows],
+                                              store.radii[rows])
+        self._integrator = make_integrator(self.inner)
+
+    def step(self, store, forces, dt):
+        fresh = self.fresh and self._massive is not None
+        if not fresh:
+            self._build(store)
+        massive = self._massive
+        x0 = massive.positions.copy()
+        self._integrator.step(massive, forces, dt)
+        x1, m = massive.positions, massive.masses
+        G, softening = forces.G, forces.softening
+
+        def advance(rows):
+            x, v = store.positions[rows], store.velocities[rows]
+            a = store.accelerations[rows]
+            if not fresh:
+                direct_sum(x0, m, G, softening, targets=x, out=a)
+            v += a * (dt / 2)
+            x += v * dt
+            direct_sum(x1, m, G, softening, targets=x, out=a)
+            v += a * (dt / 2)
+            if not isinstance(rows, slice):
+                store.positions[rows] = x
+                store.velocities[rows] = v
+                store.accelerations[rows] = a
+
+        if self.workers > 1 and len(self._chunks) > 1:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers)
+            for _ in self._pool.map(advance, self._chunks):
+                pass
+        else:
+            for rows in self._chunks:
+                advance(rows)
+        self.pairs += (1 if fresh else 2) * (len(store) - len(m)) * \
+            np.count_nonzero(m)
+        store.positions[self._rows] = massive.positions
+        store.velocities[self._rows] = massive.velocities
+        store.accelerations[self._rows] = massive.accelerations
+        self.fresh = True
+
+
+INTEGRATORS = {cls.name: cls for cls in
+               (Euler, Leapfrog, VelocityVerlet, Yoshida4, BlockTimesteps,
+                WisdomHolman, Hierarchical, TestParticles)}
+
+
+def make_integrator(name='leapfrog', **options):
+    """
+    Construct an integrator by name.
+    :param name: 'euler', 'leapfrog', 'verlet', 'yoshida4', 'block',
+        'wisdom-holman', 'hierarchical' or 'test-particles'
+    :type name: str
+    :param options: Keyword arguments for the integrator (eta, ...)
+    :return: A fresh integrator
+    :rtype: Integrator
+    """
+    try:
+        return INTEGRATORS[name](**options)
+    except KeyError:
+        raise ValueError('unknown integrator: ' + repr(name))
@@ -0,0 +1,312 @@
+"""
+Direct summation compiled with numba, when numba is installed.
+
+    forces = make_backend('numba')
+
+The numpy kernel of forces builds (block, N, D) temporaries and at
+N ~ 1e4 spends its time moving them through memory.  The compiled pair
+loop keeps nothing but the state arrays: it visits every pair once and
+applies the force to both bodies (Newton's third law), tile against tile
+so the bodies of both tiles stay in cache, with the tiles spread over
+threads by prange.  The triangle of tile pairs is folded (row tile k with
+row tile T - 1 - k) so every work item costs about the same.
+
+Each work item adds into one of SLOTS accumulators and the accumulators
+are summed in a fixed order afterwards.  The number of accumulators does
+not depend on the number of threads, so neither do the results.  They
+match the numpy kernel up to rounding.
+
+The kernels below are plain Python; numba is imported and they are
+compiled on first use.  Without numba, NumbaDirect uses the numpy kernels
+of forces instead.
+"""
+import numpy as np
+
+from .forces import DirectSum, G, potential_energy
+
+# Bodies per tile of the pair loop
+TILE = 64
+# Accumulators the pair loop adds into (fixed, rather than one per thread,
+# so the order of summation is the same however many threads run)
+SLOTS = 32
+
+# Replaced by numba.prange before the kernels are compiled
+prange = range
+
+_KERNELS = None
+
+
+def pair_accelerations(positions, masses, eps2, acc, phi, potentials):
+    """
+    Every pair once, tile by tile; acc[s] and phi[s] receive the
+    accelerations and potentials (without G) of the pairs of slot s.
+    """
+    n, dim = positions.shape
+    tiles = (n + TILE - 1) // TILE
+    work = (tiles + 1) // 2
+    slots = acc.shape[0]
+    for slot in prange(slots):
+        acc[slot] = 0.0
+        phi[slot] = 0.0
+        a_i = np.empty(dim)
+        for k in range(slot, work, slots):
+            for side in range(2):
+                t = k if side == 0 else tiles - 1 - k
+                if side == 1 and t == k:
+                    break
+                i0 = t * TILE
+                i1 = min(n, i0 + TILE)
+                for u in range(t, tiles):
+                    j0 = u * TILE
+                    j1 = min(n, j0 + TILE)
+                    for i in range(i0, i1):
+                        m_i = masses[i]
+                        a_i[:] = 0.0
+                        phi_i = 0.0
+                        for j in range(max(j0, i + 1), j1):
+                            m_j = masses[j]
+                            if m_i == 0.0 and m_j == 0.0:
+                                continue
+                            r2 = 0.0
+                            for c in range(dim):
+                                d = positions[j, c] - positions[i, c]
+                                r2 += d * d
+                            # A body does not act on itself (or on one at
+                            # the same position), softened or not
+                            if r2 == 0.0:
+                                continue
+                            inv_r = 1.0 / np.sqrt(r2 + eps2)
+                            inv_r3 = inv_r * inv_r * inv_r
+                            for c in range(dim):
+                                f = (positions[j, c] - positions[i, c]) * \
+                                    inv_r3
+                                a_i[c] += m_j * f
+                                acc[slot, j, c] -= m_i * f
+                            if potentials:
+                                phi_i -= m_j * inv_r
+                                phi[slot, j] -= m_i * inv_r
+                        for c in range(dim):
+                            acc[slot, i, c] += a_i[c]
+                        phi[slot, i] += phi_i
+
+
+def reduce_slots(acc, phi, G, out, potentials, phi_out):
+    """
+    out = G * acc summed over slots (and phi_out likewise), slot 0 first.
+    """
+    slots, n, dim = acc.shape
+    for i in prange(n):
+        for c in range(dim):
+            total = 0.0
+            for s in range(slots):
+                total += acc[s, i, c]
+            out[i, c] = G * total
+        if potentials:
+            total = 0.0
+            for s in range(slots):
+                total += phi[s, i]
+            phi_out[i] = G * total
+
+
+def target_accelerations(positions, masses, targets, eps2, G, out,
+                         potentials, phi_out):
+    """
+    Accelerations at the targets due to the (massive) sources, one target
+    per iteration, for evaluating a few rows or points.
+    """
+    n, dim = positions.shape
+    for i in prange(len(targets)):
+        for c in range(dim):
+            out[i, c] = 0.0
+        phi_i = 0.0
+        for j in range(n):
+            r2 = 0.0
+            for c in range(dim):
+                d = positions[j, c] - targets[i, c]
+                r2 += d * d
+            if r2 == 0.0:
+                continue
+            inv_r = 1.0 / np.sqrt(r2 + eps2)
+            f = masses[j] * inv_r * inv_r * inv_r
+            for c in range(dim):
+                out[i, c] += f * (positions[j, c] - targets[i, c])
+            phi_i -= masses[j] * inv_r
+        for c in range(dim):
+            out[i, c] *= G
+        if potentials:
+            phi_out[i] = G * phi_i
+
+
+def pair_potentials(positions, masses, eps2, rows):
+    """
+    rows[i] = m_i * sum over j > i of m_j / r_ij, every pair once.
+    """
+    n, dim = positions.shape
+    for i in prange(n):
+        total = 0.0
+        for j in range(i + 1, n):
+            r2 = 0.0
+            for c in range(dim):
+                d = positions[j, c] - positions[i, c]
+                r2 += d * d
+            if r2 > 0.0:
+                total += masses[j] / np.sqrt(r2 + eps2)
+        rows[i] = masses[i] * total
+
+
+def kick_drift(positions, velocities, accelerations, h):
+    """
+    Half a kick and a whole drift of a leapfrog substep of length h.
+    """
+    n, dim = positions.shape
+    for i in prange(n):
+        for c in range(dim):
+            velocities[i, c] += accelerations[i, c] * (h / 2)
+            positions[i, c] += velocities[i, c] * h
+
+
+def kick(velocities, accelerations, h):
+    """
+    velocities += accelerations * h
+    """
+    n, dim = velocities.shape
+    for i in prange(n):
+        for c in range(dim):
+            velocities[i, c] += accelerations[i, c] * h
+
+
+def kernels():
+    """
+    Compile the kernels of this module, once.
+    :return: The compiled kernels by name, or None if numba is missing
+    :rtype: dict
+    """
+    global _KERNELS, prange
+    if _KERNELS is None:
+        try:
+            import numba
+        except ImportError:
+            _KERNELS = {}
+        else:
+            prange = numba.prange
+            compile = numba.njit(parallel=True, cache=True)
+            _KERNELS = {f.__name__: compile(f) for f in
+                        (pair_accelerations, reduce_slots,
+                         target_accelerations, pair_potentials, kick_drift,
+                         kick)}
+    return _KERNELS or None
+
+
+def available():
+    """
+    :return: Whether numba is installed, so the compiled kernels are used
+    :rtype: bool
+    """
+    return kernels() is not None
+
+
+class NumbaDirect(DirectSum):
+    """
+    Direct summation with the compiled kernels of this module; otherwise
+    the same backend as DirectSum.  Without numba (compiled is False) it
+    runs the numpy kernels.
+
+    Besides the backend interface it offers potential_energy() and
+    leapfrog_substep(), which the diagnostics and the leapfrog family of
+    integrators use when the backend has them.
+    """
+    name = 'numba'
+
+    def __init__(self, G=G, softening=0.0):
+        """
+        :param G: Gravitational constant
+        :type G: float
+        :param softening: Plummer softening length
+        :type softening: float
+        :return: None
+        :rtype: None
+        """
+        DirectSum.__init__(self, G, softening)
+        self.kernels = kernels()
+        self.compiled = self.kernels is not None
+        self._acc = self._phi = None
+
+    def evaluate(self, positions, masses, targets=None, out=None,
+                 potentials=None):
+        if not self.compiled:
+            return DirectSum.evaluate(self, positions, masses, targets, out,
+                                      potentials)
+        positions = np.ascontiguousarray(positions, dtype=float)
+        masses = np.ascontiguousarray(masses, dtype=float)
+        eps2 = float(self.softening) ** 2
+        keep = potentials is not None
+        if targets is not None:
+            targets = np.ascontiguousarray(targets, dtype=float)
+            if out is None:
+                out = np.empty_like(targets)
+            massive = masses > 0
+            self.kernels['target_accelerations'](
+                positions[massive], masses[massive], targets, eps2,
+                float(self.G), out, keep,
+                potentials if keep else np.empty(0))
+            return out
+        n, dim = positions.shape
+        if out is None:
+            out = np.empty_like(positions)
+        tiles = (n + TILE - 1) // TILE
+        slots = max(1, min(SLOTS, (tiles + 1) // 2))
+        if self._acc is None or self._acc.shape != (slots, n, dim):
+            self._acc = np.empty((slots, n, dim))
+            self._phi = np.empty((slots, n))
+        self.kernels['pair_accelerations'](positions, masses, eps2,
+                                           self._acc, self._phi, keep)
+        self.kernels['reduce_slots'](self._acc, self._phi, float(self.G),
+                                     out, keep,
+                                     potentials if keep else np.empty(0))
+        return out
+
+    def potential_energy(self, positions, masses):
+        """
+        :return: Total potential energy (J), as forces.potential_energy
+        :rtype: float
+        """
+        if not self.compiled:
+            return potential_energy(positions, masses, self.G,
+                                    self.softening)
+        masses = np.asarray(masses, dtype=float)
+        massive = masses > 0
+        rows = np.empty(int(massive.sum()))
+        self.kernels['pair_potentials'](
+            np.ascontiguousarray(np.asarray(positions, dtype=float)[massive]),
+            np.ascontiguousarray(masses[massive]),
+            float(self.softening) ** 2, rows)
+        return -self.G * rows.sum()
+
+    def leapfrog_substep(self, store, h, forces=None):
+        """
+        One kick-drift-kick substep of length h.  store.accelerations must
+        belong to the current positions, and belong to the new ones after.
+        :param store: The bodies
+        :type store: BodyStore
+        :param h: Substep (s)
+        :type h: float
+        :param forces: Backend evaluating the accelerations, e.g. a wrapper
+            timing or counting this one (this one if None)
+        :return: None
+        :rtype: None
+        """
+        if forces is None:
+            forces = self
+        if not self.compiled:
+            store.velocities += store.accelerations * (h / 2)
+            store.positions += store.velocities * h
+            forces.accelerations(store.positions, store.masses,
+                                 out=store.accelerations)
+            store.velocities += store.accelerations * (h / 2)
+            return
+        self.kernels['kick_drift'](store.positions, store.velocities,
+                                   store.accelerations, float(h))
+        forces.accelerations(store.positions, store.masses,
+                             out=store.accelerations)
+        self.kernels['kick'](store.velocities, store.accelerations,
+                             float(h) / 2)
@@ -0,0 +1,349 @@
+"""
+Analytic two-body motion: orbital elements and Kepler's equation.
+
+An Orbit holds the classical elements of any number of elliptic or
+hyperbolic orbits about a point mass and gives their positions and
+velocities at any time in O(1), without integrating.  This answers "where
+is Earth at t" directly and is the reference solution N-body runs are
+validated against.
+
+Kepler's equation is solved with Halley's method from Danby's starting
+guess (elliptic) or a logarithmic one (hyperbolic), which converges to
+machine precision in at most a handful of iterations for every e and M.
+"""
+import numpy as np
+
+from .forces import G
+
+
+def eccentric_anomaly(M, e, tol=1e-12, max_iter=32):
+    """
+    Solve Kepler's equation, vectorized.
+
+    Elliptic orbits (e < 1): M = E - e sin E.  Hyperbolic orbits (e > 1):
+    M = e sinh H - H.  M and e broadcast against each other and may mix
+    both kinds.
+
+    :param M: Mean anomaly (rad)
+    :type M: float | numpy.ndarray
+    :param e: Eccentricity; not exactly 1
+    :type e: float | numpy.ndarray
+    :param tol: Stop once the last correction, relative to 1 + |E|, is
+        below this; convergence is cubic, so the result is then exact to
+        machine precision
+    :type tol: float
+    :param max_iter: Give up after this many iterations
+    :type max_iter: int
+    :return: Eccentric anomaly E (hyperbolic: H), with the elliptic result
+        in the same revolution as M
+    :rtype: numpy.ndarray
+    """
+    M, e = np.broadcast_arrays(np.asarray(M, float), np.asarray(e, float))
+    if np.any(e == 1):
+        raise ValueError('parabolic orbits (e = 1) are not supported')
+    elliptic = e < 1
+    # Elliptic anomalies are solved in [-pi, pi) and shifted back
+    turns = np.where(elliptic, np.floor((M + np.pi) / (2 * np.pi)), 0.0)
+    m = M - 2 * np.pi * turns
+    E = np.where(elliptic, m + 0.85 * e * np.sign(m),
+                 np.sign(m) * np.log(2 * np.abs(m) / np.maximum(e, 1) + 1.8))
+    todo = np.flatnonzero(np.ones(E.shape, bool))
+    E, m, e, elliptic = E.ravel(), m.ravel(), e.ravel(), elliptic.ravel()
+    for _ in range(max_iter):
+        x, ee, ell = E[todo], e[todo], elliptic[todo]
+        s = np.where(ell, np.sin(x), np.sinh(x))
+        c = np.where(ell, np.cos(x), np.cosh(x))
+        f = np.where(ell, x - ee * s, ee * s - x) - m[todo]
+        df = np.where(ell, 1 - ee * c, ee * c - 1)
+        step = f / (df - 0.5 * f * ee * s / df)
+        E[todo] = x - step
+        todo = todo[np.abs(step) > tol * (1 + np.abs(x))]
+        if not len(todo):
+            break
+    else:
+        raise RuntimeError('Kepler solver did not converge')
+    return (E + 2 * np.pi * turns.ravel()).reshape(M.shape)
+
+
+def true_anomaly(E, e):
+    """
+    :param E: Eccentric anomaly (hyperbolic: H) (rad)
+    :param e: Eccentricity
+    :return: True anomaly in (-pi, pi] (rad)
+    :rtype: numpy.ndarray
+    """
+    E, e = np.broadcast_arrays(np.asarray(E, float), np.asarray(e, float))
+    with np.errstate(invalid='ignore'):
+        elliptic = 2 * np.arctan2(np.sqrt(1 + e) * np.sin(E / 2),
+                                  np.sqrt(1 - e) * np.cos(E / 2))
+        hyperbolic = 2 * np.arctan(np.sqrt((e + 1) / (e - 1)) *
+                                   np.tanh(E / 2))
+    return np.where(e < 1, elliptic, hyperbolic)
+
+
+def mean_anomaly(nu, e):
+    """
+    :param nu: True anomaly (rad)
+    :param e: Eccentricity
+    :return: Mean anomaly (rad), in (-pi, pi] for elliptic orbits
+    :rtype: numpy.ndarray
+    """
+    nu, e = np.broadcast_arrays(np.asarray(nu, float), np.asarray(e, float))
+    with np.errstate(invalid='ignore'):
+        E = 2 * np.arctan2(np.sqrt(1 - e) * np.sin(nu / 2),
+                           np.sqrt(1 + e) * np.cos(nu / 2))
+        H = 2 * np.arctanh(np.sqrt((e - 1) / (e + 1)) * np.tan(nu / 2))
+        return np.where(e < 1, E - e * np.sin(E), e * np.sinh(H) - H)
+
+
+class Orbit:
+    """
+    Classical orbital elements of one or many two-body orbits.
+
+    All elements broadcast against each other, so one Orbit can describe
+    a whole population (e.g. every planet about the Sun); angles are in
+    degrees.  Hyperbolic orbits have a < 0 and e > 1.
+    """
+    dim = 3  # components of the vectors state() returns
+
+    def __init__(self, a, e, i, O, o, nu, mu=G * 1.9891e30, t0=0.0):
+        """
+        a. Semi Major Axis. Size. Half of the length (in meters) of the major axis.
+        e. Eccentricity. Shape. Depends on r of the periapsis, r of apoapsis, and length of (a)
+        i. Inclination. Tilt. Inclination in degrees from the equatorial plane to the orbital plane.
+        O. Longitude of the Ascending Node. Swivel. Angle between vernal equinox and the AN.
+        o. Argument of Periapsis. Location of periapsis.  Angle from AN to periapsis, CCW from North
+        nu. True Anomaly. Position. The angle in degrees from orbit's periapsis to orbiting body.
+        mu. Gravitational parameter G (M + m) of the pair (m^3 s^-2); the Sun's by default.
+
+        :param a: Semi-major axis (m); negative for hyperbolic orbits
+        :param e: Eccentricity
+        :param i: Inclination (degrees)
+        :param O: Longitude of the ascending node (degrees)
+        :param o: Argument of periapsis (degrees)
+        :param nu: True anomaly at t0 (degrees)
+        :param mu: Gravitational parameter (m^3 s^-2)
+        :param t0: Epoch of the elements (s)
+        :return: None
+        :rtype: None
+        """
+        (self.a, self.e, self.i, self.O, self.o, self.nu, self.mu,
+         self.t0) = np.broadcast_arrays(*[np.asarray(x, float) for x in
+                                          (a, e, i, O, o, nu, mu, t0)])
+        if np.any(self.e == 1):
+            raise ValueError('parabolic orbits (e = 1) are not supported')
+        if np.any((self.a < 0) != (self.e > 1)):
+            raise ValueError('a must be negative exactly when e > 1')
+        self.M0 = mean_anomaly(np.radians(self.nu), self.e)
+
+    @classmethod
+    def from_state(cls, position, velocity, mu, t0=0.0):
+        """
+        Elements of the orbits through given relative states.
+
+        Undefined angles are set to zero: O for equatorial orbits (the
+        periapsis is then measured from +x) and o for circular ones (the
+        anomaly is then measured from the node).
+
+        :param position: (..., 2) or (..., 3) position relative to the
+            central body (m)
+        :type position: numpy.ndarray
+        :param velocity: Relative velocity, same shape (m/s)
+        :type velocity: numpy.ndarray
+        :param mu: Gravitational parameter G (M + m) (m^3 s^-2)
+        :param t0: Time of the states (s)
+        :return: The orbits
+        :rtype: Orbit
+        """
+        r = np.asarray(position, float)
+        v = np.asarray(velocity, float)
+        if r.shape[-1] == 2:
+            r = np.concatenate([r, np.zeros(r.shape[:-1] + (1,))], axis=-1)
+            v = np.concatenate([v, np.zeros(v.shape[:-1] + (1,))], axis=-1)
+        mu = np.asarray(mu, float)
+        r_mag = np.linalg.norm(r, axis=-1)
+        h = np.cross(r, v)
+        h_mag = np.linalg.norm(h, axis=-1)
+        e_vec = np.cross(v, h) / mu[..., None] - r / r_mag[..., None]
+        e = np.linalg.norm(e_vec, axis=-1)
+        energy = 0.5 * np.einsum('...k,...k', v, v) - mu / r_mag
+        a = -mu / (2 * energy)
+        i = np.arccos(np.clip(h[..., 2] / h_mag, -1, 1))
+        # Line of nodes; +x when the orbit is equatorial
+        node = np.stack([-h[..., 1], h[..., 0], np.zeros_like(h_mag)], -1)
+        node_mag = np.linalg.norm(node, axis=-1)
+        equatorial = node_mag <= 1e-12 * h_mag
+        node = np.where(equatorial[..., None], [1.0, 0.0, 0.0],
+                        node / np.where(equatorial, 1, node_mag)[..., None])
+        O = np.arctan2(node[..., 1], node[..., 0])
+        in_plane = np.cross(h / h_mag[..., None], node)
+        o = np.arctan2(np.einsum('...k,...k', e_vec, in_plane),
+                       np.einsum('...k,...k', e_vec, node))
+        o = np.where(e <= 1e-12, 0.0, o)
+        u = np.arctan2(np.einsum('...k,...k', r, in_plane),
+                       np.einsum('...k,...k', r, node))
+        orbit = cls(a, e, np.degrees(i), np.degrees(O), np.degrees(o),
+                    np.degrees(u - o), mu, t0)
+        orbit.dim = np.shape(position)[-1]
+        return orbit
+
+    @property
+    def mean_motion(self):
+        """
+        :return: Mean motion (rad/s)
+        :rtype: numpy.ndarray
+        """
+        return np.sqrt(self.mu / np.abs(self.a) ** 3)
+
+    @property
+    def period(self):
+        """
+        :return: Orbital period (s); inf for hyperbolic orbits
+        :rtype: numpy.ndarray
+        """
+        return np.where(self.e < 1, 2 * np.pi / self.mean_motion, np.inf)
+
+    def true_anomaly(self, t):
+        """
+        :param t: Time (s); broadcasts against the elements
+        :return: True anomaly at t (degrees)
+        :rtype: numpy.ndarray
+        """
+        M = self.M0 + self.mean_motion * (np.asarray(t, float) - self.t0)
+        return np.degrees(true_anomaly(eccentric_anomaly(M, self.e), self.e))
+
+    def state(self, t):
+        """
+        Positions and velocities relative to the central body at time t.
+
+        t broadcasts against the elements: pass t[:, None] to get every
+        orbit at every time.
+
+        :param t: Time (s)
+        :type t: float | numpy.ndarray
+        :return: (..., dim) positions (m) and velocities (m/s)
+        :rtype: tuple
+        """
+        nu = np.radians(self.true_anomaly(t))
+        e, a = self.e, self.a
+        p = a * (1 - e ** 2)
+        r = p / (1 + e * np.cos(nu))
+        w = np.sqrt(self.mu / p)
+        # Perifocal frame: P towards periapsis, Q along the motion there
+        O, i, o = np.radians(self.O), np.radians(self.i), np.radians(self.o)
+        cO, sO, ci, si, co, so = (np.cos(O), np.sin(O), np.cos(i), np.sin(i),
+                                  np.cos(o), np.sin(o))
+        P = np.stack([cO * co - sO * so * ci, sO * co + cO * so * ci,
+                      so * si], -1)
+        Q = np.stack([-cO * so - sO * co * ci, -sO * so + cO * co * ci,
+                      co * si], -1)
+        x, y = r * np.cos(nu), r * np.sin(nu)
+        vx, vy = -w * np.sin(nu), w * (e + np.cos(nu))
+        position = x[..., None] * P + y[..., None] * Q
+        velocity = vx[..., None] * P + vy[..., None] * Q
+        return position[..., :self.dim], velocity[..., :self.dim]
+
+
+def stumpff(z):
+    """
+    Stumpff functions C(z) and S(z) of the universal-variable formulation,
+    with series near z = 0 where the closed forms cancel.
+    :param z: alpha * chi^2
+    :type z: numpy.ndarray
+    :return: C(z), S(z)
+    :rtype: tuple
+    """
+    z = np.asarray(z, float)
+    C = np.empty_like(z)
+    S = np.empty_like(z)
+    small = np.abs(z) < 0.1
+    zs = z[small]
+    C[small] = 1 / 2 - zs * (1 / 24 - zs * (1 / 720 - zs * (1 / 40320 -
+                                                            zs / 3628800)))
+    S[small] = 1 / 6 - zs * (1 / 120 - zs * (1 / 5040 - zs * (1 / 362880 -
+                                                              zs / 39916800)))
+    pos = z >= 0.1
+    s = np.sqrt(z[pos])
+    C[pos] = (1 - np.cos(s)) / z[pos]
+    S[pos] = (s - np.sin(s)) / s ** 3
+    neg = z <= -0.1
+    s = np.sqrt(-z[neg])
+    C[neg] = (np.cosh(s) - 1) / -z[neg]
+    S[neg] = (np.sinh(s) - s) / s ** 3
+    return C, S
+
+
+def kepler_drift(position, velocity, mu, dt, tol=1e-12, max_iter=50):
+    """
+    Advance two-body states by dt along their Kepler orbits, vectorized.
+
+    Uses the universal variable chi (Goodyear 1965) and Lagrange's f and g
+    functions, so elliptic, parabolic and hyperbolic orbits are handled
+    alike without ever computing elements.  The universal Kepler equation
+    is solved with the Laguerre-Conway iteration, which converges from
+    chi = sqrt(mu) dt / r0 (exact for short steps) or, on hyperbolic orbits
+    when smaller, the logarithmic guess of Vallado (2013).
+
+    :param position: (N, D) positions relative to the central body (m)
+    :type position: numpy.ndarray
+    :param velocity: (N, D) relative velocities (m/s)
+    :type velocity: numpy.ndarray
+    :param mu: Gravitational parameter of the central body, scalar or (N,)
+    :param dt: Time to advance (s), scalar or (N,)
+    :param tol: Stop once the last correction to chi, relative to
+        1 + |chi|, is below this (cubic convergence: machine precision)
+    :param max_iter: Give up after this many iterations
+    :return: New positions and velocities
+    :rtype: tuple
+    """
+    r0v = np.asarray(position, float)
+    v0v = np.asarray(velocity, float)
+    mu = np.broadcast_to(np.asarray(mu, float), r0v.shape[:-1])
+    dt = np.broadcast_to(np.asarray(dt, float), r0v.shape[:-1])
+    r0 = np.sqrt(np.einsum('...k,...k', r0v, r0v))
+    sqrt_mu = np.sqrt(mu)
+    sigma0 = np.einsum('...k,...k', r0v, v0v) / sqrt_mu  # r0 . v0 / sqrt(mu)
+    alpha = 2 / r0 - np.einsum('...k,...k', v0v, v0v) / mu  # 1 / a
+    beta = 1 - alpha * r0
+    # Whole revolutions of elliptic orbits change nothing
+    with np.errstate(invalid='ignore'):
+        period = 2 * np.pi / np.sqrt(mu * alpha ** 3)
+    dt = np.where(alpha > 0, dt - period * np.round(dt / period), dt)
+    target = sqrt_mu * dt
+    chi = target / r0
+    hyperbolic = alpha < 0
+    if np.any(hyperbolic):
+        a = 1 / alpha[hyperbolic]
+        sign = np.sign(dt[hyperbolic])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            guess = sign * np.sqrt(-a) * np.log(
+                -2 * mu[hyperbolic] * alpha[hyperbolic] * dt[hyperbolic] /
+                (sigma0[hyperbolic] * sqrt_mu[hyperbolic] + sign *
+                 np.sqrt(-mu[hyperbolic] * a) * beta[hyperbolic]))
+        short = chi[hyperbolic]
+        chi[hyperbolic] = np.where(np.abs(guess) < np.abs(short), guess,
+                                   short)
+    n = 5.0
+    for _ in range(max_iter):
+        z = alpha * chi * chi
+        C, S = stumpff(z)
+        F = sigma0 * chi * chi * C + beta * chi ** 3 * S + r0 * chi - target
+        dF = sigma0 * chi * (1 - z * S) + beta * chi * chi * C + r0
+        d2F = sigma0 * (1 - z * C) + beta * chi * (1 - z * S)
+        root = np.sqrt(np.abs((n - 1) ** 2 * dF * dF - n * (n - 1) * F * d2F))
+        step = n * F / (dF + np.copysign(root, dF))
+        chi = chi - step
+        if np.all(np.abs(step) <= tol * (1 + np.abs(chi))):
+            break
+    else:
+        raise RuntimeError('universal Kepler solver did not converge')
+    z = alpha * chi * chi
+    C, S = stumpff(z)
+    f = 1 - chi * chi / r0 * C
+    g = dt - chi ** 3 / sqrt_mu * S
+    r1v = f[..., None] * r0v + g[..., None] * v0v
+    r1 = np.sqrt(np.einsum('...k,...k', r1v, r1v))
+    fdot = sqrt_mu / (r1 * r0) * chi * (z * S - 1)
+    gdot = 1 - chi * chi / r1 * C
+    v1v = fdot[..., None] * r0v + gdot[..., None] * v0v
+    return r1v, v1v
@@ -1,57 +1,58 @@
+"""
+A year of Earth around the sun, checked against the analytic two-body
+orbit and drawn with vpython; run it as a script, or call main().  vpython
+is only imported when the orbit is drawn.
+"""
 from __future__ import print_function, division
-from vpython import *
 
-scene.userzoom = True
-scene.userspin = True
-scene.width = 1600
-scene.height = 900
+import math
+
+import numpy as np
+
+from orbits.forces import direct_sum, make_backend
+from orbits.integrators import make_integrator
+from orbits.kepler import Orbit
+from orbits.state import BodyStore, row_property
 
 VISIBLE_RADIUS_MULTIPLIER = 10
 G = 6.674e-11
 
-class Orbit:
-    def __init__(self, a, e, i, O, o, mu):
-        """
-        a. Semi Major Axis. Size. Half of the length (in meters) of the major axis.
-        e. Eccentricity. Shape. Depends on r of the periapsis, r of apoapsis, and length of (a)
-        i. Inclination. Tilt. Inclination in degrees from the equatorial plane to the orbital plane.
-        O. Longitude of the Ascending Node. Swivel. Angle between vernal equinox and the AN.
-        o. Argument of Periapsis. Location of periapsis.  Angle from AN to periapsis, CCW from North
-        mu. True Anomaly. Position. The angle in degrees from orbit’s periapsis to orbiting body.
-
-        :param a:
-        :param e:
-        :param i:
-        :param O:
-        :param o:
-        :param mu:
-        """
-        a, e, i, O, o, mu = a, e, i, O, o, mu
+# Bodies made outside main() keep their state in a row of this store
+STORE = BodyStore(dim=3)
 
 
 class Body:
-    def __init__(self, position, velocity, mass, radius, shape=sphere, color=color.red):
-        self.position = vector(*position)
-        self.velocity = vector(*velocity)
-        self.force = vector(0, 0, 0)
-        self.mass = mass
-        self.radius = radius
+    def __init__(self, position, velocity, mass, radius, shape=None, color=None, store=None):
+        self.store = STORE if store is None else store
+        self.index = self.store.add(position, velocity, mass, radius)
+        self.force = np.zeros(3)
         self.color = color
 
-        self.model = shape(pos=self.position, radius=self.radius * VISIBLE_RADIUS_MULTIPLIER,
-                           color=self.color)
+        # A vpython object (e.g. vpython.sphere) when drawn, else None
+        self.model = None
+        if shape is not None:
+            from vpython import vector
+            self.model = shape(pos=vector(*self.position), radius=self.radius * VISIBLE_RADIUS_MULTIPLIER,
+                               color=self.color)
+
+    mass = row_property('masses')
+    radius = row_property('radii')
+    position = row_property('positions')
+    velocity = row_property('velocities')
 
     def queue_force(self, force_vector):
         raise NotImplementedError('Body.apply_force not implemented yet')
 
     def update_position(self):
-        self.model.pos = self.position
+        if self.model is not None:
+            from vpython import vector
+            self.model.pos = vector(*self.position)
 
 
 def r_to_xyz(azimuth, polar, radius):
-    x = radius * cos(azimuth) * sin(polar)
-    y = radius * sin(azimuth) * sin(polar)
-    z = radius * cos(polar)
+    x = radius * math.cos(azimuth) * math.sin(polar)
+    y = radius * math.sin(azimuth) * math.sin(polar)
+    z = radius * math.cos(polar)
     return (x, y, z)
 
 
@@ -62,25 +63,67 @@ def calc_grav(body_1, body_2):
     :param body_2:
     :return:
     """
-    relative_position = body_2.position - body_1.position
-    unit_vector = relative_position / relative_position.mag
-    force = (-G * body_1.mass * body_2.mass / relative_position.mag ** 2) * unit_vector
-    return force
+    accel = direct_sum(body_1.store.positions[[body_1.index]], [body_1.mass], G,
+                       targets=body_2.store.positions[[body_2.index]])[0]
+    return accel * body_2.mass
 
-sun = Body((0, 0, 0), (0, 0, 0), 1.988e30, 6.957e8, sphere, color.red)
 
-earth_pos = r_to_xyz(0, radians(90 - 7.155), 1.521e11)
+# Leapfrog keeps Earth's orbit closed at an hour per step, where Euler
+# needed one-second steps to keep it from spiralling.
+FORCES = make_backend('direct', G=G)
+INTEGRATOR = make_integrator('leapfrog')
+dt = 60 * 60
 
-earth = Body(earth_pos, (0, 2.93e4, 0), 5.972e24, 6.371e8, sphere, color.blue)
 
-dt = 1
-
-for i in range(0, 367 * 24 * 60 * 60, dt):
-    grav_force = calc_grav(sun, earth)
-    grav_accel = grav_force / earth.mass
-    earth.velocity += (grav_accel * dt)
-    earth.position += (earth.velocity * dt)
-    earth.update_position()
-    if i % (24 * 60 * 60) == 0:
-        print("day {0}".format(i / (24 * 60 * 60)))
-        print(earth.velocity, earth.position)
+def main(render=True, days=367, store=None):
+    """
+    Integrate the orbit, printing it (and the analytic solution it is
+    checked against) once a simulated day.
+    :param render: Draw the bodies with vpython
+    :type render: bool
+    :param days: Days to integrate
+    :type days: int
+    :param store: State store to keep the two bodies in (a new one if None)
+    :type store: BodyStore
+    :return: The sun and Earth
+    :rtype: tuple[Body, Body]
+    """
+    if store is None:
+        store = BodyStore(dim=3)
+    shape = red = blue = None
+    if render:
+        from vpython import color, scene, sphere
+        scene.userzoom = True
+        scene.userspin = True
+        scene.width = 1600
+        scene.height = 900
+        shape, red, blue = sphere, color.red, color.blue
+
+    sun = Body((0, 0, 0), (0, 0, 0), 1.988e30, 6.957e8, shape, red, store)
+
+    earth_pos = r_to_xyz(0, math.radians(90 - 7.155), 1.521e11)
+
+    earth = Body(earth_pos, (0, 2.93e4, 0), 5.972e24, 6.371e8, shape, blue, store)
+
+    # The analytic two-body solution the integration is checked against
+    earth_orbit = Orbit.from_state(earth.position - sun.position,
+                                   earth.velocity - sun.velocity,
+                                   G * (sun.mass + earth.mass))
+
+    # The vpython models are only refreshed when the state is reported.
+    for i in range(0, days * 24 * 60 * 60, dt):
+        INTEGRATOR.step(store, FORCES, dt)
+        if i % (24 * 60 * 60) == 0:
+            sun.update_position()
+            earth.update_position()
+            print("day {0}".format(i / (24 * 60 * 60)))
+            print(earth.velocity, earth.position)
+            kepler, _ = earth_orbit.state(i + dt)
+            print("Kepler: {0}, off by {1:.3e} m".format(
+                kepler, np.linalg.norm(earth.position - sun.position -
+                                       kepler)))
+    return sun, earth
+
+
+if __name__ == '__main__':
+    main()
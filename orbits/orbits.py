@@ -3,9 +3,12 @@ __author__ = 'Justin'
 import sys, math, random
 import os
 import numpy as np
-import pygame
 from datetime import datetime
 
+from orbits.forces import direct_sum, make_backend
+from orbits.integrators import make_integrator
+from orbits.state import BodyStore, row_property
+
 """
 It occurs to me, thanks to Cameron's insight, that gravitic forces all need to be calculated and then
 applied simultaneously, before the force vector is applied to velocity.  This will be accomplished by
@@ -13,9 +16,9 @@ splitting the function in the Body() class into the following:
 
 1. calculateForce()
 2. applyForce()
-"""
 
-pygame.init()
+Run it as a script, or call main(); pygame is only imported then.
+"""
 
 WINSIZE = [1000, 1000]
 WINCENTER = [500, 500]
@@ -51,96 +54,107 @@ R_EARTH = 6.371e+6  #meters
 timescale_i = 2
 timescale = TIMESCALES[timescale_i]
 
+#'direct' sums every pair; 'barnes-hut' scales to large particle swarms
+FORCES = make_backend('direct', G=G)
+#'leapfrog', 'verlet' and 'yoshida4' are symplectic; 'euler' is the old scheme
+INTEGRATOR = make_integrator('leapfrog')
+
+
+# Every Body keeps its state in a row of this store
+STORE = BodyStore(dim=2)
+
 
 class Body:
     count = 0
-    def __init__(self, name=' ', coordinates=[0.0,0.0], velocity=[0.0,0.0], acceleration=[0.0,0.0], mass=0.0, radius=10.0, color=BLACK):
+    def __init__(self, name=' ', coordinates=[0.0,0.0], velocity=[0.0,0.0], acceleration=[0.0,0.0], mass=0.0, radius=10.0, color=BLACK, store=None):
         self.id = Body.count
         Body.count += 1
         self.name = name
-        self.coordinates = coordinates
-        self.velocity = velocity
-        self.velocity_mag = math.sqrt(velocity[0] ** 2 + velocity[1] ** 2)
+        self.store = STORE if store is None else store
+        self.index = self.store.add(coordinates, velocity, mass, radius, name)
         self.acceleration = acceleration
-        self.acceleration_mag = math.sqrt(acceleration[0] ** 2 + acceleration[1] ** 2)
-        self.mass = mass
-        self.radius = radius
         self.display_position = (((np.array(self.coordinates) / WINSCALE / 2) * WINSIZE) + WINCENTER).astype(int)
         self.display_radius = OBJSIZE
         self.color = color
 
+    coordinates = row_property('positions')
+    velocity = row_property('velocities')
+    acceleration = row_property('accelerations')
+    mass = row_property('masses')
+    radius = row_property('radii')
+
+    @property
+    def velocity_mag(self):
+        return math.sqrt(np.dot(self.velocity, self.velocity))
+
+    @property
+    def acceleration_mag(self):
+        return math.sqrt(np.dot(self.acceleration, self.acceleration))
+
     def sum_forces(self,attractors,timescale=1):
-        self.acceleration = [0.0, 0.0]
-        self.acceleration_mag = 0.0
-        for attractor in attractors:
-            assert isinstance(attractor, Body)
-            if attractor.id != self.id and attractor.mass > 0:
-                self.calculate_force(attractor,timescale)
+        #one kernel call against every attractor; self and massless ones contribute nothing
+        positions = np.array([attractor.coordinates for attractor in attractors])
+        masses = np.array([attractor.mass for attractor in attractors])
+        self.acceleration = direct_sum(positions, masses, G, targets=[self.coordinates])[0]
 
     def apply_forces(self):
-        #apply acceleration against current velocity vector and magnitude (angle = theta for static attractor)
-        self.velocity_mag += self.acceleration_mag
+        #apply acceleration against current velocity vector
         self.velocity += (self.acceleration * timescale)
         #apply velocity against current displacement
         self.coordinates += (self.velocity * timescale)
 
     def calculate_force(self,attractor,timescale=1):
         assert isinstance(attractor, Body)
-        #r - unsigned euclidean distance between self and attractor
-        diff = np.array(self.coordinates) - np.array(attractor.coordinates)
-        r = math.sqrt(np.dot(diff, diff))
-        #g - gravitational field of attractor, as acceleration
-        g = G * (attractor.mass / r**2)
-        #theta - angle of self from the polar axis
-        theta = math.atan2(diff[1],diff[0])
-        #add g to acceleration vector and magnitude
-        self.acceleration_mag -= (g * timescale)
-        self.acceleration += -np.array((g * math.cos(theta), g * math.sin(theta)))
+        #add the attractor's gravitational field, as acceleration, to the acceleration vector
+        self.acceleration += direct_sum([attractor.coordinates], [attractor.mass], G, targets=[self.coordinates])[0]
 
     def update_display(self):
         self.display_position = (((np.array(self.coordinates) / spacescale / WINSCALE) * WINSIZE) + WINCENTER).astype(int)
     
     def draw(self):
+        import pygame
         pygame.draw.circle(screen,self.color,self.display_position,self.display_radius)
         pygame.draw.line(screen, RED, self.display_position, self.display_position+self.acceleration)
         #pygame.draw.line(screen, BLUE, self.display_position, self.display_position+(self.velocity/250))
         label=["acceleration magnitude","acceleration vector","velocity vector"]
         output = font.render(self.name,0,BLACK,WHITE)
         screen.blit(output,(10,(self.id * 60)))
-        for x in xrange(len(label)):
+        for x in range(len(label)):
             output = font.render(label[x]+": "+str(self.acceleration_mag),0,BLACK,WHITE)
             screen.blit(output, (15,(self.id*60)+(15*x)+15))
 
-screen = pygame.display.set_mode(WINSIZE)
+#created by main()
+screen = None
+font = None
 done = False
-clock = pygame.time.Clock()
 
 #define a series of random massed particles
 def make_particles (count):
-    particles = [Body() for x in xrange(count)]
-    for x in xrange(len(particles)):
-        coords = [random.choice(range(-4,-1) + range(1,4)), random.choice(range(-5,-1) + range(1,5))]
-        velocs = [random.choice(range(-4000,1) + range(1,4000)), random.choice(range(-4000,1) + range(1,4000))]
+    particles = []
+    for x in range(count):
+        coords = [random.choice(list(range(-4,-1)) + list(range(1,4))), random.choice(list(range(-5,-1)) + list(range(1,5)))]
+        velocs = [random.choice(list(range(-4000,1)) + list(range(1,4000))), random.choice(list(range(-4000,1)) + list(range(1,4000)))]
         m = random.randint(1,200)
         r = random.randint(1,100)
         c = (random.randint(50,255),random.randint(50,255),random.randint(50,255))
-        particles[x] = Body(np.array(coords)*1e7,velocs,[0.0,0.0],m,r,c)
+        particles.append(Body('Particle #'+str(x),np.array(coords)*1e7,velocs,[0.0,0.0],m,r,c))
     return particles
 
 #make the nine planets according to predefined tables
 def make_planets ():
-    planets = [Body() for x in xrange(len(NAMES))]
-    for x in xrange(len(planets)):
-        planets[x] = Body(NAMES[x],[DIST[x]*1e9,0.0],[0.0,-VELOCS[x]*1e3],[0.0,0.0],MASSES[x]*1e24,RADII[x]*1e3,COLORS[x])
-    return planets
+    #every Body() adds a row to the store, so each planet is made once, with its real values
+    return [Body(NAMES[x],[DIST[x]*1e9,0.0],[0.0,-VELOCS[x]*1e3],[0.0,0.0],MASSES[x]*1e24,RADII[x]*1e3,COLORS[x])
+            for x in range(len(NAMES))]
 
 earth = Body('Earth',[0.0,0.0],[0.0,0.0],[0.0,0.0],M_EARTH,R_EARTH, GREEN)
 moon = Body('Moon',[384399000,0],[0.0,-1022.0],[0.0,0.0],7.3477e22,1.738e6, BLACK)
 sol = Body('Sol',[0.0,0.0],[0.0,0.0],[0.0,0.0],1.988e30,6.96e8,RED)
 
-binary_star = [Body('Star_1', [1.0e11, 0.0],[0.0,4000.0],[0.0,0.0],1.9891e30,695.5e6,GREEN),
-               Body('Star_2', [-1.0e11,0.0],[0.0,-4000.0],[0.0,0.0],1.981e30,695.5e6,RED),
-              Body('Star_3', [0.0,0.0],[0.0,0.0],[0.0,0.0],0,BLACK)]
+#the binary system is integrated on its own, so it gets a store of its own
+BINARY_STORE = BodyStore(dim=2)
+binary_star = [Body('Star_1', [1.0e11, 0.0],[0.0,4000.0],[0.0,0.0],1.9891e30,695.5e6,GREEN,BINARY_STORE),
+               Body('Star_2', [-1.0e11,0.0],[0.0,-4000.0],[0.0,0.0],1.981e30,695.5e6,RED,BINARY_STORE),
+              Body('Star_3', [0.0,0.0],[0.0,0.0],[0.0,0.0],0,0,BLACK,BINARY_STORE)]
 
 particles = make_particles(0)
 planets = make_planets()
@@ -149,35 +163,43 @@ WINSCALE = [max(DIST)*spacescale*1e9,max(DIST)*spacescale*1e9]
 toggle = False
 sim_time = 0
 
-font = pygame.font.Font(None,15)
-screen.fill(WHITE)
-
-while not done:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            done = True
-
-    #clock.tick(10)
+def main():
+    import pygame
+    global screen, font, done, spacescale, timescale_i, timescale
+    pygame.init()
+    screen = pygame.display.set_mode(WINSIZE)
+    clock = pygame.time.Clock()
+    font = pygame.font.Font(None,15)
     screen.fill(WHITE)
-    #basic input for rescaling the display and shifting the timescale
-    keys = pygame.key.get_pressed()
-    if keys[pygame.K_UP]:
-        spacescale *= 2
-    elif keys[pygame.K_DOWN]:
-        spacescale /= 2
-    elif keys[pygame.K_LEFT] and (timescale_i > 0):
-        timescale_i -= 1
-        timescale = TIMESCALES[timescale_i]
-    elif keys[pygame.K_RIGHT] and (timescale_i < (len(TIMESCALES)-1)):
-        timescale_i += 1
-        timescale = TIMESCALES[timescale_i]
-
-    for particle in binary_star:
-        particle.sum_forces(binary_star,timescale)
-
-    for particle in binary_star:
-        particle.apply_forces()
-        particle.update_display()
-        particle.draw()
-
-    pygame.display.flip()
+
+    while not done:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                done = True
+
+        #clock.tick(10)
+        screen.fill(WHITE)
+        #basic input for rescaling the display and shifting the timescale
+        keys = pygame.key.get_pressed()
+        if keys[pygame.K_UP]:
+            spacescale *= 2
+        elif keys[pygame.K_DOWN]:
+            spacescale /= 2
+        elif keys[pygame.K_LEFT] and (timescale_i > 0):
+            timescale_i -= 1
+            timescale = TIMESCALES[timescale_i]
+        elif keys[pygame.K_RIGHT] and (timescale_i < (len(TIMESCALES)-1)):
+            timescale_i += 1
+            timescale = TIMESCALES[timescale_i]
+
+        INTEGRATOR.step(BINARY_STORE, FORCES, timescale)
+
+        for particle in binary_star:
+            particle.update_display()
+            particle.draw()
+
+        pygame.display.flip()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,15 @@
-import pygame
+"""
+Run it as a script, or call main(); pygame is only imported then.
+"""
 import math, sys, random
 import os
 import numpy as np
 from datetime import datetime as datetime
 
+from orbits.forces import make_backend
+from orbits.integrators import make_integrator
+from orbits.state import BodyStore, row_property
+
 DEBUG_CONSOLE_ON = False
 DEBUG_ON = False
 IS_RUNNING = True
@@ -49,6 +55,7 @@ def renderGrid():
     screen.blit(output[3], (SCREEN_X_CENTER, 1))
 
 def render(objects):
+    import pygame
     for object in objects:
         pygame.draw.circle(screen, object.color, [object.display_x, object.display_y], OBJSIZE)
 
@@ -85,72 +92,55 @@ MOON_DIST_AU = [x / AU for x in MOON_DIST]
 MOON_VELOCS_BASE = [8.2e3, 10.9e3, 13.7e3, 17.3e3]
 MOON_VELOCS = [x + VELOCS[4] for x in MOON_VELOCS_BASE]
 
-#Color names
-pygame.init()
-screen = pygame.display.set_mode([SCREEN_X_MAX, SCREEN_Y_MAX])
-font = pygame.font.Font(None, 15)
+#created by main()
+screen = None
+font = None
 done = False
-clock = pygame.time.Clock()
 
 timescale = TIMES['hour']
-max_calcs = 100                 #per body per timestep
+
+#'direct' sums every pair; 'barnes-hut' scales to large particle swarms
+FORCES = make_backend('direct', G=G)
+#'leapfrog', 'verlet' and 'yoshida4' are symplectic; 'euler' is the old scheme
+INTEGRATOR = make_integrator('leapfrog')
+
+#every Body keeps its state in a row of this store
+STORE = BodyStore(dim=2)
 
 class Body:
     count = 0
     #position (dx/dy) * AU, velocity (vx/vy) * m/s,
     #acceleration (ax/ay) * m/s^2, radius * m, and mass * kg
-    def __init__(self, name="", dx=0, dy=0, vx=0, vy=0, radius=0, m=0, color=colors['WHITE'], reference_body="Sol"):
+    def __init__(self, name="", dx=0, dy=0, vx=0, vy=0, radius=0, m=0, color=colors['WHITE'], reference_body="Sol", store=None):
         self.id = Body.count
         if name == "":
             self.name = "Body #" + str(self.id)
         else:
             self.name = name
         Body.count += 1
-        self.dx_au = dx
-        self.dy_au = dy
-        self.dx = dx * AU
-        self.dy = dy * AU
-        self.vx = vx
-        self.vy = vy
-        self.ax = self.ay = 0
-        self.radius = radius
-        self.m = m
+        self.store = STORE if store is None else store
+        self.index = self.store.add([dx * AU, dy * AU], [vx, vy], m, radius, self.name)
         self.display_x = self.display_y = 0
         self.color = color
         self.mapDisplayCoords()
         self.reference_body = reference_body
 
-    #receives a list of bodies and sums the force of each of those bodies
-    def sumForces(self, bodies):
-        for body in bodies:
-            if body.name == self.name or body.m <= 0:
-                continue
-            diffx = self.dx - body.dx
-            diffy = self.dy - body.dy
-            distance = math.sqrt(diffx ** 2 + diffy ** 2)
-            calculations = int(min(max_calcs/(math.log10(distance)), max_calcs))
-            segment_timescale = timescale / calculations
-            for x in xrange(0, timescale, segment_timescale):
-                g = ((G * body.m) / distance ** 2) * segment_timescale
-                theta = math.atan2(diffy, diffx)
-                self.ax -= (g * math.cos(theta))
-                self.ay -= (g * math.sin(theta))
-            #if self.name == "GANYMEDE":
-            #    print (body.name + " ax/ay: " + str(self.ax) + "/" + str(self.ay) + " d: " + str(distance) +
-            #           " g: " + str(g) + " segTime: " + str(segment_timescale))
-
-    #discharge the current acceleration into the velocity
-    def applyForce(self):
-        self.vx += self.ax
-        self.vy += self.ay
-        self.ax = self.ay = 0
-
-    #apply the velocity to the object's displacement
-    def applyVelocity(self):
-        self.dx += self.vx * timescale
-        self.dy += self.vy * timescale
-        self.dx_au = self.dx / AU
-        self.dy_au = self.dy / AU
+    dx = row_property('positions', 0)
+    dy = row_property('positions', 1)
+    vx = row_property('velocities', 0)
+    vy = row_property('velocities', 1)
+    ax = row_property('accelerations', 0)
+    ay = row_property('accelerations', 1)
+    m = row_property('masses')
+    radius = row_property('radii')
+
+    @property
+    def dx_au(self):
+        return self.dx / AU
+
+    @property
+    def dy_au(self):
+        return self.dy / AU
 
     def mapDisplayCoords(self):
         self.display_x = min(SCREEN_X_MAX, max(0, int(self.dx_au * X_BOUND) + SCREEN_X_CENTER))
@@ -169,30 +159,28 @@ class Body:
 
 planets = [Body("Sol", 0, 0, 0, 0, 100, M_SOL)]
 
-for x in xrange(len(VELOCS)):
+for x in range(len(VELOCS)):
     planets.append(Body(NAMES[x], DIST_AU[x], 0, 0, VELOCS[x], 100, MASSES[x], COLORS[x]))
 
-for x in xrange(len(MOON_VELOCS)):
+for x in range(len(MOON_VELOCS)):
     planets.append(Body(MOON_NAMES[x], MOON_DIST_AU[x], 0, 0, MOON_VELOCS[x], 100, MOON_MASSES[x], colors['WHITE'], "J"))
 
 fitScreen(planets)
-renderGrid()
 time_elapsed = 0
 
 def updateSim():
+    import pygame
     #screen.fill(colors['BLACK'])
     renderGrid()
+    #one step of every body at once through the selected integrator
+    INTEGRATOR.step(STORE, FORCES, timescale)
+    if DEBUG_ON:
+        column = [a.makeDebugLines() for a in planets]
     for obj in planets:
-        obj.sumForces(planets)
-        if DEBUG_ON:
-            column = [a.makeDebugLines() for a in planets]
-    for obj in planets:
-        obj.applyForce()
-        obj.applyVelocity()
         obj.mapDisplayCoords()
     if DEBUG_ON:
-        for x in xrange(len(column)):
-            for y in xrange(len(column[x])):
+        for x in range(len(column)):
+            for y in range(len(column[x])):
                 screen.blit(column[x][y], ((x) * 150, 15 * y))
     render(planets)
     global time_elapsed
@@ -201,42 +189,51 @@ def updateSim():
     screen.blit(output, (10, 10))
     pygame.display.flip()
 
-while not done:
-    SINGLE_TICK = False
-
-    for event in pygame.event.get(pygame.QUIT):
-        done = True
-    for event in pygame.event.get(pygame.KEYDOWN):
-        if event.key == pygame.K_KP_MINUS:
-            userScreenResize(COORD_BOUNDS[1] + 1)
-        elif event.key == pygame.K_KP_PLUS:
-            userScreenResize(COORD_BOUNDS[1] - 1)
-        elif event.key == pygame.K_KP8:
-            OBJSIZE += 1
-        elif event.key == pygame.K_KP2 and OBJSIZE > 1:
-            OBJSIZE -= 1
-        elif event.key == pygame.K_KP7:
-            max_calcs += int(max_calcs * .1)
-        elif event.key == pygame.K_KP9:
-            max_calcs -= int(max_calcs * .1)
-        elif event.key == pygame.K_KP_PERIOD:
-            IS_RUNNING = ~IS_RUNNING
-        elif event.key == pygame.K_SPACE:
-            SINGLE_TICK = True
-        elif event.key ==pygame.K_LEFT:
-            userScreenShift(-1, 0)
-        elif event.key == pygame.K_RIGHT:
-            userScreenShift(1, 0)
-        elif event.key == pygame.K_UP:
-            userScreenShift(0, 1)
-        elif event.key == pygame.K_DOWN:
-            userScreenShift(0, -1)
-        elif event.key == pygame.K_ESCAPE:
-            done = True
-        elif event.key == pygame.K_KP5:
-            screen.fill(colors['BLACK'])
-    #clock.tick(1)
+def main():
+    import pygame
+    global screen, font, done, OBJSIZE, IS_RUNNING
+    pygame.init()
+    screen = pygame.display.set_mode([SCREEN_X_MAX, SCREEN_Y_MAX])
+    font = pygame.font.Font(None, 15)
+    clock = pygame.time.Clock()
+    renderGrid()
 
-    if IS_RUNNING or SINGLE_TICK:
-        updateSim()
+    while not done:
         SINGLE_TICK = False
+
+        for event in pygame.event.get(pygame.QUIT):
+            done = True
+        for event in pygame.event.get(pygame.KEYDOWN):
+            if event.key == pygame.K_KP_MINUS:
+                userScreenResize(COORD_BOUNDS[1] + 1)
+            elif event.key == pygame.K_KP_PLUS:
+                userScreenResize(COORD_BOUNDS[1] - 1)
+            elif event.key == pygame.K_KP8:
+                OBJSIZE += 1
+            elif event.key == pygame.K_KP2 and OBJSIZE > 1:
+                OBJSIZE -= 1
+            elif event.key == pygame.K_KP_PERIOD:
+                IS_RUNNING = ~IS_RUNNING
+            elif event.key == pygame.K_SPACE:
+                SINGLE_TICK = True
+            elif event.key ==pygame.K_LEFT:
+                userScreenShift(-1, 0)
+            elif event.key == pygame.K_RIGHT:
+                userScreenShift(1, 0)
+            elif event.key == pygame.K_UP:
+                userScreenShift(0, 1)
+            elif event.key == pygame.K_DOWN:
+                userScreenShift(0, -1)
+            elif event.key == pygame.K_ESCAPE:
+                done = True
+            elif event.key == pygame.K_KP5:
+                screen.fill(colors['BLACK'])
+        #clock.tick(1)
+
+        if IS_RUNNING or SINGLE_TICK:
+            updateSim()
+            SINGLE_TICK = False
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,26 @@
+"""
+Interactive pygame view of the solar system; run it as a script, or call
+main().  Importing it only defines the bodies and the simulation setup, so
+pygame is imported when a window is opened, not before.
+"""
 import math
 
 import numpy as np
-import pygame
+
+from orbits.checkpoint import Checkpointer, latest_checkpoint, \
+    restore_checkpoint
+from orbits.diagnostics import Monitor
+from orbits.forces import direct_sum, make_backend
+from orbits.integrators import make_integrator
+from orbits.profiler import PhaseTimer, TimedForces
+from orbits.render import DirtyRects, TextCache, draw_points, draw_trails, \
+    project
+from orbits.scenarios import AU, DIST, M_SOL, MASSES, MOON_DIST, \
+    MOON_MASSES, MOON_NAMES, MOON_PLANET, MOON_VELOCS, NAMES, VELOCS
+from orbits.scheduler import FrameScheduler
+from orbits.simulation import Simulation
+from orbits.state import BodyStore, row_property
+from orbits.trails import Trails
 
 TIMES = [1, 60, 3600, 86400, 604800, 2630000, 31556900]
 
@@ -15,34 +34,14 @@ COLORS = {'WHITE': (255, 255, 255), 'BLACK': (0, 0, 0),
           'MAROON': (128, 0, 0)}
 
 # Physical Values
-AU = 1.49597871e11  # m
 G = 6.67384e-11  # m^3 * kg^-1 * s^-2
-M_SOL = 1.9891e30  # kg
-
-NAMES = ['Me', 'V', 'E', 'Ma', 'J', 'S', 'U', 'N', 'P']
-MASSES = [.330e24, 4.87e24, 5.97e24, .642e24, 1898e24, 568e24, 86.8e24, 102e24,
-          .0131e24]
-RADII = [2.440e6, 6052e6, 6378e6, 3.396e6, 7.1492e7, 6.0268e7, 2.5550e7,
-         2.4750e7, 1.195e6]
-DIST = [4.600e10, 1.0750e11, 1.4710e11, 2.0660e11, 7.4050e11, 1.35260e12,
-        2.74130e12, 4.44450e12, 4.43500e12]
-DIST_AU = [.387, .723, 1.000, 1.524, 5.203, 9.523, 19.208, 30.087, 39.746]
+
+# The tables of the planets and moons are those of scenarios.solar()
 DIST_AU = [x / AU for x in DIST]
-VELOCS = [5.897e4, 3.525e4, 3.029e4, 2.650e4, 1.371e4, 1.018e4, 7.11e3, 5.50e3,
-          6.10e3]
 COL = [COLORS['RED'], COLORS['GOLD'], COLORS['GREEN'], COLORS['MAROON'],
        COLORS['ORANGE'],
        COLORS['YELLOW'], COLORS['TURQUOISE'], COLORS['BLUE'], COLORS['PURPLE']]
-
-MOON_NAMES = ['CALLISTO', 'GANYMEDE', 'EUROPA', 'IO', 'LUNA']
-MOON_PLANET = ['J', 'J', 'J', 'J', 'E']
-MOON_MASSES = [107.6e21, 148.2e21, 48.0e21, 89.3e21, 7.34e22]
-MOON_RADII = [2.4105e6, 2.681e6, 1.561e6, 1.765e6, 3.476e6]
-MOON_DIST = [1.883e9, 1.070e9, 6.71e8, 4.22e8, 3.844e8]
 MOON_DIST_AU = [x / AU for x in MOON_DIST]
-MOON_VELOCS = [8.2e3, 10.9e3, 13.7e3, 17.3e3, 1.023e3]
-
-pygame.init()
 
 # Runtime values
 DEBUG_CONSOLE_ON = False
@@ -50,12 +49,41 @@ DEBUG_ON = False
 IS_RUNNING = True
 AUTO_UPDATE = True
 DONE = False
-clock = pygame.time.Clock()
 timescale_i = 3
 timescale = TIMES[timescale_i]
 zoomlevel = 1
-max_calcs = 50  # per body per timestep
 refresh_bound_rate = 1000  # refresh bounds after this many sim steps
+DEBUG_REFRESH = 250  # ms between re-renders of the debug panel
+FPS = 60
+# 'fixed': steps_per_frame steps per frame at FPS; 'max': as many steps as
+# fit in the frame budget, drawing only the latest state
+SCHEDULER = FrameScheduler('fixed', steps_per_frame=1, budget=1.0 / FPS)
+# 'barnes-hut' for large swarms, 'parallel' to use every core, 'numba' for
+# compiled kernels
+FORCES = make_backend('direct', G=G)
+# 'leapfrog', 'euler', 'verlet' and 'yoshida4' use one step for all
+# bodies.  'hierarchical' gives the planets one Wisdom-Holman step per frame
+# step and sub-steps each planet's moons in the planet's own frame (the
+# moons' planets are set from reference_body below), but each sub-step is a
+# Python call per moon system, so a step costs some 300 times a leapfrog
+# step here.  'block' sub-cycles the moons within one heliocentric
+# integration.
+INTEGRATOR = make_integrator('leapfrog')
+# F5 saves a checkpoint, F9 returns to the latest one; long sessions are
+# also saved every 100000 steps, keeping the last five
+CHECKPOINTS = Checkpointer('checkpoints', every=100000, keep=5)
+# F3 toggles per-phase timing and its overlay (rolling p50 / p99 over the
+# last ten seconds of frames), F4 writes it to profile.json and profile.csv
+PROFILE = PhaseTimer(window=10 * FPS)
+# Drift of energy, momentum and the barycentre since the start, shown at
+# the top of the screen; a large dE/E means the timescale is too coarse
+MONITOR = Monitor(every=1000)
+# Orbit trails: the last 1000 positions of every body, one kept every 20
+# steps; T toggles them, C clears them
+TRAILS = Trails(length=1000, every=20)
+TRAILS_ON = True
+# Trail points are clipped this far (px) outside the window
+TRAIL_MARGIN = 10000
 following = False
 follow_i = 0
 
@@ -96,6 +124,7 @@ class Display:
         :param fontsize: Size of font
         :return:
         """
+        import pygame
         self.COORD_BOUNDS = np.array([minX, maxX, minY, maxY])
         self.COORD_RANGE = self.COORD_BOUNDS[(1, 3),] - self.COORD_BOUNDS[
             (0, 2),]
@@ -103,9 +132,13 @@ class Display:
         self.PX_BOUNDS = np.array([0, pX, 0, pY])
         self.PX_RANGE = np.array([pX, pY])
         self.PX_CENTER = (self.PX_RANGE / 2).astype(int)
-        self.PX_PER_COORD = (self.PX_RANGE / self.COORD_RANGE).astype(int)
+        self.PX_PER_COORD = self.PX_RANGE / self.COORD_RANGE
         self.screen = pygame.display.set_mode(self.PX_RANGE)
         self.font = pygame.font.Font(None, fontsize)
+        # Text is only rendered when it changes, and only the regions drawn
+        # this frame or the last are pushed to the display
+        self.text = TextCache(self.font)
+        self.dirty = DirtyRects(self.screen, COLORS['BLACK'])
 
     def fit(self, set):
         """
@@ -195,7 +228,7 @@ class Display:
         self.COORD_RANGE = self.COORD_BOUNDS[(1, 3),] - self.COORD_BOUNDS[
             (0, 2),]
         self.COORD_CENTER = (self.COORD_RANGE / 2) + self.COORD_BOUNDS[(0, 2),]
-        self.PX_PER_COORD = (self.PX_RANGE / self.COORD_RANGE).astype(int)
+        self.PX_PER_COORD = self.PX_RANGE / self.COORD_RANGE
 
     def renderGrid(self):
         """
@@ -203,15 +236,95 @@ class Display:
         :return: None
         :rtype: None
         """
-        output = [
-            self.font.render(str(coord), 1, COLORS['WHITE'], COLORS['BLACK'])
-            for coord in self.COORD_BOUNDS]
         output_pos = [(0, self.PX_CENTER[1]),
                       (self.PX_RANGE[0] - 50, self.PX_CENTER[1]),
                       (self.PX_CENTER[0], 0),
                       (self.PX_CENTER[0], self.PX_RANGE[1] - 15)]
-        for x in xrange(len(output)):
-            self.screen.blit(output[x], output_pos[x])
+        for coord, pos in zip(self.COORD_BOUNDS, output_pos):
+            self.blitText('{0:.6g}'.format(coord), pos)
+
+    def blitText(self, text, pos):
+        """
+        Draw a line of text, rendering it only if it was not drawn lately.
+        :param text: The text
+        :type text: str
+        :param pos: Pixel position of its top left corner
+        :return: The region drawn
+        :rtype: pygame.Rect
+        """
+        surface = self.text.render(text, COLORS['WHITE'], COLORS['BLACK'])
+        return self.dirty.add(self.screen.blit(surface, pos))
+
+    def composePanel(self, columns, width=150, height=15):
+        """
+        Lay out columns of rendered lines on one surface, so the whole
+        panel is drawn with a single blit.
+        :param columns: One list of line surfaces per column
+        :type columns: list[list[pygame.Surface]]
+        :param width: Column width (px)
+        :type width: int
+        :param height: Line height (px)
+        :type height: int
+        :return: The panel
+        :rtype: pygame.Surface
+        """
+        import pygame
+        rows = max([len(c) for c in columns] + [1])
+        panel = pygame.Surface((min(width * max(len(columns), 1),
+                                    int(self.PX_RANGE[0])), height * rows))
+        panel.fill(COLORS['BLACK'])
+        for x, column in enumerate(columns):
+            for y, line in enumerate(column):
+                panel.blit(line, (x * width, y * height))
+        return panel
+
+    def project(self, positions):
+        """
+        Map positions to pixels in one pass.
+        :param positions: (N, 2) positions (AU)
+        :type positions: np.ndarray
+        :return: (N, 2) pixel coordinates and the mask of those on screen
+        :rtype: tuple[np.ndarray, np.ndarray]
+        """
+        return project(positions, self.COORD_CENTER, self.PX_PER_COORD,
+                       self.PX_CENTER, self.PX_RANGE)
+
+    def renderPositions(self, positions, colors, size=None):
+        """
+        Draw a point for every position on screen, skipping the rest.
+        :param positions: (N, 2) positions (AU)
+        :type positions: np.ndarray
+        :param colors: (N, 3) colours, or one colour for all
+        :param size: Point radius (px), OBJSIZE if None
+        :type size: int
+        :return: None
+        :rtype: None
+        """
+        if size is None:
+            size = OBJSIZE
+        pixels, visible = self.project(positions)
+        colors = np.broadcast_to(np.asarray(colors), (len(pixels), 3))
+        self.dirty.add(draw_points(self.screen, pixels[visible],
+                                   colors[visible], size))
+
+    def renderTrails(self, trails, colors):
+        """
+        Draw the recorded trail of every body, projected with the current
+        bounds.
+        :param trails: Position history (m)
+        :type trails: Trails
+        :param colors: One colour per body
+        :return: None
+        :rtype: None
+        """
+        history = trails.history()
+        if len(history) < 2:
+            return
+        pixels, _ = project(history.reshape(-1, 2) / AU, self.COORD_CENTER,
+                            self.PX_PER_COORD, self.PX_CENTER, self.PX_RANGE,
+                            TRAIL_MARGIN)
+        self.dirty.add(draw_trails(self.screen,
+                                   pixels.reshape(history.shape), colors))
 
     def renderObjects(self, set):
         """
@@ -221,13 +334,15 @@ class Display:
         :return: None
         :rtype: None
         """
-        if type(set) is list:
-            for o in set:
-                pygame.draw.circle(self.screen, o.color,
-                                   [o.display_x, o.display_y], OBJSIZE)
-        else:
-            pygame.draw.circle(self.screen, set.color,
-                               [set.display_x, set.display_y], OBJSIZE)
+        if type(set) is not list:
+            set = [set]
+        rows = [o.index for o in set]
+        self.renderPositions(set[0].store.positions[rows] / AU,
+                             [o.color for o in set], OBJSIZE)
+
+
+# Every Body keeps its state in a row of this store
+STORE = BodyStore(dim=2)
 
 
 class Body:
@@ -239,7 +354,7 @@ class Body:
     # position (dx/dy) * AU, velocity (vx/vy) * m/s,
     # acceleration (ax/ay) * m/s^2, radius * m, and mass * kg
     def __init__(self, name="", dx=0, dy=0, vx=0, vy=0, radius=0, m=0,
-                 color=COLORS['WHITE'], reference_body='Sol'):
+                 color=COLORS['WHITE'], reference_body='Sol', store=None):
         """
 
         :param name:
@@ -260,6 +375,8 @@ class Body:
         :type color:
         :param reference_body:
         :type reference_body:
+        :param store: State store to keep this body's row in (default STORE)
+        :type store: BodyStore
         :return:
         :rtype:
         """
@@ -269,81 +386,74 @@ class Body:
         else:
             self.name = name
         Body.count += 1
-        self.dx_au = dx
-        self.dy_au = dy
-        self.dx = dx * AU
-        self.dy = dy * AU
-        self.vx = vx
-        self.vy = vy
-        self.ax = self.ay = 0
-        self.radius = radius
-        self.m = m
+        if store is None:
+            store = STORE
+        self.store = store
+        self.index = store.add([dx * AU, dy * AU], [vx, vy], m, radius,
+                               self.name)
+        # Mapped onto sc's window by mapDisplayCoords when drawn
         self.display_x = self.display_y = 0
         self.color = color
-        self.mapDisplayCoords()
         self.reference_body = reference_body
 
+    dx = row_property('positions', 0)
+    dy = row_property('positions', 1)
+    vx = row_property('velocities', 0)
+    vy = row_property('velocities', 1)
+    ax = row_property('accelerations', 0)
+    ay = row_property('accelerations', 1)
+    m = row_property('masses')
+    radius = row_property('radii')
+
+    @property
+    def dx_au(self):
+        return self.dx / AU
+
+    @property
+    def dy_au(self):
+        return self.dy / AU
+
     def sumForces(self, bodies):
         """
         Sum all the gravitational forces acting on the current body.
 
-        Disregarding self and zero mass bodies, calculate each force acting
-        on the current body.  The number of calculations depends on the
-        timescale and max_calcs values, as well as the distance: closer
-        bodies have more calculations because the forces are greater.
+        Disregarding self and zero mass bodies, evaluate the acceleration of
+        the current body with the shared direct-sum kernel.  updateSim does
+        the same for every body at once; this is the single-body form.
 
         :param bodies: a set of celestial objects with gravity.
         :type bodies: list[Body]
         :return: None
         :rtype: None
         """
-        for body in bodies:
-            if body.name == self.name or body.m <= 0:
-                continue
-            diffx = self.dx - body.dx
-            diffy = self.dy - body.dy
-            distance = math.sqrt(diffx ** 2 + diffy ** 2)
-
-            # As written, this is needless subdivision
-            #calculations = int(
-            #    min(math.ceil(max_calcs / (math.log10(distance))), max_calcs))
-            #segment_timescale = timescale / calculations
-            segment_timescale = timescale / 100
-            for x in xrange(0, int(timescale), segment_timescale):
-                g = ((G * body.m) / distance ** 2) * segment_timescale
-                theta = math.atan2(diffy, diffx)
-                self.ax -= (g * math.cos(theta))
-                self.ay -= (g * math.sin(theta))
-                # if self.name == "GANYMEDE":
-                #    print (body.name + " ax/ay: " + str(self.ax) + "/" + str(self.ay) + " d: " + str(distance) +
-                #           " g: " + str(g) + " segTime: " + str(segment_timescale))
+        positions = np.array([[body.dx, body.dy] for body in bodies])
+        masses = np.array([body.m for body in bodies])
+        self.ax, self.ay = direct_sum(positions, masses, G,
+                                      targets=[[self.dx, self.dy]])[0]
 
     def applyForce(self):
         """
         Discharge accelerations into the velocity vectors
 
-        The acceleration is always AU/timestep^2, velocity is always AU/timestep
+        The acceleration is always m/s^2, velocity is always m/s
         :return:
         :rtype:
         """
-        self.vx += self.ax
-        self.vy += self.ay
-        self.ax = self.ay = 0
+        self.vx += self.ax * timescale
+        self.vy += self.ay * timescale
 
     def applyVelocity(self):
         """
         Discharge velocity into displacement vectors
 
-               AU
-        v = -------- * timestep = AU
-            timestep
+              m
+        v = ----- * timestep = m
+              s
         :return:
         :rtype:
         """
         self.dx += self.vx * timescale
         self.dy += self.vy * timescale
-        self.dx_au = self.dx / AU
-        self.dy_au = self.dy / AU
 
     def mapDisplayCoords(self):
         """
@@ -362,164 +472,311 @@ class Body:
 
     def makeDebugLines(self):
         """
-        Unused
-        :return: None
-        :rtype: None
-        """
-        return [sc.font.render("name: " + self.name, 1, COLORS['WHITE'],
-                               COLORS['BLACK']),
-                sc.font.render("dx/dy: " + str(self.dx) + " " + str(self.dy), 1,
-                               COLORS['WHITE'], COLORS['BLACK']),
-                sc.font.render(
-                    "dx/dy AU: " + str(self.dx_au) + " " + str(self.dy_au), 1,
-                    COLORS['WHITE'], COLORS['BLACK']),
-                sc.font.render(
-                    "display x/y: " + str(self.display_x) + " " + str(
-                        self.display_y), 1, COLORS['WHITE'], COLORS['BLACK']),
-                sc.font.render("AU mag: " + str(
-                    math.sqrt((self.dx_au ** 2) + (self.dy_au ** 2))), 1,
-                               COLORS['WHITE'], COLORS['BLACK']),
-                sc.font.render("vx/vy: " + str(self.vx) + " " + str(self.vy), 1,
-                               COLORS['WHITE'], COLORS['BLACK']),
-                sc.font.render("ax/ay: " + str(self.ax) + " " + str(self.ay), 1,
-                               COLORS['WHITE'], COLORS['BLACK'])]
-
-
-sc = Display(800, 800, -3.0, 50.0, 3.0, 50.0)
-objects = [Body('Sol', 0, 0, 0, 0, 100, M_SOL)]
-
-# Choice of VELOCS is arbitrary.  A dict() would be much more elegant...
-for x in xrange(len(VELOCS)):
-    objects.append(
-        Body(NAMES[x], DIST_AU[x], 0, 0, VELOCS[x], 100, MASSES[x], COL[x]))
-
-planets = {}
-
-for p in objects:
-    planets[p.name] = p
-
-# Compile data for satellites
-for x in xrange(len(MOON_VELOCS)):
-    objects.append(
-        Body(MOON_NAMES[x], MOON_DIST_AU[x], 0, 0, MOON_VELOCS[x], 100,
-             MOON_MASSES[x], COLORS['WHITE'], MOON_PLANET[x]))
-
-# Each satellite's position is offset by its reference body (planet, Sol)
-for o in objects:
-    o.dx += planets[o.reference_body].dx
-    o.dy += planets[o.reference_body].dy
-    o.vy += planets[o.reference_body].vy
-    o.vx += planets[o.reference_body].vx
-
-sc.fit(objects)
-sc.renderGrid()
-sc.forceBounds(-50, 50, -50, 50)
+        Rendered lines of this body's column of the debug panel; lines whose
+        text did not change come from sc's text cache.
+        :return: One surface per line
+        :rtype: list[pygame.Surface]
+        """
+        lines = ["name: " + self.name,
+                 "dx/dy: " + str(self.dx) + " " + str(self.dy),
+                 "dx/dy AU: " + str(self.dx_au) + " " + str(self.dy_au),
+                 "display x/y: " + str(self.display_x) + " " +
+                 str(self.display_y),
+                 "AU mag: " + str(math.sqrt((self.dx_au ** 2) +
+                                            (self.dy_au ** 2))),
+                 "vx/vy: " + str(self.vx) + " " + str(self.vy),
+                 "ax/ay: " + str(self.ax) + " " + str(self.ay)]
+        return [sc.text.render(line, COLORS['WHITE'], COLORS['BLACK'])
+                for line in lines]
+
+
+def makeObjects(store=None):
+    """
+    Sol, the planets and their moons, with each moon placed relative to its
+    planet.
+    :param store: State store to keep the bodies in (default STORE)
+    :type store: BodyStore
+    :return: The bodies, Sol first
+    :rtype: list[Body]
+    """
+    objects = [Body('Sol', 0, 0, 0, 0, 100, M_SOL, store=store)]
+
+    # Choice of VELOCS is arbitrary.  A dict() would be much more elegant...
+    for x in range(len(VELOCS)):
+        objects.append(
+            Body(NAMES[x], DIST_AU[x], 0, 0, VELOCS[x], 100, MASSES[x], COL[x],
+                 store=store))
+
+    planets = {}
+
+    for p in objects:
+        planets[p.name] = p
+
+    # Compile data for satellites
+    for x in range(len(MOON_VELOCS)):
+        objects.append(
+            Body(MOON_NAMES[x], MOON_DIST_AU[x], 0, 0, MOON_VELOCS[x], 100,
+                 MOON_MASSES[x], COLORS['WHITE'], MOON_PLANET[x],
+                 store=store))
+
+    # Each satellite's position is offset by its reference body (planet, Sol)
+    for o in objects:
+        o.dx += planets[o.reference_body].dx
+        o.dy += planets[o.reference_body].dy
+        o.vy += planets[o.reference_body].vy
+        o.vx += planets[o.reference_body].vx
+    return objects
+
+
+def parentsOf(objects):
+    """
+    :param objects: Bodies as made by makeObjects
+    :type objects: list[Body]
+    :return: Row of every body's reference body, -1 for those orbiting Sol
+    :rtype: list[int]
+    """
+    names = [o.name for o in objects]
+    return [-1 if o.reference_body == 'Sol' else
+            names.index(o.reference_body) for o in objects]
+
+
+def refine(integrator, factor):
+    """
+    Scale how finely an integrator sub-steps, for those that sub-step at
+    all: 'hierarchical' takes factor times as many moon steps per orbit and
+    'block' divides its eta by factor.  Other integrators are left as they
+    are.
+
+    :param integrator: The integrator to refine
+    :param factor: >1 for more, shorter sub-steps, <1 for fewer
+    :type factor: float
+    """
+    if hasattr(integrator, 'per_orbit'):
+        integrator.per_orbit *= factor
+    elif hasattr(integrator, 'eta'):
+        integrator.eta /= factor
+
+
+# Created by main()
+sc = None
+clock = None
+objects = []
+SIM = None
 time_elapsed = 0
 sim_steps = 0
+next_fit = 0
+debug_panel = None
+next_debug = 0
+
+def advanceSim():
+    """
+    Advance the simulation by one timestep, without drawing anything.
+
+    The heavy lifting is done by SIM's integrator, which advances STORE (the
+    state of every body) with batched passes of the FORCES backend.
+    :return: None
+    :rtype: None
+    """
+    global time_elapsed, sim_steps
+    SIM.dt = timescale
+    SIM.step()
+    with PROFILE.phase('checkpoint'):
+        CHECKPOINTS(SIM)
+    with PROFILE.phase('monitor'):
+        MONITOR(SIM)
+    TRAILS.record(STORE.positions)
+    sim_steps = SIM.sim_steps
+    time_elapsed = SIM.time_elapsed / (3600 * 24)
 
 def updateSim(bodies):
     """
-    Calls all the update methods for object positions, display, and time.
+    Calls all the update methods for object display and time.
 
-    The heavy lifting is done in each Body's force calculation methods.  The
-    current method serves to bring all of the different update steps together.
+    Draws the latest state only; the simulation itself is advanced by
+    advanceSim, as many times per frame as SCHEDULER decides.
     :param bodies: a set of celestial bodies.
     :type bodies: list[Body]
     :return: None
     :rtype: None
     """
+    import pygame
+    global next_fit, debug_panel, next_debug
     if AUTO_UPDATE:
-        if sim_steps % refresh_bound_rate == 0:
-            sc.fit(bodies)
-    sc.screen.fill(COLORS['BLACK'])
-    sc.renderGrid()
-    for obj in bodies:
-        obj.sumForces(bodies)
+        if sim_steps >= next_fit:
+            with PROFILE.phase('fit'):
+                sc.fit(bodies)
+            next_fit = sim_steps + refresh_bound_rate
+    sc.dirty.begin()
+    with PROFILE.phase('renderGrid'):
+        sc.renderGrid()
+    if DEBUG_ON and (debug_panel is None or
+                     pygame.time.get_ticks() >= next_debug):
+        with PROFILE.phase('debugLines'):
+            for obj in bodies:
+                obj.mapDisplayCoords()
+            debug_panel = sc.composePanel([a.makeDebugLines()
+                                           for a in bodies])
+            next_debug = pygame.time.get_ticks() + DEBUG_REFRESH
+    if TRAILS_ON:
+        with PROFILE.phase('trails'):
+            sc.renderTrails(TRAILS, [o.color for o in bodies])
+    with PROFILE.phase('render'):
         if DEBUG_ON:
-            column = [a.makeDebugLines() for a in bodies]
-    for obj in bodies:
-        obj.applyForce()
-        obj.applyVelocity()
-        obj.mapDisplayCoords()
-    if DEBUG_ON:
-        for x in xrange(len(column)):
-            for y in xrange(len(column[x])):
-                sc.screen.blit(column[x][y], ((x) * 150, 15 * y))
-    sc.renderObjects(bodies)
-    global time_elapsed
-    time_elapsed += timescale / (3600 * 24)
-    output = sc.font.render(str(time_elapsed) + " days", 1, COLORS['WHITE'],
-                            COLORS['BLACK'])
-    sc.screen.blit(output, (10, 10))
-    pygame.display.flip()
-
-# Main loop.  Note the control scheme in the block comment below.
-while not DONE:
-    SINGLE_TICK = False
-    for event in pygame.event.get(pygame.QUIT):
-        DONE = True
-    for event in pygame.event.get(pygame.KEYDOWN):
-        """
-        NL  /   *   -
-        7   8   9
-        4   5   6   +
-        1   2   3   <enter>
-            0   .
-
-        N/A     Zoom+   Zoom-   Speed-
-        Calc-   Up      Calc+
-        Left    Reset   Right   Speed+
-        Obj-    Down    Obj+    Pause
-                Step    Reset
-
-        """
-        if event.key == pygame.K_KP_DIVIDE:
-            zoomlevel /= 2.0
-            sc.zoom(zoomlevel)
-        elif event.key == pygame.K_KP_MULTIPLY:
-            zoomlevel *= 2.0
-            sc.zoom(zoomlevel)
-        elif event.key == pygame.K_KP_MINUS:
-            timescale_i -= max(0, timescale_i > 0)
-            timescale = TIMES[timescale_i]
-        elif event.key == pygame.K_KP7:
-            max_calcs -= max(0, max_calcs > 2)
-        elif event.key == pygame.K_KP8:
-            sc.shift(0.0, 1.0)
-        elif event.key == pygame.K_KP9:
-            max_calcs += 1
-        elif event.key == pygame.K_KP4:
-            sc.shift(-1.0, 0.0)
-        elif event.key == pygame.K_KP5:
-            sc.screen.fill(COLORS['BLACK'])
-        elif event.key == pygame.K_KP6:
-            sc.shift(1.0, 0.0)
-        elif event.key == pygame.K_KP_PLUS:
-            timescale_i += max(0, timescale_i < 6)
-            timescale = TIMES[timescale_i]
-        elif event.key == pygame.K_KP1:
-            OBJSIZE -= max(0, OBJSIZE > 2)
-        elif event.key == pygame.K_KP2:
-            sc.shift(0.0, -1.0)
-        elif event.key == pygame.K_KP3:
-            OBJSIZE += 1
-        elif event.key == pygame.K_KP_ENTER:
-            IS_RUNNING = not IS_RUNNING
-        elif event.key == pygame.K_KP0:
-            SINGLE_TICK = True
-        elif event.key == pygame.K_KP_PERIOD:
-            True
-        elif event.key == pygame.K_ESCAPE:
-            DONE = True
-        elif event.key == pygame.K_LEFTBRACKET:
-            follow_i -= max(0, follow_i > 0)
-        elif event.key == pygame.K_RIGHTBRACKET:
-            follow_i += max(0, follow_i < (len(objects) - 1))
-
-    clock.tick(60)
+            sc.dirty.add(sc.screen.blit(debug_panel, (0, 0)))
+        sc.renderObjects(bodies)
+        drift = "" if MONITOR.last is None else \
+            ", dE/E {0:.1e}".format(MONITOR.last['energy'])
+        sc.blitText(str(time_elapsed) + " days, " +
+                    str(SCHEDULER.last_steps) + " steps/frame (" +
+                    SCHEDULER.mode + ")" + drift, (10, 10))
+        if PROFILE.enabled:
+            for y, line in enumerate(PROFILE.lines()):
+                sc.blitText(line, (10, 30 + 15 * y))
+    with PROFILE.phase('flip'):
+        sc.dirty.present()
+
+def main():
+    """
+    Open the window and run the simulation until it is closed.
+    :return: None
+    :rtype: None
+    """
+    import pygame
+    global sc, clock, objects, SIM, DONE, IS_RUNNING, TRAILS_ON, OBJSIZE, \
+        zoomlevel, timescale_i, timescale, follow_i, sim_steps, time_elapsed
+    pygame.init()
+    clock = pygame.time.Clock()
+    sc = Display(800, 800, -3.0, 50.0, 3.0, 50.0)
+    objects = makeObjects()
+    # Moons are integrated in the frame of their reference body
+    if hasattr(INTEGRATOR, 'parents'):
+        INTEGRATOR.parents = parentsOf(objects)
+
+    sc.fit(objects)
+    sc.renderGrid()
+    sc.forceBounds(-50, 50, -50, 50)
+    SIM = Simulation(STORE, FORCES, INTEGRATOR, timescale)
 
-    if IS_RUNNING or SINGLE_TICK:
-        sc.follow(objects[follow_i], zoomlevel)
-        sim_steps += 1
-        updateSim(objects)
+    # Main loop.  Note the control scheme in the block comment below.
+    while not DONE:
         SINGLE_TICK = False
+        for event in pygame.event.get(pygame.QUIT):
+            DONE = True
+        for event in pygame.event.get(pygame.KEYDOWN):
+            """
+            NL  /   *   -
+            7   8   9
+            4   5   6   +
+            1   2   3   <enter>
+                0   .
+
+            N/A     Zoom+   Zoom-   Speed-
+            Calc-   Up      Calc+
+            Left    Reset   Right   Speed+
+            Obj-    Down    Obj+    Pause
+                    Step    Reset
+
+            M toggles fixed / max-speed stepping; PgUp / PgDn double / halve
+            the steps per frame in fixed mode.  Calc- / Calc+ halve / double
+            the sub-steps of 'hierarchical' and 'block'; other integrators
+            ignore them.  F5 saves a checkpoint, F9 restores the latest one.
+            F3 toggles the timing overlay, F4 exports it.  T toggles orbit
+            trails, C clears them.
+            """
+            if event.key == pygame.K_KP_DIVIDE:
+                zoomlevel /= 2.0
+                sc.zoom(zoomlevel)
+            elif event.key == pygame.K_KP_MULTIPLY:
+                zoomlevel *= 2.0
+                sc.zoom(zoomlevel)
+            elif event.key == pygame.K_KP_MINUS:
+                timescale_i -= max(0, timescale_i > 0)
+                timescale = TIMES[timescale_i]
+            elif event.key == pygame.K_KP7:
+                refine(SIM.integrator, 0.5)
+            elif event.key == pygame.K_KP8:
+                sc.shift(0.0, 1.0)
+            elif event.key == pygame.K_KP9:
+                refine(SIM.integrator, 2.0)
+            elif event.key == pygame.K_KP4:
+                sc.shift(-1.0, 0.0)
+            elif event.key == pygame.K_KP5:
+                sc.dirty.invalidate()
+            elif event.key == pygame.K_KP6:
+                sc.shift(1.0, 0.0)
+            elif event.key == pygame.K_KP_PLUS:
+                timescale_i += max(0, timescale_i < 6)
+                timescale = TIMES[timescale_i]
+            elif event.key == pygame.K_KP1:
+                OBJSIZE -= max(0, OBJSIZE > 2)
+            elif event.key == pygame.K_KP2:
+                sc.shift(0.0, -1.0)
+            elif event.key == pygame.K_KP3:
+                OBJSIZE += 1
+            elif event.key == pygame.K_KP_ENTER:
+                IS_RUNNING = not IS_RUNNING
+            elif event.key == pygame.K_KP0:
+                SINGLE_TICK = True
+            elif event.key == pygame.K_KP_PERIOD:
+                True
+            elif event.key == pygame.K_ESCAPE:
+                DONE = True
+            elif event.key == pygame.K_LEFTBRACKET:
+                follow_i -= max(0, follow_i > 0)
+            elif event.key == pygame.K_RIGHTBRACKET:
+                follow_i += max(0, follow_i < (len(objects) - 1))
+            elif event.key == pygame.K_m:
+                SCHEDULER.toggle()
+            elif event.key == pygame.K_PAGEUP:
+                SCHEDULER.steps_per_frame *= 2
+            elif event.key == pygame.K_PAGEDOWN:
+                SCHEDULER.steps_per_frame = max(1, SCHEDULER.steps_per_frame // 2)
+            elif event.key == pygame.K_t:
+                TRAILS_ON = not TRAILS_ON
+            elif event.key == pygame.K_c:
+                TRAILS.clear()
+            elif event.key == pygame.K_F3:
+                PROFILE.toggle()
+                # The backend in use, which F9 may have replaced
+                forces = SIM.forces.forces \
+                    if isinstance(SIM.forces, TimedForces) else SIM.forces
+                SIM.forces = TimedForces(forces, PROFILE) if PROFILE.enabled \
+                    else forces
+            elif event.key == pygame.K_F4:
+                PROFILE.save('profile.json')
+                PROFILE.save('profile.csv')
+            elif event.key == pygame.K_F5:
+                CHECKPOINTS.save(SIM)
+            elif event.key == pygame.K_F9:
+                if latest_checkpoint(CHECKPOINTS.directory) is not None:
+                    restore_checkpoint(SIM,
+                                       latest_checkpoint(CHECKPOINTS.directory))
+                    # Restoring makes a new backend, so time it again, and
+                    # measure drift from the restored state
+                    if PROFILE.enabled:
+                        SIM.forces = TimedForces(SIM.forces, PROFILE)
+                    MONITOR.rebase(SIM)
+                    timescale = SIM.dt
+                    sim_steps = SIM.sim_steps
+                    TRAILS.clear()
+                    time_elapsed = SIM.time_elapsed / (3600 * 24)
+
+        with PROFILE.phase('tick'):
+            clock.tick(FPS if SCHEDULER.mode == 'fixed' else 0)
+
+        if IS_RUNNING or SINGLE_TICK:
+            sc.follow(objects[follow_i], zoomlevel)
+            with PROFILE.phase('step'):
+                if IS_RUNNING:
+                    steps = SCHEDULER.run_frame(advanceSim)
+                else:
+                    advanceSim()
+                    steps = 1
+            updateSim(objects)
+            SINGLE_TICK = False
+            PROFILE.frame(steps)
+    SIM.close()
+
+
+if __name__ == '__main__':
+    main()
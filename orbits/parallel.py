@@ -0,0 +1,119 @@
+"""
+Direct summation spread over the cores of one machine.
+
+    forces = make_backend('parallel', workers=64)
+
+The interaction matrix (targets by sources) is cut into tiles of rows x
+columns pairs.  One task takes one row of tiles, evaluates the tiles from
+left to right with the numpy kernel of forces, and adds them up in that
+order.  numpy releases the GIL while it works on a tile, so the tasks run
+on a pool of threads that share the state arrays: nothing is copied or
+pickled per step.
+
+The tiling depends only on the number of bodies and the tile shape,
+never on the number of workers.  So every sum is taken in the same order
+and the results are the same to the bit with any number of workers.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .forces import DirectSum, G, direct_sum
+
+# Default tile shape: targets and sources per tile
+ROWS = 128
+COLUMNS = 512
+
+
+class ParallelDirect(DirectSum):
+    """
+    Direct summation on a thread pool; otherwise the same backend as
+    DirectSum, with the same results up to rounding.
+    """
+    name = 'parallel'
+
+    def __init__(self, G=G, softening=0.0, workers=None, rows=ROWS,
+                 columns=COLUMNS):
+        """
+        :param G: Gravitational constant
+        :type G: float
+        :param softening: Plummer softening length
+        :type softening: float
+        :param workers: Number of threads, all cores if None
+        :type workers: int
+        :param rows: Targets per tile
+        :type rows: int
+        :param columns: Sources per tile
+        :type columns: int
+        :return: None
+        :rtype: None
+        """
+        DirectSum.__init__(self, G, softening)
+        if rows < 1 or columns < 1:
+            raise ValueError('tiles need at least one row and column')
+        self.workers = workers or os.cpu_count() or 1
+        self.rows = rows
+        self.columns = columns
+        self._pool = None
+
+    def options(self):
+        options = DirectSum.options(self)
+        options.update(workers=self.workers, rows=self.rows,
+                       columns=self.columns)
+        return options
+
+    def close(self):
+        """
+        Stop the worker threads; they are started again when needed.
+        :return: None
+        :rtype: None
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def evaluate(self, positions, masses, targets=None, out=None,
+                 potentials=None):
+        positions = np.asarray(positions, dtype=float)
+        masses = np.asarray(masses, dtype=float)
+        if targets is None:
+            targets = positions
+        else:
+            targets = np.asarray(targets, dtype=float)
+        if out is None:
+            out = np.empty_like(targets)
+        massive = masses > 0
+        sources, weights = positions[massive], masses[massive]
+
+        def row(start):
+            stop = start + self.rows
+            acc, tile = out[start:stop], np.empty_like(out[start:stop])
+            acc[:] = 0.0
+            phi = tile_phi = None
+            if potentials is not None:
+                phi = potentials[start:stop]
+                phi[:] = 0.0
+                tile_phi = np.empty(len(phi))
+            for column in range(0, len(weights), self.columns):
+                end = column + self.columns
+                direct_sum(sources[column:end], weights[column:end], 1.0,
+                           self.softening, targets=targets[start:stop],
+                           out=tile, potentials=tile_phi)
+                acc += tile
+                if phi is not None:
+                    phi += tile_phi
+
+        starts = range(0, len(targets), self.rows)
+        if self.workers > 1 and len(starts) > 1:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers)
+            for _ in self._pool.map(row, starts):
+                pass
+        else:
+            for start in starts:
+                row(start)
+        out *= self.G
+        if potentials is not None:
+            potentials *= self.G
+        return out
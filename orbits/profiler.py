@@ -0,0 +1,254 @@
+"""
+Low-overhead wall-clock timers for the phases of a frame or step.
+
+    PROFILE = PhaseTimer(enabled=True)
+    with PROFILE.phase('render'):
+        draw()
+    PROFILE.frame(steps)
+
+Every phase keeps its last window durations in a ring buffer, from which
+the rolling median and 99th percentile are read; frame() marks the end of
+a frame and records the frame time and the number of simulation steps run
+in it.  A disabled timer hands out one shared no-op context manager and
+records nothing, so the instrumentation can stay in the hot path.
+"""
+import csv
+import json
+import time
+
+import numpy as np
+
+
+class _Null:
+    """
+    Context manager that does nothing; what a disabled PhaseTimer returns.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL = _Null()
+
+
+class _Phase:
+    """
+    Context manager timing one named phase of a PhaseTimer.
+    """
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = self.timer.clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, self.timer.clock() - self.start)
+        return False
+
+
+class PhaseTimer:
+    """
+    Rolling per-phase timings, frame times and simulation throughput.
+    """
+
+    def __init__(self, window=600, enabled=False, clock=time.perf_counter):
+        """
+        :param window: Number of most recent samples kept per phase
+        :type window: int
+        :param enabled: Whether timing starts switched on
+        :type enabled: bool
+        :param clock: Function returning the current time in seconds
+        :return: None
+        :rtype: None
+        """
+        if window < 1:
+            raise ValueError('window must be positive')
+        self.window = window
+        self.enabled = enabled
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        """
+        Forget every sample.
+        :return: None
+        :rtype: None
+        """
+        self.samples = {}  # phase -> ring buffer of durations (s)
+        self.counts = {}  # phase -> number of samples ever recorded
+        self._phases = {}
+        self._steps = np.zeros(self.window)
+        self._last_frame = None
+
+    def toggle(self):
+        """
+        Switch timing on or off; switching on starts from a clean slate.
+        :return: None
+        :rtype: None
+        """
+        self.enabled = not self.enabled
+        if self.enabled:
+            self.reset()
+
+    def phase(self, name):
+        """
+        :param name: Name of the phase
+        :type name: str
+        :return: Context manager timing its body as one sample of name
+        """
+        if not self.enabled:
+            return NULL
+        timer = self._phases.get(name)
+        if timer is None:
+            timer = self._phases[name] = _Phase(self, name)
+        return timer
+
+    def record(self, name, seconds):
+        """
+        Add one duration sample to a phase.
+        :param name: Name of the phase
+        :type name: str
+        :param seconds: Duration
+        :type seconds: float
+        :return: None
+        :rtype: None
+        """
+        ring = self.samples.get(name)
+        if ring is None:
+            ring = self.samples[name] = np.zeros(self.window)
+            self.counts[name] = 0
+        ring[self.counts[name] % self.window] = seconds
+        self.counts[name] += 1
+
+    def frame(self, steps=0):
+        """
+        Mark the end of a frame: records the time since the previous call
+        as the 'frame' phase, and steps as the steps run in the frame.
+        :param steps: Simulation steps run during the frame
+        :type steps: int
+        :return: None
+        :rtype: None
+        """
+        if not self.enabled:
+            return
+        now = self.clock()
+        if self._last_frame is not None:
+            self._steps[self.counts.get('frame', 0) % self.window] = steps
+            self.record('frame', now - self._last_frame)
+        self._last_frame = now
+
+    def durations(self, name):
+        """
+        :param name: Name of the phase
+        :type name: str
+        :return: The phase's samples in the window, in no particular order
+        :rtype: np.ndarray
+        """
+        if name not in self.samples:
+            return np.zeros(0)
+        return self.samples[name][:min(self.counts[name], self.window)]
+
+    def steps_per_s(self):
+        """
+        :return: Simulation steps per wall-clock second over the window of
+            frames, None before two frames were marked
+        :rtype: float
+        """
+        frames = self.durations('frame')
+        total = frames.sum()
+        if not total:
+            return None
+        return self._steps[:len(frames)].sum() / total
+
+    def summary(self):
+        """
+        :return: Phase name -> count, mean, p50, p99 and max (s) over the
+            window, in order of first appearance
+        :rtype: dict
+        """
+        stats = {}
+        for name in self.samples:
+            d = self.durations(name)
+            p50, p99 = np.percentile(d, (50, 99))
+            stats[name] = {'count': self.counts[name], 'mean': d.mean(),
+                           'p50': p50, 'p99': p99, 'max': d.max()}
+        return stats
+
+    def lines(self):
+        """
+        :return: Text lines of the summary for an on-screen overlay
+        :rtype: list[str]
+        """
+        rate = self.steps_per_s()
+        lines = ['{0:.1f} steps/s'.format(rate) if rate is not None
+                 else '- steps/s']
+        for name, s in self.summary().items():
+            lines.append('{0:<12} p50 {1:8.3f} ms  p99 {2:8.3f} ms'.format(
+                name, 1e3 * s['p50'], 1e3 * s['p99']))
+        return lines
+
+    def save_json(self, path):
+        """
+        Write the summary and steps/s to a JSON file.
+        :param path: File name
+        :type path: str
+        :return: None
+        :rtype: None
+        """
+        with open(path, 'w') as f:
+            json.dump({'window': self.window,
+                       'steps_per_s': self.steps_per_s(),
+                       'phases': self.summary()}, f, indent=1)
+
+    def save_csv(self, path):
+        """
+        Write the summary to a CSV file, one row per phase.
+        :param path: File name
+        :type path: str
+        :return: None
+        :rtype: None
+        """
+        fields = ['phase', 'count', 'mean', 'p50', 'p99', 'max']
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            for name, s in self.summary().items():
+                writer.writerow(dict(s, phase=name))
+
+    def save(self, path):
+        """
+        Write the summary as CSV if path ends in .csv, else as JSON.
+        """
+        if path.endswith('.csv'):
+            self.save_csv(path)
+        else:
+            self.save_json(path)
+
+
+class TimedForces:
+    """
+    Force backend wrapper timing every force evaluation as the 'forces'
+    phase of a PhaseTimer.
+    """
+
+    def __init__(self, forces, timer):
+        self.forces = forces
+        self.timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self.forces, name)
+
+    def accelerations(self, positions, masses, out=None):
+        with self.timer.phase('forces'):
+            return self.forces.accelerations(positions, masses, out=out)
+
+    def subset_accelerations(self, positions, masses, rows):
+        with self.timer.phase('forces'):
+            return self.forces.subset_accelerations(positions, masses, rows)
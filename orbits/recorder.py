@@ -0,0 +1,193 @@
+"""
+Streaming trajectory output to memory-mapped .npy files.
+
+A trajectory is a float64 array of shape (frames, bodies, 2 * D): for every
+recorded frame and body the position components followed by the velocity
+components.  It is written straight into a memory-mapped .npy file that is
+grown in chunks as frames arrive, so RAM use stays constant however long the
+run, and it can be read back zero-copy with np.load(path, mmap_mode='r').
+Names, masses, radii and the timestep go to a small JSON file next to it.
+"""
+import json
+import os
+
+import numpy as np
+
+MAGIC = b'\x93NUMPY\x01\x00'
+HEADER_SIZE = 128  # bytes reserved for the .npy header, so it can be rewritten
+
+
+def metadata_path(path):
+    """
+    :param path: Trajectory file name, e.g. 'run.npy'
+    :type path: str
+    :return: Name of its metadata file, e.g. 'run.json'
+    :rtype: str
+    """
+    return os.path.splitext(path)[0] + '.json'
+
+
+def _header(shape):
+    """
+    A version 1.0 .npy header for a C-ordered float64 array, padded to
+    exactly HEADER_SIZE bytes.
+    """
+    text = "{'descr': '<f8', 'fortran_order': False, 'shape': %s, }" % (
+        repr(tuple(shape)))
+    text = text.ljust(HEADER_SIZE - len(MAGIC) - 3) + '\n'
+    header = MAGIC + np.uint16(len(text)).tobytes() + text.encode('latin1')
+    if len(header) != HEADER_SIZE:
+        raise ValueError('trajectory shape too large for the header')
+    return header
+
+
+class TrajectoryRecorder:
+    """
+    Records the positions and velocities of a store every `every` steps.
+
+    Usable directly as a Simulation.run callback:
+
+        with TrajectoryRecorder('run.npy', sim.store, sim.dt, every=10) as rec:
+            sim.run(10000, rec)
+    """
+
+    def __init__(self, path, store, dt, every=1, chunk=1024, t0=0.0):
+        """
+        Create (or overwrite) path and its metadata file.
+
+        :param path: Output .npy file
+        :type path: str
+        :param store: The bodies to record; their number must not change
+        :type store: BodyStore
+        :param dt: Simulation timestep (s)
+        :type dt: float
+        :param every: Record one frame every this many steps
+        :type every: int
+        :param chunk: Frames to grow the file by when it is full
+        :type chunk: int
+        :param t0: Simulation time of step 0 (s)
+        :type t0: float
+        :return: None
+        :rtype: None
+        """
+        self.path = path
+        self.dt = dt
+        self.every = every
+        self.chunk = chunk
+        self.t0 = t0
+        self.n = len(store)
+        self.dim = store.dim
+        self.frames = 0
+        self.capacity = 0
+        self._map = None
+        self._file = open(path, 'w+b')
+        self._file.write(_header((0, self.n, 2 * self.dim)))
+        self._grow()
+        self.meta = {'names': [str(name) for name in store.names],
+                     'masses': store.masses.tolist(),
+                     'radii': store.radii.tolist(),
+                     'dim': self.dim, 'dt': dt, 'every': every, 't0': t0,
+                     'columns': (['x', 'y', 'z'][:self.dim] +
+                                 ['vx', 'vy', 'vz'][:self.dim])}
+        self._write_meta()
+
+    def _grow(self):
+        """
+        Extend the file by chunk frames and map the new extent.
+        """
+        if self._map is not None:
+            self._map.flush()
+            del self._map
+        self.capacity += self.chunk
+        frame_bytes = self.n * 2 * self.dim * 8
+        self._file.truncate(HEADER_SIZE + self.capacity * frame_bytes)
+        self._map = np.memmap(self._file, dtype='<f8', mode='r+',
+                              offset=HEADER_SIZE,
+                              shape=(self.capacity, self.n, 2 * self.dim))
+
+    def _write_meta(self):
+        self.meta['frames'] = self.frames
+        with open(metadata_path(self.path), 'w') as f:
+            json.dump(self.meta, f)
+
+    def record(self, store):
+        """
+        Append the current state of store as a new frame.
+        :param store: The bodies
+        :type store: BodyStore
+        :return: None
+        :rtype: None
+        """
+        if len(store) != self.n:
+            raise ValueError('number of bodies changed while recording')
+        if self.frames == self.capacity:
+            self._grow()
+        frame = self._map[self.frames]
+        frame[:, :self.dim] = store.positions
+        frame[:, self.dim:] = store.velocities
+        self.frames += 1
+
+    def __call__(self, sim):
+        """
+        Simulation callback: record every `every` steps.
+        :param sim: The simulation
+        :type sim: Simulation
+        :return: None
+        :rtype: None
+        """
+        if sim.sim_steps % self.every == 0:
+            self.record(sim.store)
+
+    def flush(self):
+        """
+        Make the frames recorded so far readable by other processes.
+        :return: None
+        :rtype: None
+        """
+        self._map.flush()
+        self._file.seek(0)
+        self._file.write(_header((self.frames, self.n, 2 * self.dim)))
+        self._file.flush()
+        self._write_meta()
+
+    def close(self):
+        """
+        Trim the preallocated tail and finish the file.
+        :return: None
+        :rtype: None
+        """
+        if self._file.closed:
+            return
+        self._map.flush()
+        del self._map
+        self._map = None
+        self._file.truncate(HEADER_SIZE + self.frames * self.n * 2 *
+                            self.dim * 8)
+        self._file.seek(0)
+        self._file.write(_header((self.frames, self.n, 2 * self.dim)))
+        self._file.close()
+        self._write_meta()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_trajectory(path):
+    """
+    Open a recorded trajectory without reading it into memory.
+
+    Only the frames flushed so far are visible, even while the recorder
+    is still writing.
+
+    :param path: Trajectory .npy file
+    :type path: str
+    :return: (frames, bodies, 2 * D) read-only memmap and the metadata dict
+    :rtype: tuple
+    """
+    with open(metadata_path(path)) as f:
+        meta = json.load(f)
+    data = np.load(path, mmap_mode='r')
+    return data[:meta['frames']], meta
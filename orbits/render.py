@@ -0,0 +1,254 @@
+"""
+Batch drawing of many bodies onto a pygame surface.
+
+Rather than one Python call per body, positions are projected to pixels in
+one numpy operation, bodies outside the viewport are culled, and small
+points are written straight into the surface's pixel buffer, so swarms of
+1e5 particles draw in a few milliseconds.  Text is rendered once per
+distinct string (TextCache), and each frame only the regions drawn in it
+or the frame before are cleared and pushed to the display (DirtyRects).
+pygame is only imported by the functions that touch a surface.
+"""
+import collections
+
+import numpy as np
+
+# Points up to this radius (px) are stamped into the pixel buffer; larger
+# ones are drawn as circles one at a time
+MAX_STAMP = 4
+
+
+def project(positions, center, scale, px_center, px_size, margin=1):
+    """
+    Map positions to pixel coordinates.
+    :param positions: (N, 2) positions
+    :type positions: np.ndarray
+    :param center: Position at the centre of the viewport
+    :param scale: Pixels per unit of position, per axis (fractional zoom
+        levels are kept)
+    :param px_center: Pixel coordinates of the centre of the viewport
+    :param px_size: Width and height of the viewport (px)
+    :param margin: Pixel coordinates are clipped to this far outside the
+        viewport, so far off-screen points still fit an int
+    :type margin: int
+    :return: (N, 2) integer pixel coordinates, and the mask of those inside
+        the viewport
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    positions = np.asarray(positions, dtype=float)[:, :2]
+    pixels = np.floor((positions - center) * scale + px_center)
+    pixels = np.clip(pixels, -margin, np.add(px_size, margin - 1))
+    pixels = pixels.astype(int)
+    visible = np.all((pixels >= 0) & (pixels < px_size), axis=1)
+    return pixels, visible
+
+
+def map_colors(surface, colors):
+    """
+    Convert RGB colours to the pixel values of surface, as map_rgb would.
+    :param surface: A pygame surface
+    :param colors: (N, 3) RGB colours, 0-255
+    :type colors: np.ndarray
+    :return: (N,) pixel values
+    :rtype: np.ndarray
+    """
+    colors = np.asarray(colors, dtype=np.uint32)[:, :3]
+    shifts = np.array(surface.get_shifts()[:3], dtype=np.uint32)
+    losses = np.array(surface.get_losses()[:3], dtype=np.uint32)
+    mapped = ((colors >> losses) << shifts).sum(axis=1, dtype=np.uint32)
+    alpha = surface.get_masks()[3]
+    return mapped | np.uint32(alpha) if alpha else mapped
+
+
+def stamp(radius):
+    """
+    :param radius: Radius (px)
+    :type radius: int
+    :return: (K, 2) pixel offsets of a filled disc
+    :rtype: np.ndarray
+    """
+    r = int(radius)
+    dx, dy = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = dx ** 2 + dy ** 2 <= r * r
+    return np.column_stack([dx[inside], dy[inside]])
+
+
+def draw_points(surface, pixels, colors, radius=0):
+    """
+    Draw filled discs centred on pixels, culling what falls off surface.
+
+    :param surface: A pygame surface
+    :param pixels: (N, 2) integer pixel coordinates, e.g. from project()
+    :type pixels: np.ndarray
+    :param colors: (N, 3) RGB colours, or one colour for every point
+    :param radius: Disc radius (px); 0 draws single pixels
+    :type radius: int
+    :return: Bounding rectangle of what was drawn, None if nothing was
+    :rtype: pygame.Rect
+    """
+    import pygame
+    pixels = np.asarray(pixels, dtype=int)
+    colors = np.broadcast_to(np.asarray(colors), (len(pixels), 3))
+    if not len(pixels):
+        return None
+    lo, hi = pixels.min(axis=0) - radius, pixels.max(axis=0) + radius + 1
+    bounds = pygame.Rect(int(lo[0]), int(lo[1]), int(hi[0] - lo[0]),
+                         int(hi[1] - lo[1])).clip(surface.get_rect())
+    if radius > MAX_STAMP:
+        for p, c in zip(pixels, colors):
+            pygame.draw.circle(surface, [int(x) for x in c], p, radius)
+        return bounds
+    width, height = surface.get_size()
+    values = map_colors(surface, colors)
+    buffer = pygame.surfarray.pixels2d(surface)
+    try:
+        for offset in stamp(radius):
+            xy = pixels + offset
+            inside = (xy[:, 0] >= 0) & (xy[:, 0] < width) & \
+                (xy[:, 1] >= 0) & (xy[:, 1] < height)
+            buffer[xy[inside, 0], xy[inside, 1]] = values[inside]
+    finally:
+        # The surface stays locked while the pixel array exists
+        del buffer
+    return bounds
+
+
+def draw_trails(surface, pixels, colors, antialias=False):
+    """
+    Draw one polyline per body through its past pixel positions, with one
+    pygame call per body; bodies whose trail misses the surface are
+    skipped.
+    :param surface: A pygame surface
+    :param pixels: (k, N, 2) integer pixel coordinates, oldest first
+    :type pixels: np.ndarray
+    :param colors: (N, 3) RGB colours, or one colour for every trail
+    :param antialias: Draw with aalines
+    :type antialias: bool
+    :return: Bounding rectangle of what was drawn, None if nothing was
+    :rtype: pygame.Rect
+    """
+    import pygame
+    pixels = np.asarray(pixels)
+    if len(pixels) < 2:
+        return None
+    colors = np.broadcast_to(np.asarray(colors), (pixels.shape[1], 3))
+    lo, hi = pixels.min(axis=0), pixels.max(axis=0)
+    on = np.all((hi >= 0) & (lo < surface.get_size()), axis=1)
+    lines = pygame.draw.aalines if antialias else pygame.draw.lines
+    drawn = [lines(surface, [int(c) for c in colors[i]], False,
+                   pixels[:, i].tolist()) for i in np.flatnonzero(on)]
+    return drawn[0].unionall(drawn[1:]) if drawn else None
+
+
+class TextCache:
+    """
+    Rendered text surfaces, keyed by text and colours, so labels that did
+    not change since the last frame are not rendered again.  The least
+    recently used entries are dropped beyond capacity.
+    """
+
+    def __init__(self, font, capacity=256):
+        """
+        :param font: A pygame font
+        :param capacity: Number of surfaces kept
+        :type capacity: int
+        :return: None
+        :rtype: None
+        """
+        self.font = font
+        self.capacity = capacity
+        self.surfaces = collections.OrderedDict()
+        self.misses = 0
+
+    def render(self, text, color, background=None):
+        """
+        :return: The surface font.render(text, 1, color, background) gives
+        """
+        key = (text, tuple(color), None if background is None
+               else tuple(background))
+        surface = self.surfaces.get(key)
+        if surface is None:
+            self.misses += 1
+            surface = self.font.render(text, 1, color, background)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.capacity:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+
+class DirtyRects:
+    """
+    Tracks the regions drawn each frame, so a frame only clears what the
+    previous one drew and only pushes the changed regions to the display.
+
+        dirty.begin()           # erase last frame's drawing
+        dirty.add(draw(...))    # for everything drawn
+        dirty.present()         # pygame.display.update(changed regions)
+    """
+
+    def __init__(self, surface, background=(0, 0, 0), full=0.5):
+        """
+        :param surface: The display surface
+        :param background: Colour drawing is erased with
+        :param full: Fraction of the surface beyond which the whole frame
+            is redrawn and flipped instead
+        :type full: float
+        :return: None
+        :rtype: None
+        """
+        self.surface = surface
+        self.background = background
+        self.full = full
+        self.previous = []
+        self.current = []
+        self.invalid = True
+
+    def invalidate(self):
+        """
+        Redraw and push the whole surface on the next frame.
+        :return: None
+        :rtype: None
+        """
+        self.invalid = True
+
+    def begin(self):
+        """
+        Start a frame by erasing what the previous one drew.
+        :return: None
+        :rtype: None
+        """
+        if self.invalid:
+            self.surface.fill(self.background)
+        else:
+            for rect in self.previous:
+                self.surface.fill(self.background, rect)
+
+    def add(self, rect):
+        """
+        Mark a region as drawn this frame; None is ignored.
+        :return: rect
+        """
+        if rect is not None and rect.width and rect.height:
+            self.current.append(rect)
+        return rect
+
+    def present(self):
+        """
+        Push the regions changed since the previous frame to the display.
+        :return: Regions updated, all of the surface after a full redraw
+        :rtype: list[pygame.Rect]
+        """
+        import pygame
+        changed = self.previous + self.current
+        area = sum(r.width * r.height for r in changed)
+        whole = self.surface.get_rect()
+        if self.invalid or area > self.full * whole.width * whole.height:
+            pygame.display.flip()
+            changed = [whole]
+        else:
+            pygame.display.update(changed)
+        self.previous, self.current = self.current, []
+        self.invalid = False
+        return changed
@@ -0,0 +1,289 @@
+"""
+Generators for standard initial conditions, returned as BodyStores.
+"""
+import os
+
+import numpy as np
+
+from .forces import G
+from .state import BodyStore
+
+AU = 1.49597871e11  # m
+M_SOL = 1.9891e30  # kg
+
+# The planetary system of orbits3.py: periapsis distances and speeds
+NAMES = ['Me', 'V', 'E', 'Ma', 'J', 'S', 'U', 'N', 'P']
+MASSES = [.330e24, 4.87e24, 5.97e24, .642e24, 1898e24, 568e24, 86.8e24, 102e24,
+          .0131e24]
+RADII = [2.440e6, 6.052e6, 6.378e6, 3.396e6, 7.1492e7, 6.0268e7, 2.5550e7,
+         2.4750e7, 1.195e6]
+DIST = [4.600e10, 1.0750e11, 1.4710e11, 2.0660e11, 7.4050e11, 1.35260e12,
+        2.74130e12, 4.44450e12, 4.43500e12]
+VELOCS = [5.897e4, 3.525e4, 3.029e4, 2.650e4, 1.371e4, 1.018e4, 7.11e3, 5.50e3,
+          6.10e3]
+R_SOL = 6.957e8  # m
+
+MOON_NAMES = ['CALLISTO', 'GANYMEDE', 'EUROPA', 'IO', 'LUNA']
+MOON_PLANET = ['J', 'J', 'J', 'J', 'E']
+MOON_MASSES = [107.6e21, 148.2e21, 48.0e21, 89.3e21, 7.34e22]
+MOON_RADII = [2.4105e6, 2.681e6, 1.561e6, 1.765e6, 3.476e6]
+MOON_DIST = [1.883e9, 1.070e9, 6.71e8, 4.22e8, 3.844e8]
+MOON_VELOCS = [8.2e3, 10.9e3, 13.7e3, 17.3e3, 1.023e3]
+
+
+def solar(moons=True, dim=2):
+    """
+    Sol, the nine planets and (optionally) five moons, as in orbits3.py.
+
+    Every body starts on the +x axis at periapsis, moving in +y; moons are
+    placed relative to their planet.
+
+    :param moons: Include Callisto, Ganymede, Europa, Io and Luna
+    :type moons: bool
+    :param dim: 2, or 3 for the same system in the z = 0 plane
+    :type dim: int
+    :return: 10 or 15 bodies
+    :rtype: BodyStore
+    """
+    store = BodyStore(dim, 16)
+    zero = [0.0] * dim
+
+    def vector(x, y):
+        return [x, y] + [0.0] * (dim - 2)
+
+    store.add(zero, zero, M_SOL, R_SOL, 'Sol')
+    for x in range(len(NAMES)):
+        store.add(vector(DIST[x], 0), vector(0, VELOCS[x]), MASSES[x],
+                  RADII[x], NAMES[x])
+    if moons:
+        for x in range(len(MOON_NAMES)):
+            planet = NAMES.index(MOON_PLANET[x]) + 1
+            store.add(store.positions[planet] + vector(MOON_DIST[x], 0),
+                      store.velocities[planet] + vector(0, MOON_VELOCS[x]),
+                      MOON_MASSES[x], MOON_RADII[x], MOON_NAMES[x])
+    return store
+
+
+def sun_earth():
+    """
+    The Sun and the Earth at aphelion, 7.155 degrees out of plane, as in
+    main.py (3D).
+
+    :return: 2 bodies
+    :rtype: BodyStore
+    """
+    polar = np.radians(90 - 7.155)
+    earth = 1.521e11 * np.array([np.sin(polar), 0.0, np.cos(polar)])
+    return BodyStore.from_arrays([[0.0, 0.0, 0.0], earth],
+                                 [[0.0, 0.0, 0.0], [0.0, 2.93e4, 0.0]],
+                                 [1.988e30, 5.972e24], [R_SOL, 6.371e6],
+                                 ['Sun', 'Earth'])
+
+
+def binary_star():
+    """
+    Two near-solar stars 2e11 m apart with a massless third body between
+    them, as in orbits.py.
+
+    :return: 3 bodies
+    :rtype: BodyStore
+    """
+    return BodyStore.from_arrays([[1.0e11, 0.0], [-1.0e11, 0.0], [0.0, 0.0]],
+                                 [[0.0, 4000.0], [0.0, -4000.0], [0.0, 0.0]],
+                                 [1.9891e30, 1.981e30, 0.0],
+                                 [695.5e6, 695.5e6, 0.0],
+                                 ['Star_1', 'Star_2', 'Star_3'])
+
+
+def disk(count, central_mass=M_SOL, disk_mass=1e-3 * M_SOL, r_min=0.5 * AU,
+         r_max=30 * AU, dim=2, seed=None):
+    """
+    A star orbited by a thin disk of count particles on circular orbits.
+
+    Particles are spread uniformly in area between r_min and r_max; each
+    moves at the circular velocity of the star plus the disk mass inside
+    its radius.  The star is body 0.
+
+    :param count: Number of disk particles
+    :type count: int
+    :param central_mass: Mass of the star (kg)
+    :type central_mass: float
+    :param disk_mass: Total mass of the disk (kg)
+    :type disk_mass: float
+    :param r_min: Inner edge (m)
+    :type r_min: float
+    :param r_max: Outer edge (m)
+    :type r_max: float
+    :param dim: 2, or 3 for a disk in the z = 0 plane
+    :type dim: int
+    :param seed: Random seed
+    :type seed: int
+    :return: count + 1 bodies
+    :rtype: BodyStore
+    """
+    rng = np.random.default_rng(seed)
+    r = np.sqrt(rng.uniform(r_min ** 2, r_max ** 2, count))
+    phi = rng.uniform(0, 2 * np.pi, count)
+    enclosed = disk_mass * (r ** 2 - r_min ** 2) / (r_max ** 2 - r_min ** 2)
+    v = np.sqrt(G * (central_mass + enclosed) / r)
+    positions = np.zeros((count + 1, dim))
+    velocities = np.zeros((count + 1, dim))
+    positions[1:, 0] = r * np.cos(phi)
+    positions[1:, 1] = r * np.sin(phi)
+    velocities[1:, 0] = -v * np.sin(phi)
+    velocities[1:, 1] = v * np.cos(phi)
+    masses = np.append(central_mass, np.full(count, disk_mass / count))
+    names = ['Star'] + ['Disk #' + str(i) for i in range(count)]
+    return BodyStore.from_arrays(positions, velocities, masses, names=names)
+
+
+def cluster(count, total_mass=1e3 * M_SOL, scale=1e4 * AU, seed=None):
+    """
+    An equal-mass Plummer sphere in virial equilibrium (3D).
+
+    Radii are drawn from the Plummer cumulative mass profile, speeds by
+    rejection sampling from its distribution function (Aarseth, Henon and
+    Wielen 1974).
+
+    :param count: Number of stars
+    :type count: int
+    :param total_mass: Total mass (kg)
+    :type total_mass: float
+    :param scale: Plummer scale radius (m)
+    :type scale: float
+    :param seed: Random seed
+    :type seed: int
+    :return: count bodies
+    :rtype: BodyStore
+    """
+    rng = np.random.default_rng(seed)
+
+    def directions(n):
+        cos_t = rng.uniform(-1, 1, n)
+        sin_t = np.sqrt(1 - cos_t ** 2)
+        phi = rng.uniform(0, 2 * np.pi, n)
+        return np.column_stack([sin_t * np.cos(phi), sin_t * np.sin(phi),
+                                cos_t])
+
+    m = rng.uniform(1e-6, 1, count)
+    r = scale / np.sqrt(m ** (-2.0 / 3.0) - 1)
+    # q = v / v_escape with density proportional to q^2 (1 - q^2)^3.5
+    q = np.empty(count)
+    todo = np.arange(count)
+    while len(todo):
+        x = rng.uniform(0, 1, len(todo))
+        y = rng.uniform(0, 0.1, len(todo))
+        ok = y < x ** 2 * (1 - x ** 2) ** 3.5
+        q[todo[ok]] = x[ok]
+        todo = todo[~ok]
+    v_esc = np.sqrt(2 * G * total_mass / np.sqrt(r ** 2 + scale ** 2))
+    positions = directions(count) * r[:, None]
+    velocities = directions(count) * (q * v_esc)[:, None]
+    positions -= positions.mean(axis=0)
+    velocities -= velocities.mean(axis=0)
+    masses = np.full(count, total_mass / count)
+    return BodyStore.from_arrays(positions, velocities, masses)
+
+
+def particles(count, dim=2, seed=None):
+    """
+    A swarm of light particles like orbits.py's make_particles: positions
+    within +-4e7 m (x) and +-5e7 m (y), speeds up to 4 km/s per axis,
+    masses of 1 to 200 kg.
+
+    make_particles put particles on a coarse grid where many coincide;
+    here positions are drawn continuously from the same box.
+
+    :param count: Number of particles
+    :type count: int
+    :param dim: 2, or 3 for a swarm with the same spread in z as in x
+    :type dim: int
+    :param seed: Random seed
+    :type seed: int
+    :return: count bodies
+    :rtype: BodyStore
+    """
+    rng = np.random.default_rng(seed)
+    extent = np.array([4e7, 5e7, 4e7][:dim])
+    positions = rng.uniform(-1, 1, (count, dim)) * extent
+    velocities = rng.uniform(-4000, 4000, (count, dim))
+    masses = rng.integers(1, 201, count).astype(float)
+    radii = rng.integers(1, 101, count).astype(float)
+    names = ['Particle #' + str(i) for i in range(count)]
+    return BodyStore.from_arrays(positions, velocities, masses, radii, names)
+
+
+def belt(count, r_min=2.1 * AU, r_max=3.3 * AU, dim=2, seed=None):
+    """
+    Sol and the nine planets of solar() with a belt of count massless test
+    particles on circular orbits about Sol: the asteroid belt by default,
+    the Kuiper belt with r_min=30 AU and r_max=50 AU.
+
+    The particles are spread uniformly in area and follow the planets, so
+    they can be integrated with the test-particles integrator.
+
+    :param count: Number of test particles
+    :type count: int
+    :param r_min: Inner edge (m)
+    :type r_min: float
+    :param r_max: Outer edge (m)
+    :type r_max: float
+    :param dim: 2, or 3 for a belt in the z = 0 plane
+    :type dim: int
+    :param seed: Random seed
+    :type seed: int
+    :return: count + 10 bodies
+    :rtype: BodyStore
+    """
+    planets = solar(moons=False, dim=dim)
+    rng = np.random.default_rng(seed)
+    r = np.sqrt(rng.uniform(r_min ** 2, r_max ** 2, count))
+    phi = rng.uniform(0, 2 * np.pi, count)
+    v = np.sqrt(G * M_SOL / r)
+    positions = np.zeros((count, dim))
+    velocities = np.zeros((count, dim))
+    positions[:, 0] = r * np.cos(phi)
+    positions[:, 1] = r * np.sin(phi)
+    velocities[:, 0] = -v * np.sin(phi)
+    velocities[:, 1] = v * np.cos(phi)
+    return BodyStore.from_arrays(
+        np.vstack([planets.positions, positions]),
+        np.vstack([planets.velocities, velocities]),
+        np.append(planets.masses, np.zeros(count)),
+        np.append(planets.radii, np.zeros(count)),
+        planets.names + ['Test #' + str(i) for i in range(count)])
+
+
+SCENARIOS = {'solar': solar, 'sun-earth': sun_earth,
+             'binary': binary_star, 'disk': disk, 'cluster': cluster,
+             'particles': particles, 'belt': belt}
+
+
+def is_scenario_file(name):
+    """
+    :return: Whether name is a scenario file rather than a generator name
+    :rtype: bool
+    """
+    from .catalog import FORMATS
+    return name not in SCENARIOS and \
+        os.path.splitext(name)[1].lower() in FORMATS
+
+
+def make_scenario(name, **options):
+    """
+    Build a named scenario, or load one from a file (see catalog).
+    :param name: One of SCENARIOS, or a .json, .toml, .csv or .npz file
+    :type name: str
+    :param options: Keyword arguments of the generator (count, seed, ...)
+        or of load_catalog
+    :return: The bodies
+    :rtype: BodyStore
+    """
+    if is_scenario_file(name):
+        from .catalog import load_catalog
+        return load_catalog(name, **options)
+    try:
+        generator = SCENARIOS[name]
+    except KeyError:
+        raise ValueError('unknown scenario: ' + repr(name))
+    return generator(**options)
@@ -0,0 +1,72 @@
+"""
+Frame scheduling for interactive front ends: how many simulation steps to
+run between two rendered frames.
+"""
+import time
+
+MODES = ('fixed', 'max')
+
+
+class FrameScheduler:
+    """
+    Runs simulation steps for one frame, either a fixed number of them or
+    as many as fit in a wall-clock budget.
+
+    In 'fixed' mode every frame runs steps_per_frame steps and the caller
+    is expected to cap the frame rate (e.g. pygame's clock.tick(fps)).  In
+    'max' mode a frame keeps stepping until the next step would overrun
+    budget seconds, so the simulation runs as fast as the CPU allows and
+    only the latest state is drawn.
+    """
+
+    def __init__(self, mode='fixed', steps_per_frame=1, budget=1 / 30.0,
+                 clock=time.perf_counter):
+        """
+        :param mode: 'fixed' or 'max'
+        :type mode: str
+        :param steps_per_frame: Steps per frame in 'fixed' mode
+        :type steps_per_frame: int
+        :param budget: Seconds of stepping per frame in 'max' mode
+        :type budget: float
+        :param clock: Function returning the current time in seconds
+        :return: None
+        :rtype: None
+        """
+        if mode not in MODES:
+            raise ValueError('unknown scheduling mode: ' + repr(mode))
+        self.mode = mode
+        self.steps_per_frame = steps_per_frame
+        self.budget = budget
+        self.clock = clock
+        self.step_time = 0.0  # running mean of the wall time of one step
+        self.last_steps = 0  # steps run in the last frame
+
+    def toggle(self):
+        """
+        Switch between 'fixed' and 'max' mode.
+        :return: None
+        :rtype: None
+        """
+        self.mode = MODES[(MODES.index(self.mode) + 1) % len(MODES)]
+
+    def run_frame(self, step):
+        """
+        Call step() as often as this frame allows; always at least once.
+        :param step: Function advancing the simulation by one step
+        :return: Number of steps run
+        :rtype: int
+        """
+        start = now = self.clock()
+        steps = 0
+        while True:
+            step()
+            steps += 1
+            last, now = now, self.clock()
+            self.step_time += 0.1 * ((now - last) - self.step_time)
+            if self.mode == 'fixed':
+                if steps >= self.steps_per_frame:
+                    break
+            elif now - start + self.step_time > self.budget:
+                break
+        self.last_steps = steps
+        return steps
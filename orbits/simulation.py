@@ -0,0 +1,68 @@
+"""
+Headless simulation driver: a store, a force backend, an integrator and a
+clock, with no display attached.
+"""
+from .forces import make_backend
+from .integrators import make_integrator
+
+
+class Simulation:
+    """
+    Advances a BodyStore by fixed steps of dt and keeps track of time.
+    """
+
+    def __init__(self, store, forces=None, integrator=None, dt=3600.0):
+        """
+        :param store: The bodies
+        :type store: BodyStore
+        :param forces: A force backend (direct summation if omitted)
+        :param integrator: An integrator (leapfrog if omitted)
+        :type integrator: Integrator
+        :param dt: Timestep (s)
+        :type dt: float
+        :return: None
+        :rtype: None
+        """
+        self.store = store
+        self.forces = make_backend('direct') if forces is None else forces
+        self.integrator = make_integrator() if integrator is None \
+            else integrator
+        self.dt = dt
+        self.sim_steps = 0
+        self.time_elapsed = 0.0  # s
+
+    def step(self):
+        """
+        Advance by one timestep.
+        :return: None
+        :rtype: None
+        """
+        self.integrator.step(self.store, self.forces, self.dt)
+        self.sim_steps += 1
+        self.time_elapsed += self.dt
+
+    def run(self, steps, callback=None):
+        """
+        Advance by steps timesteps, as fast as possible.
+        :param steps: Number of steps
+        :type steps: int
+        :param callback: Called as callback(self) after every step
+        :return: None
+        :rtype: None
+        """
+        for _ in range(steps):
+            self.step()
+            if callback is not None:
+                callback(self)
+
+    def close(self):
+        """
+        Stop the worker threads of the integrator and the force backend, if
+        they have any; they are started again if the simulation runs on.
+        :return: None
+        :rtype: None
+        """
+        for part in (self.integrator, self.forces):
+            close = getattr(part, 'close', None)
+            if close is not None:
+                close()
@@ -0,0 +1,205 @@
+"""
+Structure-of-arrays storage for the bodies of a simulation.
+
+Positions, velocities, accelerations, masses and radii of every body live in
+contiguous numpy arrays, one row per body, so that force and integration
+kernels can work on the whole system at once.  Object-style bodies (the
+Body classes of the individual scripts) keep only an index into a store and
+read and write their state through it.
+"""
+import numpy as np
+
+
+class BodyStore:
+    """
+    Contiguous (N, D) state arrays for N bodies in D (2 or 3) dimensions.
+    """
+
+    def __init__(self, dim=2, capacity=16):
+        """
+        Creates an empty store.
+
+        Rows are appended with add(); the backing arrays grow geometrically,
+        so building a system one body at a time stays cheap.  The public
+        arrays (positions, velocities, ...) are views onto the first n rows
+        and must be re-fetched after a body has been added.
+
+        :param dim: Number of spatial dimensions
+        :type dim: int
+        :param capacity: Number of rows to preallocate
+        :type capacity: int
+        :return: None
+        :rtype: None
+        """
+        self.dim = dim
+        self.n = 0
+        self.names = []
+        self._allocate(max(1, capacity))
+
+    def _allocate(self, capacity):
+        """
+        (Re)allocate the backing arrays with room for capacity rows.
+        :param capacity: Number of rows
+        :type capacity: int
+        :return: None
+        :rtype: None
+        """
+        old = getattr(self, '_pos', None)
+        pos = np.zeros((capacity, self.dim))
+        vel = np.zeros((capacity, self.dim))
+        acc = np.zeros((capacity, self.dim))
+        mass = np.zeros(capacity)
+        radius = np.zeros(capacity)
+        if old is not None:
+            pos[:self.n] = self._pos[:self.n]
+            vel[:self.n] = self._vel[:self.n]
+            acc[:self.n] = self._acc[:self.n]
+            mass[:self.n] = self._mass[:self.n]
+            radius[:self.n] = self._radius[:self.n]
+        self._pos, self._vel, self._acc = pos, vel, acc
+        self._mass, self._radius = mass, radius
+
+    @classmethod
+    def from_arrays(cls, positions, velocities, masses, radii=None,
+                    names=None):
+        """
+        Build a store directly from state arrays, without per-body calls.
+        :param positions: (N, D) positions
+        :param velocities: (N, D) velocities
+        :param masses: (N,) masses
+        :param radii: (N,) radii, zero if omitted
+        :param names: N names, 'Body #i' if omitted
+        :return: A store holding copies of the arrays
+        :rtype: BodyStore
+        """
+        positions = np.asarray(positions, dtype=float)
+        n, dim = positions.shape
+        store = cls(dim, n)
+        store.n = n
+        store._pos[:] = positions
+        store._vel[:] = velocities
+        store._mass[:] = masses
+        if radii is not None:
+            store._radius[:] = radii
+        if names is None:
+            names = ['Body #' + str(i) for i in range(n)]
+        store.names = list(names)
+        return store
+
+    def add(self, position, velocity=None, mass=0.0, radius=0.0, name=''):
+        """
+        Append a body and return its row index.
+        :param position: D position components
+        :param velocity: D velocity components (zero if omitted)
+        :param mass: Mass
+        :type mass: float
+        :param radius: Radius
+        :type radius: float
+        :param name: Name
+        :type name: str
+        :return: Row index of the new body
+        :rtype: int
+        """
+        if self.n == len(self._mass):
+            self._allocate(2 * len(self._mass))
+        i = self.n
+        self._pos[i] = position
+        self._vel[i] = 0.0 if velocity is None else velocity
+        self._acc[i] = 0.0
+        self._mass[i] = mass
+        self._radius[i] = radius
+        self.names.append(name)
+        self.n += 1
+        return i
+
+    def remove(self, rows):
+        """
+        Delete bodies, moving the rows after them up to keep the arrays
+        contiguous.  Row indices held by object-style bodies are not
+        updated.
+        :param rows: Indices (or boolean mask) of the bodies to delete
+        :type rows: np.ndarray
+        :return: Old index of every remaining row, in order
+        :rtype: np.ndarray
+        """
+        keep = np.ones(self.n, bool)
+        keep[rows] = False
+        kept = np.flatnonzero(keep)
+        m = len(kept)
+        for array in (self._pos, self._vel, self._acc, self._mass,
+                      self._radius):
+            array[:m] = array[kept]
+        self.names = [self.names[i] for i in kept]
+        self.n = m
+        return kept
+
+    @property
+    def positions(self):
+        return self._pos[:self.n]
+
+    @positions.setter
+    def positions(self, value):
+        self._pos[:self.n] = value
+
+    @property
+    def velocities(self):
+        return self._vel[:self.n]
+
+    @velocities.setter
+    def velocities(self, value):
+        self._vel[:self.n] = value
+
+    @property
+    def accelerations(self):
+        return self._acc[:self.n]
+
+    @accelerations.setter
+    def accelerations(self, value):
+        self._acc[:self.n] = value
+
+    @property
+    def masses(self):
+        return self._mass[:self.n]
+
+    @masses.setter
+    def masses(self, value):
+        self._mass[:self.n] = value
+
+    @property
+    def radii(self):
+        return self._radius[:self.n]
+
+    @radii.setter
+    def radii(self, value):
+        self._radius[:self.n] = value
+
+    def __len__(self):
+        return self.n
+
+
+def row_property(array, axis=None):
+    """
+    Property exposing a body's row (or one component of it) in its store.
+
+    Meant for classes with `store` and `index` attributes, which then behave
+    like plain attribute holders while the data stays in the store's arrays.
+
+    :param array: Name of the store array, e.g. 'positions'
+    :type array: str
+    :param axis: Component index, or None for the whole row (as a view)
+    :type axis: int
+    :return: A property
+    :rtype: property
+    """
+    if axis is None:
+        key = lambda self: self.index
+    else:
+        key = lambda self: (self.index, axis)
+
+    def fget(self):
+        return getattr(self.store, array)[key(self)]
+
+    def fset(self, value):
+        getattr(self.store, array)[key(self)] = value
+
+    return property(fget, fset)
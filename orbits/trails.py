@@ -0,0 +1,80 @@
+"""
+Bounded position history of every body, for drawing orbit trails.
+
+Positions are kept in simulation units in a fixed (length, N, D) ring
+buffer and only projected to the screen when drawn, so trails stay correct
+while the view is zoomed, shifted or following a body, and memory stays
+the same however long the session runs.
+"""
+import numpy as np
+
+
+class Trails:
+    """
+    The last length recorded positions of every body, one recording every
+    `every` calls to record().
+    """
+
+    def __init__(self, length=500, every=1):
+        """
+        :param length: Number of positions kept per body
+        :type length: int
+        :param every: Keep one of every this many positions
+        :type every: int
+        :return: None
+        :rtype: None
+        """
+        if length < 2 or every < 1:
+            raise ValueError('trails need length >= 2 and every >= 1')
+        self.length = length
+        self.every = every
+        self.clear()
+
+    def clear(self):
+        """
+        Forget the history.
+        :return: None
+        :rtype: None
+        """
+        self.buffer = None
+        self.head = 0  # next row of the buffer to write
+        self.count = 0  # rows filled
+        self.calls = 0
+
+    def record(self, positions):
+        """
+        Offer the current positions; every `every`-th call they are kept,
+        overwriting the oldest.  A change in the number of bodies starts
+        the history afresh.
+        :param positions: (N, D) positions
+        :type positions: np.ndarray
+        :return: None
+        :rtype: None
+        """
+        if self.buffer is not None and \
+                self.buffer.shape[1:] != np.shape(positions):
+            self.clear()
+        self.calls += 1
+        if (self.calls - 1) % self.every:
+            return
+        if self.buffer is None:
+            self.buffer = np.empty((self.length,) + np.shape(positions))
+        self.buffer[self.head] = positions
+        self.head = (self.head + 1) % self.length
+        self.count = min(self.count + 1, self.length)
+
+    def history(self):
+        """
+        :return: (k, N, D) recorded positions, oldest first
+        :rtype: np.ndarray
+        """
+        if self.buffer is None:
+            return np.zeros((0, 0, 0))
+        if self.count < self.length:
+            return self.buffer[:self.count]
+        return np.concatenate([self.buffer[self.head:],
+                               self.buffer[:self.head]])
+
+    @property
+    def nbytes(self):
+        return 0 if self.buffer is None else self.buffer.nbytes
@@ -17,9 +17,13 @@ config = {
 	'description': 'Experiments with principles of orbital mechanics.',
 	'long_description': 'Experiments with principles of orbital mechanics.',
 	'keywords': '',
-	'install_requires': ['nose'],
+	'install_requires': ['nose', 'numpy>=1.23',
+	                     'tomli; python_version < "3.11"'],
+	'extras_require': {'jit': ['numba']},
 	'packages': ['orbits'],
-	'scripts': []
+	'package_data': {'orbits': ['catalogs/*.toml']},
+	'scripts': [],
+	'entry_points': {'console_scripts': ['orbits = orbits.cli:main']}
 }
 	
 setup(**config)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from .context import orbits
+from orbits.barneshut import BarnesHut, Tree
+from orbits.forces import direct_sum, make_backend
+from orbits.scenarios import cluster, disk
+
+
+def relative_error(acc, ref):
+    return np.sqrt(np.mean(np.sum((acc - ref) ** 2, axis=1) /
+                           np.sum(ref ** 2, axis=1)))
+
+
+def test_theta_zero_is_exact():
+    rng = np.random.default_rng(4)
+    for dim in (2, 3):
+        positions = rng.normal(size=(500, dim))
+        masses = rng.uniform(1, 2, 500)
+        np.testing.assert_allclose(
+            BarnesHut(theta=0.0).accelerations(positions, masses),
+            direct_sum(positions, masses), rtol=1e-9)
+
+
+def test_error_grows_with_theta():
+    rng = np.random.default_rng(5)
+    positions = rng.uniform(-1, 1, size=(2000, 3))
+    masses = rng.uniform(1, 2, 2000)
+    ref = direct_sum(positions, masses)
+    errors = [relative_error(BarnesHut(theta).accelerations(positions, masses),
+                             ref) for theta in (0.3, 0.5, 0.8)]
+    assert errors[0] < errors[1] < errors[2] < 0.05
+
+
+def test_tree_partitions_particles():
+    rng = np.random.default_rng(6)
+    positions = rng.normal(size=(1000, 2))
+    positions[:20] = 0.0  # coincident particles end in one deepest leaf
+    tree = Tree(positions, np.ones(1000), leaf_size=4)
+    leaves = tree.n_children == 0
+    assert tree.count[leaves].sum() == 1000
+    assert tree.mass[0] == 1000
+    np.testing.assert_allclose(tree.com[0], positions.mean(axis=0))
+
+
+def test_targets_walk_matches_self_gravity():
+    store = cluster(800, seed=1)
+    bh = BarnesHut(theta=0.4)
+    acc = bh.accelerations(store.positions, store.masses)
+    walked = bh.tree.accelerations(store.positions, 0.4)
+    assert relative_error(walked, acc) < 1e-2
+
+
+def test_backend_selection():
+    store = disk(300, seed=2)
+    bh = make_backend('barnes-hut', theta=0.3)
+    ref = make_backend('direct').accelerations(store.positions, store.masses)
+    assert relative_error(bh.accelerations(store.positions, store.masses),
+                          ref) < 1e-2
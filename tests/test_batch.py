@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from .context import orbits
+from orbits.batch import Batch, batched_accelerations, batched_energy
+from orbits.diagnostics import energy
+from orbits.ensemble import run_ensemble, sample
+from orbits.forces import G, direct_sum
+from orbits.integrators import make_integrator
+from orbits.scenarios import make_scenario
+from orbits.simulation import Simulation
+
+
+def binaries(count):
+    stores = [make_scenario('binary') for _ in range(count)]
+    for i, store in enumerate(stores):
+        store.velocities[0, 1] += 100.0 * i
+    return stores
+
+
+def test_kernels_match_single_system():
+    stores = [make_scenario('cluster', count=7, seed=s) for s in range(3)]
+    x = np.array([s.positions for s in stores])
+    v = np.array([s.velocities for s in stores])
+    m = np.array([s.masses for s in stores])
+    got = batched_accelerations(x, m)
+    for i, store in enumerate(stores):
+        np.testing.assert_allclose(got[i], direct_sum(x[i], m[i]),
+                                   rtol=1e-12)
+        assert np.isclose(batched_energy(x, v, m)[i], energy(store, G=G),
+                          rtol=1e-12)
+
+
+@pytest.mark.parametrize('name', ['leapfrog', 'yoshida4'])
+def test_batch_matches_simulation(name):
+    stores = binaries(4)
+    batch = Batch.from_stores(stores, [3600.0, 1800.0, 3600.0, 7200.0],
+                              t_end=50 * 3600.0, integrator=name)
+    assert batch.run() == 100
+    assert batch.finished.all() and not batch.active.any()
+    np.testing.assert_array_equal(batch.steps, [50, 100, 50, 25])
+    np.testing.assert_array_equal(batch.time, 50 * 3600.0)
+    for i, store in enumerate(binaries(4)):
+        sim = Simulation(store, integrator=make_integrator(name),
+                         dt=batch.dt[i])
+        sim.run(batch.steps[i])
+        np.testing.assert_array_equal(batch.positions[i], store.positions)
+
+
+def test_partial_final_step_and_ejection():
+    batch = Batch.from_stores(binaries(3), 3600.0,
+                              t_end=[1000.0, np.inf, np.inf])
+    batch.step()
+    assert batch.finished.tolist() == [True, False, False]
+    assert batch.time[0] == 1000.0
+    frozen = batch.positions[0].copy()
+    batch.velocities[2, 2] = [1e7, 0.0]  # fling the third body away
+    assert batch.run(steps=10, escape_radius=3e11) == 10
+    assert batch.ejected.tolist() == [False, False, True]
+    assert batch.steps.tolist() == [1, 11, batch.steps[2]]
+    assert batch.steps[2] < 11
+    np.testing.assert_array_equal(batch.positions[0], frozen)
+    with pytest.raises(ValueError):
+        Batch.from_stores(binaries(2), 3600.0, integrator='block')
+
+
+def test_batched_ensemble_matches_pool():
+    members = sample(6, seed=4, **{'Star_1.mass': (1.9e30, 2.1e30)})
+    one = run_ensemble('binary', members, steps=20, workers=1)
+    many = run_ensemble('binary', members, steps=20, workers=1, batch=True)
+    np.testing.assert_array_equal(many['positions'], one['positions'])
+    np.testing.assert_allclose(many['energy_error'], one['energy_error'],
+                               rtol=1e-3, atol=1e-15)
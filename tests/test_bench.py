@@ -0,0 +1,58 @@
+import copy
+import json
+import os
+import tempfile
+
+from .context import orbits
+from orbits import bench, jit
+from orbits.cli import main
+from orbits.scenarios import make_scenario
+
+
+def test_run_case_measures():
+    result = bench.run_case('solar', 'direct', 'leapfrog', steps=10)
+    assert result['bodies'] == 15 and result['steps'] == 10
+    assert result['pairs'] == 11 * 15 * 15
+    assert result['steps_per_s'] > 0 and result['peak_memory'] > 0
+    assert result['energy_drift'] < 1e-8
+    assert result['angular_momentum_drift'] < 1e-12
+    assert not bench.applicable('particles-1000', 'wisdom-holman')
+    parallel = bench.run_case('solar', 'parallel', 'leapfrog', steps=10)
+    assert parallel['pairs'] == result['pairs']
+    # The pairs test particles evaluate themselves are counted too
+    assert bench.run_case('belt-10000', 'direct', 'test-particles',
+                          steps=2)['pairs'] == 3 * 10010 * 10
+    assert make_scenario('particles', count=10, seed=1).positions.shape == \
+        (10, 2)
+
+
+def test_compare_flags_regressions():
+    results = {'results': [bench.run_case('binary', steps=5)]}
+    assert bench.compare(results, results) == []
+    baseline = copy.deepcopy(results)
+    baseline['results'][0]['steps_per_s'] *= 2
+    baseline['results'][0]['energy_drift'] /= 1e3
+    regressions = bench.compare(results, baseline)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('binary/direct/leapfrog')
+
+
+def test_cli_bench_baseline():
+    path = os.path.join(tempfile.mkdtemp(), 'bench.json')
+    argv = ['bench', '--scenario', 'binary', '--forces', 'direct',
+            '--integrator', 'euler']
+    assert main(argv + ['--output', path]) == 0
+    with open(path) as f:
+        assert json.load(f)['results'][0]['integrator'] == 'euler'
+    assert main(argv + ['--baseline', path, '--slower', '0.9']) == 0
+
+
+def test_numba_backend(monkeypatch):
+    if jit.available():
+        # The fused leapfrog substeps evaluate through the counting wrapper
+        result = bench.run_case('solar', 'numba', 'leapfrog', steps=10)
+        assert result['pairs'] == 11 * 15 * 15
+    monkeypatch.setattr(jit, 'available', lambda: False)
+    results = bench.run_suite(['binary'], ['numba'], ['leapfrog'])
+    assert results['results'] == []
+    assert results['skipped'] == {'numba': 'numba is not installed'}
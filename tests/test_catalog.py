@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from .context import orbits
+from orbits.catalog import compiled_path, load_catalog, save_catalog
+from orbits.cli import main
+from orbits.scenarios import AU, make_scenario, particles, solar
+
+CATALOGS = os.path.join(os.path.dirname(orbits.__file__), 'catalogs')
+
+
+def test_solar_file_matches_generator():
+    cache = tempfile.mkdtemp()
+    loaded = load_catalog(os.path.join(CATALOGS, 'solar.toml'),
+                          cache_dir=cache)
+    built = solar()
+    assert loaded.names == built.names
+    np.testing.assert_allclose(loaded.positions, built.positions)
+    np.testing.assert_allclose(loaded.velocities, built.velocities)
+    np.testing.assert_allclose(loaded.masses, built.masses)
+    np.testing.assert_allclose(loaded.radii, built.radii)
+
+
+def test_units_and_parents():
+    path = os.path.join(tempfile.mkdtemp(), 'pair.json')
+    with open(path, 'w') as f:
+        json.dump({'units': {'length': 'AU', 'speed': 'km/s',
+                             'mass': 'M_earth'},
+                   'bodies': [{'name': 'A', 'mass': 1, 'position': [1, 0],
+                               'velocity': [0, 30]},
+                              {'name': 'b', 'parent': 'A',
+                               'position': [0.5, 0], 'velocity': [0, 1]}]},
+                  f)
+    store = load_catalog(path, cache=False)
+    np.testing.assert_allclose(store.positions, [[AU, 0], [1.5 * AU, 0]])
+    np.testing.assert_allclose(store.velocities, [[0, 3e4], [0, 3.1e4]])
+    assert store.masses[0] == 5.972e24 and store.masses[1] == 0.0
+    with open(path, 'w') as f:
+        json.dump({'units': {'length': 'parsec'}, 'bodies': []}, f)
+    with pytest.raises(ValueError):
+        load_catalog(path, cache=False)
+    with pytest.raises(ValueError):
+        load_catalog(path[:-4] + 'yaml')
+
+
+def test_csv_round_trip_uses_cache():
+    directory, cache = tempfile.mkdtemp(), tempfile.mkdtemp()
+    store = particles(50, seed=3)
+    store.radii = np.arange(50.0)
+    store.names[0] = 'Comet "#1", the first'
+    path = os.path.join(directory, 'swarm.csv')
+    save_catalog(store, path)
+    first = load_catalog(path, cache_dir=cache)
+    assert os.path.isdir(compiled_path(path, cache))
+    second = load_catalog(path, cache_dir=cache)
+    for loaded in (first, second):
+        assert loaded.names == store.names
+        np.testing.assert_array_equal(loaded.positions, store.positions)
+        np.testing.assert_array_equal(loaded.velocities, store.velocities)
+        np.testing.assert_array_equal(loaded.masses, store.masses)
+        np.testing.assert_array_equal(loaded.radii, store.radii)
+    # The store owns writable copies of the memory-mapped arrays
+    second.add(np.zeros(2))
+    second.positions[0] = 0.0
+
+
+def test_npz_and_cli():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'binary.npz')
+    save_catalog(make_scenario('binary'), path)
+    assert make_scenario(path).names == ['Star_1', 'Star_2', 'Star_3']
+    output = os.path.join(directory, 'state.npz')
+    assert main(['run', '--scenario', path, '--steps', '5',
+                 '--output', output]) == 0
+    assert np.load(output)['positions'].shape == (3, 2)
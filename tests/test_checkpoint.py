@@ -0,0 +1,77 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from .context import orbits
+from orbits.checkpoint import Checkpointer, list_checkpoints, \
+    load_checkpoint, restore_checkpoint, save_checkpoint, seek
+from orbits.cli import main
+from orbits.integrators import make_integrator
+from orbits.scenarios import make_scenario
+from orbits.simulation import Simulation
+
+
+@pytest.mark.parametrize('name', ['leapfrog', 'block', 'wisdom-holman',
+                                  'hierarchical', 'test-particles'])
+def test_restart_is_bit_exact(name):
+    path = os.path.join(tempfile.mkdtemp(), 'c.npz')
+    straight = Simulation(make_scenario('solar'),
+                          integrator=make_integrator(name), dt=3600.0)
+    straight.run(20)
+    sim = Simulation(make_scenario('solar'),
+                     integrator=make_integrator(name), dt=3600.0)
+    sim.run(10)
+    save_checkpoint(sim, path)
+    restarted = load_checkpoint(path)
+    assert restarted.integrator.name == name
+    restarted.run(10)
+    np.testing.assert_array_equal(restarted.store.positions,
+                                  straight.store.positions)
+    np.testing.assert_array_equal(restarted.store.velocities,
+                                  straight.store.velocities)
+    assert restarted.sim_steps == 20
+    assert restarted.time_elapsed == straight.time_elapsed
+    assert restarted.store.names == straight.store.names
+
+
+def test_restore_in_place_needs_the_same_bodies():
+    path = os.path.join(tempfile.mkdtemp(), 'c.npz')
+    save_checkpoint(Simulation(make_scenario('binary')), path)
+    with pytest.raises(ValueError):
+        restore_checkpoint(Simulation(make_scenario('solar')), path)
+
+
+def test_checkpointer_prunes_and_seek_replays():
+    directory = tempfile.mkdtemp()
+    sim = Simulation(make_scenario('binary'), dt=3600.0)
+    expected = {}
+
+    def callback(sim):
+        checkpointer(sim)
+        expected[sim.sim_steps] = sim.store.positions.copy()
+
+    checkpointer = Checkpointer(directory, every=10, keep=2)
+    sim.run(35, callback)
+    assert [os.path.basename(p) for p in list_checkpoints(directory)] == \
+        ['checkpoint-000000000020.npz', 'checkpoint-000000000030.npz']
+    found = seek(directory, 25 * 3600.0)
+    assert found.sim_steps == 25
+    np.testing.assert_array_equal(found.store.positions, expected[25])
+    with pytest.raises(ValueError):
+        seek(directory, 3600.0)
+
+
+def test_cli_restart_finishes_the_run():
+    directory = tempfile.mkdtemp()
+    whole = os.path.join(directory, 'whole.npz')
+    resumed = os.path.join(directory, 'resumed.npz')
+    main(['run', '--scenario', 'binary', '--steps', '30', '--output', whole])
+    main(['run', '--scenario', 'binary', '--steps', '20',
+          '--checkpoint-dir', directory, '--checkpoint-every', '10'])
+    main(['run', '--scenario', 'binary', '--steps', '30', '--restart',
+          '--checkpoint-dir', directory, '--output', resumed])
+    np.testing.assert_array_equal(np.load(resumed)['positions'],
+                                  np.load(whole)['positions'])
+    assert int(np.load(resumed)['sim_steps']) == 30
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+import numpy as np
+
+from .context import orbits
+from orbits.cli import main
+from orbits.scenarios import make_scenario
+
+
+def test_run_writes_final_state():
+    path = os.path.join(tempfile.mkdtemp(), 'state.npz')
+    assert main(['run', '--scenario', 'binary', '--steps', '10',
+                 '--dt', '3600', '--output', path]) == 0
+    state = np.load(path)
+    assert state['positions'].shape == (3, 2)
+    assert int(state['sim_steps']) == 10
+    assert float(state['time_elapsed']) == 36000.0
+    assert list(state['names']) == ['Star_1', 'Star_2', 'Star_3']
+
+
+def test_scenarios_match_the_scripts():
+    solar = make_scenario('solar')
+    assert len(solar) == 15
+    luna = solar.names.index('LUNA')
+    earth = solar.names.index('E')
+    np.testing.assert_allclose(solar.positions[luna] - solar.positions[earth],
+                               [3.844e8, 0.0])
+    assert make_scenario('solar', moons=False, dim=3).positions.shape == \
+        (10, 3)
+    assert make_scenario('sun-earth').dim == 3
+    assert len(make_scenario('cluster', count=50, seed=1)) == 50
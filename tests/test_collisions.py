@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from .context import orbits
+from orbits.collisions import Collisions, contacts, find_collisions
+from orbits.forces import make_backend
+from orbits.integrators import make_integrator
+from orbits.simulation import Simulation
+from orbits.state import BodyStore
+
+
+def test_broad_phase_matches_all_pairs():
+    rng = np.random.default_rng(0)
+    before = rng.uniform(0, 1, (1500, 3))
+    after = before + rng.normal(0, 0.02, (1500, 3))
+    radii = rng.uniform(0, 0.01, 1500)
+    radii[:100] = 0
+    i, j, t = find_collisions(before, after, radii)
+    assert np.all(np.diff(t) >= 0) and len(i) > 0
+    a, b = np.triu_indices(1500, 1)
+    hit, _ = contacts(before, after, radii, a, b)
+    assert set(zip(np.minimum(i, j), np.maximum(i, j))) == \
+        set(zip(a[hit], b[hit]))
+
+
+def test_crossing_within_a_step():
+    # Two bodies swapping places in one step never overlap at its ends
+    before = np.array([[-10.0, 0.0], [10.0, 0.0]])
+    after = before[::-1].copy()
+    i, j, t = find_collisions(before, after, np.array([1.0, 1.0]))
+    assert len(i) == 1 and np.isclose(t[0], 0.45)
+    assert not len(find_collisions(before, after, np.zeros(2))[0])
+
+
+def head_on(response, **options):
+    store = BodyStore.from_arrays([[-5.0, 0.0], [5.0, 1.0], [50.0, 50.0]],
+                                  [[1.0, 0.0], [-1.0, 0.0], [0.0, 0.0]],
+                                  [3.0, 1.0, 1.0], [1.0, 1.0, 1.0],
+                                  ['A', 'B', 'C'])
+    sim = Simulation(store, make_backend('direct', G=0.0),
+                     make_integrator('leapfrog'), 1.0)
+    collisions = Collisions(response, **options)
+    sim.run(10, collisions)
+    return sim.store, collisions
+
+
+def test_responses():
+    store, collisions = head_on('merge')
+    assert store.names == ['A', 'C'] and store.masses[0] == 4.0
+    assert np.allclose(store.velocities[0], [0.5, 0.0])
+    assert np.isclose(store.radii[0], 2 ** (1 / 3.0))
+    assert [e[2:] for e in collisions.events] == [('A', 'B')]
+    store, _ = head_on('delete', compact=False)
+    assert len(store) == 3 and store.masses[1] == store.radii[1] == 0
+    assert np.allclose(store.velocities[0], [1.0, 0.0])
+    store, collisions = head_on('bounce')
+    assert len(store) == 3 and len(collisions.events) == 1
+    momentum = store.masses.dot(store.velocities)
+    assert np.allclose(momentum, [2.0, 0.0])
+    assert np.isclose(store.masses.dot((store.velocities ** 2).sum(1)), 4.0)
+    with pytest.raises(ValueError):
+        Collisions('stick')
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from .context import orbits
+from orbits import diagnostics
+from orbits.diagnostics import Monitor, ToleranceExceeded
+from orbits.forces import direct_sum, make_backend, potential_energy
+from orbits.integrators import make_integrator
+from orbits.scenarios import make_scenario
+from orbits.simulation import Simulation
+
+
+def test_force_pass_potentials():
+    rng = np.random.default_rng(3)
+    x = rng.normal(size=(300, 3))
+    m = rng.uniform(0, 1, 300)
+    m[:10] = 0
+    x[11] = x[12]  # coincident, which neither kernel counts
+    phi = np.empty(300)
+    a = direct_sum(x, m, 1.0, 0.1, potentials=phi)
+    assert np.array_equal(a, direct_sum(x, m, 1.0, 0.1))
+    assert np.isclose(0.5 * m.dot(phi), potential_energy(x, m, 1.0, 0.1),
+                      rtol=1e-12)
+
+
+def test_monitor_reuses_force_pass(monkeypatch):
+    calls = []
+
+    def counted(*args):
+        calls.append(1)
+        return potential_energy(*args)
+
+    monkeypatch.setattr(diagnostics, 'potential_energy', counted)
+    sim = Simulation(make_scenario('solar'), make_backend('direct'),
+                     make_integrator('leapfrog'), 3600.0)
+    monitor = Monitor(every=10)
+    sim.run(50, monitor)
+    # Only the reference needs its own pair sweep
+    assert len(calls) == 1 and len(monitor.history) == 5
+    drifts = monitor.last
+    assert drifts['energy'] < 1e-8 and drifts['momentum'] < 1e-13
+    assert drifts['angular_momentum'] < 1e-13
+    reference = potential_energy(sim.store.positions, sim.store.masses,
+                                 sim.forces.G)
+    assert np.isclose(sim.forces.last_potential_energy(
+        sim.store.positions, sim.store.masses), reference, rtol=1e-12)
+
+
+def test_monitor_actions():
+    def simulation():
+        return Simulation(make_scenario('solar'), make_backend('direct'),
+                          make_integrator('euler'), 86400.0)
+
+    sim = simulation()
+    with pytest.raises(ToleranceExceeded):
+        sim.run(1000, Monitor(every=100, tolerance=1e-5, action='stop'))
+    assert sim.sim_steps == 100
+    sim = simulation()
+    sim.run(1000, Monitor(every=100, tolerance=1e-4, action='shrink'))
+    assert sim.dt < 86400.0
+    with pytest.raises(ValueError):
+        Monitor(action='ignore')
@@ -0,0 +1,63 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from .context import orbits
+from orbits.cli import main
+from orbits.ensemble import apply_parameters, grid, run_ensemble, sample
+from orbits.scenarios import make_scenario
+
+
+def test_grid_and_sample():
+    members = grid(a=[1, 2], b=[3, 4, 5])
+    assert len(members) == 6
+    assert members[1] == {'a': 1, 'b': 4}
+    drawn = sample(50, seed=2, x=(0.0, 1.0))
+    assert drawn == sample(50, seed=2, x=(0.0, 1.0))
+    assert all(0 <= m['x'] < 1 for m in drawn)
+
+
+def test_apply_parameters():
+    store = make_scenario('binary')
+    apply_parameters(store, {'Star_1.mass': 1e30, 'Star_2.vy': -1.0,
+                             'seed': 3})
+    assert store.masses[0] == 1e30 and store.velocities[1, 1] == -1.0
+    with pytest.raises(ValueError):
+        apply_parameters(store, {'Vulcan.mass': 1.0})
+    with pytest.raises(ValueError):
+        apply_parameters(store, {'Star_1.spin': 1.0})
+
+
+def test_pool_matches_serial_run():
+    members = grid(**{'Star_1.mass': [1.9e30, 2.0e30],
+                      'Star_2.vy': [-4e3, -5e3]})
+    serial = run_ensemble('binary', members, steps=50, every=10, workers=1)
+    pooled = run_ensemble('binary', members, steps=50, every=10, workers=2)
+    assert serial['positions'].shape == (4, 3, 2)
+    assert serial['trajectory'].shape == (4, 6, 3, 4)
+    np.testing.assert_array_equal(serial['parameters']['Star_2.vy'],
+                                  [-4e3, -5e3, -4e3, -5e3])
+    np.testing.assert_array_equal(pooled['positions'], serial['positions'])
+    assert np.all(serial['energy_error'] < 1e-6)
+    # Heavier first star, different orbit
+    assert not np.allclose(serial['positions'][0], serial['positions'][2])
+
+
+def test_no_members_gives_an_empty_table():
+    for batch in (False, True):
+        table = run_ensemble('binary', [], workers=2, batch=batch)
+        assert table == {'parameters': {}}
+
+
+def test_cli_sweep():
+    path = os.path.join(tempfile.mkdtemp(), 'sweep.npz')
+    main(['sweep', '--scenario', 'binary', '--steps', '5',
+          '--grid', 'Star_1.mass=1.9e30,2e30', '--sample',
+          'Star_3.vx=0:100', '--members', '3', '--sample-seed', '1',
+          '--workers', '1', '--output', path])
+    table = np.load(path)
+    assert table['positions'].shape == (6, 3, 2)
+    assert table['parameter:Star_1.mass'].tolist() == [1.9e30] * 3 + \
+        [2e30] * 3
@@ -0,0 +1,81 @@
+import math
+
+import numpy as np
+
+from .context import orbits
+from orbits.forces import G, direct_sum
+from orbits.state import BodyStore, row_property
+
+
+def pairwise_reference(positions, masses):
+    """Per-pair Python loop, as the scripts used to compute it."""
+    acc = np.zeros_like(positions)
+    for i in range(len(positions)):
+        for j in range(len(positions)):
+            if i == j or masses[j] <= 0:
+                continue
+            diff = positions[j] - positions[i]
+            r = math.sqrt(np.dot(diff, diff))
+            acc[i] += G * masses[j] * diff / r ** 3
+    return acc
+
+
+def test_direct_sum_matches_pairwise_loop():
+    rng = np.random.default_rng(1)
+    for dim in (2, 3):
+        positions = rng.normal(size=(20, dim)) * 1e11
+        masses = rng.uniform(1e20, 1e25, 20)
+        masses[3] = 0.0
+        np.testing.assert_allclose(direct_sum(positions, masses),
+                                   pairwise_reference(positions, masses),
+                                   rtol=1e-12)
+
+
+def test_direct_sum_blocks_large_systems():
+    rng = np.random.default_rng(2)
+    positions = rng.normal(size=(300, 2))
+    masses = rng.uniform(1, 2, 300)
+    whole = direct_sum(positions, masses)
+    orbits.forces.BLOCK_ELEMENTS, old = 64, orbits.forces.BLOCK_ELEMENTS
+    try:
+        blocked = direct_sum(positions, masses)
+    finally:
+        orbits.forces.BLOCK_ELEMENTS = old
+    np.testing.assert_allclose(blocked, whole, rtol=1e-12)
+
+
+def test_direct_sum_conserves_momentum():
+    rng = np.random.default_rng(3)
+    positions = rng.normal(size=(50, 3))
+    masses = rng.uniform(1, 2, 50)
+    acc = direct_sum(positions, masses)
+    np.testing.assert_allclose((masses[:, None] * acc).sum(axis=0), 0,
+                               atol=1e-12 * np.abs(masses[:, None] * acc).max())
+
+
+def test_direct_sum_targets():
+    positions = np.array([[0.0, 0.0], [2.0, 0.0]])
+    acc = direct_sum(positions, [1.0, 0.0], G=1.0, targets=[[1.0, 0.0]])
+    np.testing.assert_allclose(acc, [[-1.0, 0.0]])
+
+
+class View:
+    x = row_property('positions', 0)
+    velocity = row_property('velocities')
+    m = row_property('masses')
+
+    def __init__(self, store, index):
+        self.store, self.index = store, index
+
+
+def test_store_grows_and_views_track_rows():
+    store = BodyStore(dim=2, capacity=1)
+    views = [View(store, store.add([i, 0], [0, i], i + 1.0))
+             for i in range(10)]
+    assert len(store) == 10
+    np.testing.assert_array_equal(store.positions[:, 0], np.arange(10))
+    views[4].x = 40.0
+    views[4].velocity += 1.0
+    assert store.positions[4, 0] == 40.0
+    np.testing.assert_array_equal(store.velocities[4], [1.0, 5.0])
+    assert views[9].m == 10.0
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from .context import orbits
+from orbits.state import BodyStore
+
+MODULES = ['orbits.' + name for name in
+           ('bench', 'catalog', 'checkpoint', 'cli', 'collisions',
+            'diagnostics', 'ensemble', 'profiler', 'recorder', 'render',
+            'trails', 'main', 'orbits', 'orbits2', 'orbits3')]
+
+
+def test_imports_load_no_gui():
+    # In a fresh interpreter, as other tests may have imported pygame, and
+    # in an empty directory, which importing must leave empty
+    code = ('import sys\n'
+            'for name in {0!r}:\n'
+            '    __import__(name)\n'
+            'print(sorted(set(sys.modules) & {{"pygame", "vpython"}}))\n'
+            ).format(MODULES)
+    directory = tempfile.mkdtemp()
+    root = os.path.join(os.path.dirname(orbits.__file__), '..')
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(root))
+    result = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True, cwd=directory,
+                            env=env)
+    assert result.stdout.strip() == '[]'
+    assert os.listdir(directory) == []
+
+
+def test_headless_year_script(capsys):
+    from orbits.main import main
+    sun, earth = main(render=False, days=3, store=BodyStore(dim=3))
+    assert earth.model is None
+    assert capsys.readouterr().out.count('Kepler') == 3
+    # Every call integrates a store of its own
+    first, _ = main(render=False, days=1)
+    second, _ = main(render=False, days=1)
+    assert first.store is not second.store and len(second.store) == 2
+
+
+def test_planets_script_store_has_no_placeholder_rows():
+    from orbits import orbits as script
+    # Earth, the Moon and the Sun, then the planets
+    assert script.STORE.names == ['Earth', 'Moon', 'Sol'] + script.NAMES
+    assert all(script.STORE.masses > 0)
+
+
+def test_refine_scales_only_integrators_that_substep():
+    from orbits.integrators import make_integrator
+    from orbits.orbits3 import refine
+    hierarchical = make_integrator('hierarchical')
+    block = make_integrator('block')
+    leapfrog = make_integrator('leapfrog')
+    per_orbit, eta = hierarchical.per_orbit, block.eta
+    for integrator in (hierarchical, block, leapfrog):
+        refine(integrator, 2.0)
+    assert hierarchical.per_orbit == 2 * per_orbit
+    assert block.eta == eta / 2
+    assert not hasattr(leapfrog, 'per_orbit')
+
+
+def test_orbits2_steps_its_store_through_the_integrator():
+    from orbits import orbits2 as script
+    assert script.STORE.names[0] == 'Sol' and len(script.STORE) == 14
+    earth = script.planets[3]
+    before = earth.dy
+    script.INTEGRATOR.step(script.STORE, script.FORCES, script.timescale)
+    # An hour along its orbit, pulled in towards Sol
+    assert abs(earth.dy - before - earth.vy * script.timescale) < 1e3
+    assert earth.ax < 0
+
+
+def test_orbits3_makes_the_solar_scenario():
+    from orbits.orbits3 import makeObjects
+    from orbits.scenarios import solar
+    store = BodyStore(dim=2)
+    makeObjects(store)
+    built = solar()
+    assert store.names == built.names
+    np.testing.assert_allclose(store.positions, built.positions)
+    np.testing.assert_allclose(store.velocities, built.velocities)
+    np.testing.assert_allclose(store.masses, built.masses)
@@ -0,0 +1,218 @@
+import threading
+
+import numpy as np
+
+from .context import orbits
+from orbits.forces import direct_jerk, make_backend
+from orbits.integrators import INTEGRATORS, make_integrator
+from orbits.state import BodyStore
+
+GM = 1.0
+
+
+def kepler_store(e=0.5):
+    """Two bodies, the second on an orbit of eccentricity e, period 2 pi."""
+    store = BodyStore(dim=2)
+    store.add([0.0, 0.0], [0.0, 0.0], 1.0)
+    store.add([1.0 - e, 0.0], [0.0, np.sqrt((1 + e) / (1 - e))], 1e-12)
+    return store
+
+
+def energy(store):
+    v = store.velocities[1] - store.velocities[0]
+    r = store.positions[1] - store.positions[0]
+    return 0.5 * v.dot(v) - GM / np.sqrt(r.dot(r))
+
+
+def run(name, steps, periods=1.0):
+    """Integrate, returning the final state and the worst energy error."""
+    store = kepler_store()
+    e0 = energy(store)
+    forces = make_backend('direct', G=GM)
+    integrator = make_integrator(name)
+    dt = 2 * np.pi * periods / steps
+    worst = 0.0
+    for _ in range(steps):
+        integrator.step(store, forces, dt)
+        worst = max(worst, abs(energy(store) / e0 - 1))
+    return store, worst
+
+
+def test_convergence_order():
+    for name, cls in INTEGRATORS.items():
+        if name in ('block', 'wisdom-holman', 'hierarchical'):
+            continue
+        final = [run(name, steps, periods=0.7)[0].positions[1]
+                 for steps in (500, 1000, 2000)]
+        errors = [np.abs(final[0] - final[2]).max(),
+                  np.abs(final[1] - final[2]).max()]
+        # Richardson: e(h) - e(h/4) over e(h/2) - e(h/4)
+        observed = np.log2(errors[0] / errors[1] - 1)
+        assert abs(observed - cls.order) < 0.3, (name, observed)
+
+
+def test_symplectic_energy_error_stays_bounded():
+    for name in ('leapfrog', 'verlet', 'yoshida4'):
+        short = run(name, 200, periods=1)[1]
+        long = run(name, 2000, periods=10)[1]
+        assert long < 1.5 * short, name
+    assert run('euler', 2000, periods=10)[1] > run('euler', 200)[1]
+
+
+def test_leapfrog_and_verlet_agree():
+    a = run('leapfrog', 300)[0]
+    b = run('verlet', 300)[0]
+    np.testing.assert_allclose(a.positions, b.positions, atol=1e-10)
+
+
+def test_unknown_integrator():
+    try:
+        make_integrator('rk4')
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def moon_system():
+    """A star, a planet with a close moon and a distant planet (G = 1)."""
+    store = BodyStore(dim=2)
+    store.add([0.0, 0.0], [0.0, 0.0], 1.0)
+    store.add([1.0, 0.0], [0.0, 1.0], 1e-3)
+    store.add([1.01, 0.0], [0.0, 1.0 + np.sqrt(1e-3 / 0.01)], 1e-9)
+    store.add([10.0, 0.0], [0.0, np.sqrt(0.1)], 1e-4)
+    return store
+
+
+def run_block(eta):
+    forces = make_backend('direct', G=GM)
+    block = make_integrator('block', eta=eta)
+    store = moon_system()
+    for _ in range(20):
+        block.step(store, forces, 0.05)
+    return store, block
+
+
+def test_block_timesteps_subcycle_the_moon():
+    store, block = run_block(0.02)
+    assert block.levels[2] > block.levels[1] >= block.levels[3]
+    assert block.body_evaluations < 4 * 2 ** block.levels.max()
+
+    reference = moon_system()
+    forces = make_backend('direct', G=GM)
+    leapfrog = make_integrator('leapfrog')
+    fine = 4 * 2 ** block.levels[2]
+    for _ in range(20 * fine):
+        leapfrog.step(reference, forces, 0.05 / fine)
+    expected = reference.positions[2] - reference.positions[1]
+    errors = []
+    for eta in (0.02, 0.01):
+        store = run_block(eta)[0]
+        moon = store.positions[2] - store.positions[1]
+        errors.append(np.abs(moon - expected).max())
+    assert errors[0] < 1e-2 * 0.01
+    assert 3 < errors[0] / errors[1] < 5
+
+
+def test_direct_jerk_matches_finite_difference():
+    rng = np.random.default_rng(7)
+    positions = rng.normal(size=(10, 3))
+    velocities = rng.normal(size=(10, 3))
+    masses = rng.uniform(1, 2, 10)
+    h = 1e-6
+    forces = make_backend('direct', G=GM)
+    ahead = forces.accelerations(positions + h * velocities, masses)
+    behind = forces.accelerations(positions - h * velocities, masses)
+    np.testing.assert_allclose(direct_jerk(positions, velocities, masses, GM),
+                               (ahead - behind) / (2 * h), rtol=1e-5)
+
+
+def test_wisdom_holman_is_exact_for_two_bodies():
+    store, worst = run('wisdom-holman', 7, periods=3.3)
+    assert worst < 1e-10
+    # Periapsis at t = 0, so after 3.3 periods the anomaly matches 0.3
+    expected = run('wisdom-holman', 1, periods=0.3)[0]
+    np.testing.assert_allclose(store.positions, expected.positions,
+                               atol=1e-9)
+
+
+def test_wisdom_holman_planets():
+    from orbits.scenarios import make_scenario
+    from orbits.forces import G
+
+    def planet_energy(store):
+        m, x, v = store.masses, store.positions, store.velocities
+        d = np.sqrt(((x[:, None] - x[None]) ** 2).sum(-1))
+        np.fill_diagonal(d, np.inf)
+        return 0.5 * (m * (v * v).sum(1)).sum() - \
+            0.5 * G * (m[:, None] * m[None] / d).sum()
+
+    mercury = 2 * np.pi * np.sqrt(5.79e10 ** 3 / (G * 1.9891e30))
+    forces = make_backend('direct')
+    errors = {}
+    for name in ('wisdom-holman', 'leapfrog'):
+        store = make_scenario('solar', moons=False)
+        e0 = planet_energy(store)
+        integrator = make_integrator(name)
+        for _ in range(400):
+            integrator.step(store, forces, mercury / 20)
+        errors[name] = abs(planet_energy(store) / e0 - 1)
+    assert errors['wisdom-holman'] < 1e-6
+    assert errors['wisdom-holman'] < errors['leapfrog'] / 100
+
+
+def test_hierarchical_moons():
+    from orbits.integrators import hill_parents
+    from orbits.scenarios import make_scenario
+    store = make_scenario('solar')
+    parents = hill_parents(store.positions, store.velocities, store.masses)
+    assert [store.names[p] for p in parents[10:]] == ['J'] * 4 + ['E']
+    forces = make_backend('direct')
+    reference = make_integrator('yoshida4')
+    for _ in range(10 * 288):
+        reference.step(store, forces, 300.0)
+    sim = make_scenario('solar')
+    integrator = make_integrator('hierarchical', parents=[-1] * 10 +
+                                 [5, 5, 5, 5, 3])
+    for _ in range(10):
+        integrator.step(sim, forces, 86400.0)
+    # One step a day for the planets, the moons sub-stepped
+    assert integrator.substeps[0] == 2 and integrator.substeps[1] > 20
+    for moon, planet in ((14, 3), (13, 5)):
+        expected = store.positions[moon] - store.positions[planet]
+        got = sim.positions[moon] - sim.positions[planet]
+        assert np.linalg.norm(got - expected) < \
+            5e-4 * np.linalg.norm(expected)
+
+
+def test_test_particles():
+    from orbits.scenarios import belt, solar
+    forces = make_backend('direct')
+    store = belt(300, seed=3)
+    # Test particles interleaved with the planets
+    order = np.random.default_rng(0).permutation(len(store))
+    mixed = BodyStore.from_arrays(store.positions[order],
+                                  store.velocities[order],
+                                  store.masses[order])
+    reference = make_integrator('leapfrog')
+    threads = threading.active_count()
+    integrator = make_integrator('test-particles', chunk=32, workers=2)
+    assert make_integrator('test-particles', **integrator.options()) \
+        .options() == integrator.options()
+    for _ in range(30):
+        reference.step(store, forces, 86400.0)
+        integrator.step(mixed, forces, 86400.0)
+    np.testing.assert_allclose(mixed.positions, store.positions[order],
+                               rtol=1e-12)
+    np.testing.assert_allclose(mixed.velocities, store.velocities[order],
+                               rtol=1e-12)
+    integrator.close()
+    assert threading.active_count() == threads
+    # The massive bodies are integrated exactly as without the swarm
+    planets, swarm = solar(moons=False), belt(50, seed=4)
+    alone = make_integrator('wisdom-holman')
+    integrator = make_integrator('test-particles', inner='wisdom-holman')
+    for _ in range(30):
+        alone.step(planets, forces, 86400.0)
+        integrator.step(swarm, forces, 86400.0)
+    np.testing.assert_array_equal(swarm.positions[:10], planets.positions)
@@ -0,0 +1,70 @@
+import numpy as np
+
+from .context import orbits
+from orbits import jit
+from orbits.diagnostics import energy
+from orbits.forces import direct_sum, make_backend, potential_energy
+from orbits.integrators import make_integrator
+from orbits.scenarios import particles, solar
+
+
+def _system(n, seed=2):
+    store = particles(n, seed=seed)
+    store.masses[::5] = 0.0
+    store.positions[1] = store.positions[2]  # coincident, but distinct
+    return store
+
+
+def test_matches_reference_kernel():
+    forces = make_backend('numba', softening=1e4)
+    assert forces.compiled == jit.available()
+    store = _system(300)
+    x, m = store.positions, store.masses
+    expected_phi, phi = np.empty(len(m)), np.empty(len(m))
+    expected = direct_sum(x, m, forces.G, forces.softening,
+                          potentials=expected_phi)
+    np.testing.assert_allclose(forces.evaluate(x, m, potentials=phi),
+                               expected, rtol=1e-12, atol=1e-30)
+    np.testing.assert_allclose(phi, expected_phi, rtol=1e-12)
+    np.testing.assert_allclose(forces.subset_accelerations(x, m, [0, 7, 1]),
+                               expected[[0, 7, 1]], rtol=1e-12, atol=1e-30)
+    assert np.isclose(forces.potential_energy(x, m),
+                      potential_energy(x, m, forces.G, forces.softening),
+                      rtol=1e-12)
+
+
+def test_tiled_loop_uncompiled(monkeypatch):
+    # The kernels run as plain Python too; small tiles exercise the folding
+    monkeypatch.setattr(jit, 'TILE', 4)
+    store = _system(23)
+    x, m = store.positions, store.masses
+    acc, phi = np.empty((3, 23, 2)), np.empty((3, 23))
+    out, potentials = np.empty((23, 2)), np.empty(23)
+    jit.pair_accelerations(x, m, 0.0, acc, phi, True)
+    jit.reduce_slots(acc, phi, 2.0, out, True, potentials)
+    expected_phi = np.empty(23)
+    np.testing.assert_allclose(out, direct_sum(x, m, 2.0,
+                                               potentials=expected_phi),
+                               rtol=1e-12)
+    np.testing.assert_allclose(potentials, expected_phi, rtol=1e-12)
+
+
+def test_integration_and_fallback(monkeypatch):
+    reference, fast = solar(), solar()
+    direct, compiled = make_backend('direct'), make_backend('numba')
+    for integrator in ('leapfrog', 'yoshida4'):
+        a, b = make_integrator(integrator), make_integrator(integrator)
+        for _ in range(50):
+            a.step(reference, direct, 3600.0)
+            b.step(fast, compiled, 3600.0)
+        np.testing.assert_allclose(fast.positions, reference.positions,
+                                   rtol=1e-10, atol=1.0)
+        assert np.isclose(energy(fast, compiled), energy(reference, direct),
+                          rtol=1e-12)
+    # Without numba the backend runs the numpy kernels
+    monkeypatch.setattr(jit, '_KERNELS', {})
+    numpy = make_backend('numba')
+    assert not numpy.compiled and numpy.options() == direct.options()
+    np.testing.assert_array_equal(
+        numpy.accelerations(fast.positions, fast.masses),
+        direct.accelerations(fast.positions, fast.masses))
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from .context import orbits
+from orbits.forces import G
+from orbits.integrators import make_integrator
+from orbits.kepler import Orbit, eccentric_anomaly
+from orbits.scenarios import make_scenario
+from orbits.simulation import Simulation
+
+
+def test_solver_residuals():
+    e = np.linspace(0, 0.9999, 100)[:, None]
+    M = np.linspace(-20, 20, 201)
+    E = eccentric_anomaly(M, e)
+    np.testing.assert_allclose(E - e * np.sin(E), M + 0 * e, atol=1e-13)
+    e = np.linspace(1.0001, 20, 100)[:, None]
+    M = np.linspace(-100, 100, 201)
+    H = eccentric_anomaly(M, e)
+    np.testing.assert_allclose(e * np.sinh(H) - H, M + 0 * e, rtol=1e-13,
+                               atol=1e-13)
+    with pytest.raises(ValueError):
+        eccentric_anomaly(1.0, 1.0)
+
+
+def test_elements_round_trip():
+    rng = np.random.default_rng(3)
+    count = 500
+    e = np.append(rng.uniform(0, 0.95, count), rng.uniform(1.05, 4, count))
+    a = np.where(e < 1, 1, -1) * rng.uniform(1e10, 1e12, 2 * count)
+    nu = np.where(e < 1, rng.uniform(-180, 180, 2 * count),
+                  rng.uniform(-0.9, 0.9, 2 * count) *
+                  np.degrees(np.arccos(-1 / np.maximum(e, 1))))
+    orbit = Orbit(a, e, rng.uniform(1, 179, 2 * count),
+                  rng.uniform(-180, 180, 2 * count),
+                  rng.uniform(-180, 180, 2 * count), nu)
+    r, v = orbit.state(1e7)
+    again = Orbit.from_state(r, v, orbit.mu, t0=1e7)
+    for t in (1e7, 3e7, -2e7):
+        r1, v1 = orbit.state(t)
+        r2, v2 = again.state(t)
+        np.testing.assert_allclose(r2, r1, rtol=1e-9,
+                                   atol=1e-9 * np.abs(r1).max())
+        np.testing.assert_allclose(v2, v1, rtol=1e-9,
+                                   atol=1e-9 * np.abs(v1).max())
+    np.testing.assert_allclose(again.e, e, atol=1e-9)
+
+
+def test_planar_and_periodic():
+    # Clockwise, circular and equatorial: every undefined angle at once
+    orbit = Orbit.from_state([[1e11, 0.0]], [[0.0, -np.sqrt(G * 2e30 /
+                                                           1e11)]], G * 2e30)
+    assert orbit.i[0] == 180.0
+    r, v = orbit.state(orbit.period / 4)
+    np.testing.assert_allclose(r, [[0.0, -1e11]], atol=1e-3)
+    many = Orbit(1.5e11, [0.0, 0.3, 0.9], 10.0, 20.0, 30.0, 40.0)
+    times = np.array([0.0, 1.0, 5.0])[:, None] * many.period
+    r, v = many.state(many.t0 + times)
+    assert r.shape == (3, 3, 3)
+    np.testing.assert_allclose(r[1:], r[[0, 0]], atol=1e-3)
+
+
+def test_agrees_with_nbody():
+    store = make_scenario('sun-earth')
+    r = store.positions[1] - store.positions[0]
+    v = store.velocities[1] - store.velocities[0]
+    orbit = Orbit.from_state(r, v, G * store.masses.sum())
+    sim = Simulation(store, integrator=make_integrator('yoshida4'),
+                     dt=3600.0)
+    sim.run(24 * 100)
+    expected, _ = orbit.state(sim.time_elapsed)
+    got = sim.store.positions[1] - sim.store.positions[0]
+    assert np.linalg.norm(got - expected) < 1e-6 * np.linalg.norm(r)
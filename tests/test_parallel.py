@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from .context import orbits
+from orbits.forces import direct_sum, make_backend
+from orbits.scenarios import particles
+
+
+def test_reproducible_for_any_worker_count():
+    store = particles(700, seed=4)
+    store.masses[::9] = 0.0
+    x, m = store.positions, store.masses
+    results = []
+    for workers in (1, 3, 8):
+        forces = make_backend('parallel', softening=1e5, workers=workers,
+                              rows=50, columns=120)
+        phi = np.empty(len(m))
+        results.append((forces.evaluate(x, m, potentials=phi), phi))
+        forces.close()
+    for acc, phi in results[1:]:
+        np.testing.assert_array_equal(acc, results[0][0])
+        np.testing.assert_array_equal(phi, results[0][1])
+    expected_phi = np.empty(len(m))
+    expected = direct_sum(x, m, softening=1e5, potentials=expected_phi)
+    np.testing.assert_allclose(results[0][0], expected, rtol=1e-12)
+    np.testing.assert_allclose(results[0][1], expected_phi, rtol=1e-12)
+
+
+def test_backend_interface():
+    store = particles(90, seed=5)
+    forces = make_backend('parallel', workers=2, rows=16, columns=16)
+    assert make_backend('parallel', **forces.options()).options() == \
+        forces.options()
+    full = forces.accelerations(store.positions, store.masses)
+    np.testing.assert_allclose(full, direct_sum(store.positions,
+                                                store.masses), rtol=1e-12)
+    np.testing.assert_allclose(
+        forces.subset_accelerations(store.positions, store.masses, [3, 80]),
+        full[[3, 80]], rtol=1e-12)
+    forces.close()
+    with pytest.raises(ValueError):
+        make_backend('parallel', rows=0)
@@ -0,0 +1,68 @@
+import csv
+import json
+import os
+import tempfile
+
+from .context import orbits
+from orbits.cli import main
+from orbits.profiler import NULL, PhaseTimer
+
+
+class FakeClock:
+    """Advances by a fixed amount every time it is read."""
+
+    def __init__(self, tick):
+        self.now = 0.0
+        self.tick = tick
+
+    def __call__(self):
+        self.now += self.tick
+        return self.now
+
+
+def test_disabled_records_nothing():
+    timer = PhaseTimer()
+    assert timer.phase('step') is NULL
+    with timer.phase('step'):
+        pass
+    timer.frame(10)
+    assert timer.summary() == {} and timer.steps_per_s() is None
+
+
+def test_rolling_percentiles_and_throughput():
+    timer = PhaseTimer(window=100, enabled=True, clock=FakeClock(0.001))
+    for i in range(250):
+        timer.record('render', 0.001 * (i % 100))
+    stats = timer.summary()['render']
+    assert stats['count'] == 250
+    assert abs(stats['p50'] - 0.0495) < 1e-12
+    assert abs(stats['p99'] - 0.09801) < 1e-12
+    timer.frame()
+    for _ in range(10):
+        with timer.phase('step'):
+            pass
+        timer.frame(5)
+    # Each frame reads the clock three times: 3 ms per 5 steps
+    assert abs(timer.steps_per_s() - 5 / 0.003) < 1e-6
+    assert abs(timer.summary()['step']['p50'] - 0.001) < 1e-12
+    assert timer.lines()[0].endswith('steps/s')
+    timer.toggle()
+    assert not timer.enabled
+    timer.toggle()
+    assert timer.summary() == {}
+
+
+def test_export_and_cli_profile():
+    directory = tempfile.mkdtemp()
+    timer = PhaseTimer(enabled=True)
+    timer.record('flip', 0.002)
+    timer.save(os.path.join(directory, 'p.json'))
+    with open(os.path.join(directory, 'p.json')) as f:
+        assert json.load(f)['phases']['flip']['max'] == 0.002
+    path = os.path.join(directory, 'run.csv')
+    main(['run', '--scenario', 'binary', '--steps', '20', '--profile', path,
+          '--profile-window', '8'])
+    with open(path) as f:
+        rows = {row['phase']: row for row in csv.DictReader(f)}
+    assert int(rows['forces']['count']) == 21
+    assert int(rows['frame']['count']) == 20
@@ -0,0 +1,43 @@
+import os
+import tempfile
+
+import numpy as np
+
+from .context import orbits
+from orbits.recorder import TrajectoryRecorder, load_trajectory
+from orbits.scenarios import make_scenario
+from orbits.simulation import Simulation
+
+
+def test_recorded_frames_match_the_simulation():
+    path = os.path.join(tempfile.mkdtemp(), 'run.npy')
+    sim = Simulation(make_scenario('solar'), dt=3600.0)
+    expected = []
+    with TrajectoryRecorder(path, sim.store, sim.dt, every=5,
+                            chunk=3) as recorder:
+        def callback(sim):
+            recorder(sim)
+            if sim.sim_steps % 5 == 0:
+                expected.append(np.hstack([sim.store.positions,
+                                           sim.store.velocities]))
+        sim.run(50, callback)
+        recorder.flush()
+        partial, meta = load_trajectory(path)
+        assert partial.shape == (10, 15, 4)
+    data, meta = load_trajectory(path)
+    assert isinstance(data, np.memmap)
+    np.testing.assert_array_equal(data, np.array(expected))
+    assert meta['frames'] == 10
+    assert meta['names'][0] == 'Sol'
+    assert meta['every'] == 5 and meta['dt'] == 3600.0
+    assert os.path.getsize(path) == 128 + data.nbytes
+    np.testing.assert_array_equal(np.load(path), data)
+
+
+def test_cli_records():
+    path = os.path.join(tempfile.mkdtemp(), 'run.npy')
+    orbits.cli.main(['run', '--scenario', 'sun-earth', '--steps', '24',
+                     '--record', path, '--every', '6'])
+    data, meta = load_trajectory(path)
+    assert data.shape == (5, 2, 6)
+    assert meta['columns'] == ['x', 'y', 'z', 'vx', 'vy', 'vz']
@@ -0,0 +1,79 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from .context import orbits
+from orbits.render import DirtyRects, TextCache, draw_points, draw_trails, \
+    map_colors, project
+
+pygame = pytest.importorskip('pygame')
+
+
+def test_project_culls_and_keeps_fractional_zoom():
+    positions = np.array([[0.0, 0.0], [0.25, -0.25], [100.0, 0.0],
+                          [-1e300, 0.0]])
+    pixels, visible = project(positions, [0.0, 0.0], [2.5, 2.5], [50, 50],
+                              [100, 100])
+    assert pixels[:2].tolist() == [[50, 50], [50, 49]]
+    assert visible.tolist() == [True, True, False, False]
+
+
+def test_draw_points_matches_pygame():
+    surface = pygame.Surface((64, 48), depth=32)
+    colors = np.array([[255, 0, 0], [0, 255, 0], [10, 20, 30]])
+    assert map_colors(surface, colors).tolist() == \
+        [surface.map_rgb(tuple(c)) for c in colors]
+    draw_points(surface, np.array([[0, 0], [10, 20], [63, 47]]), colors, 1)
+    assert surface.get_at((10, 21))[:3] == (0, 255, 0)
+    assert surface.get_at((11, 21))[:3] == (0, 0, 0)
+    assert surface.get_at((62, 47))[:3] == (10, 20, 30)
+    assert surface.get_at((1, 0))[:3] == (255, 0, 0)
+
+
+def test_swarm_draws_at_interactive_rates():
+    surface = pygame.Surface((800, 800), depth=32)
+    rng = np.random.default_rng(0)
+    positions = rng.normal(0, 20, (100000, 2))
+    colors = rng.integers(0, 256, (100000, 3))
+    start = time.perf_counter()
+    pixels, visible = project(positions, [0, 0], [8, 8], [400, 400],
+                              [800, 800])
+    draw_points(surface, pixels[visible], colors[visible], 1)
+    assert time.perf_counter() - start < 0.5
+
+
+def test_draw_trails_skips_off_screen():
+    surface = pygame.Surface((20, 20), depth=32)
+    pixels = np.array([[[2, 5], [40, 40]], [[17, 5], [60, 40]]])
+    draw_trails(surface, pixels, [[255, 255, 255], [255, 0, 0]])
+    assert surface.get_at((10, 5))[:3] == (255, 255, 255)
+    assert surface.get_at((10, 15))[:3] == (0, 0, 0)
+
+
+def test_text_cache_renders_changes_only():
+    pygame.font.init()
+    cache = TextCache(pygame.font.Font(None, 15), capacity=2)
+    first = cache.render('1.5 days', (255, 255, 255), (0, 0, 0))
+    assert cache.render('1.5 days', (255, 255, 255), (0, 0, 0)) is first
+    cache.render('2.5 days', (255, 255, 255), (0, 0, 0))
+    cache.render('3.5 days', (255, 255, 255), (0, 0, 0))
+    assert cache.misses == 3 and len(cache.surfaces) == 2
+
+
+def test_dirty_rects_erase_and_update_changed_regions():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    screen = pygame.display.set_mode((100, 100))
+    dirty = DirtyRects(screen)
+    dirty.begin()
+    dirty.add(draw_points(screen, np.array([[10, 10]]), (255, 0, 0), 2))
+    assert dirty.present() == [screen.get_rect()]
+    dirty.begin()
+    dirty.add(draw_points(screen, np.array([[50, 60]]), (255, 0, 0), 2))
+    changed = dirty.present()
+    assert screen.get_at((10, 10))[:3] == (0, 0, 0)
+    assert screen.get_at((50, 60))[:3] == (255, 0, 0)
+    assert changed == [pygame.Rect(8, 8, 5, 5), pygame.Rect(48, 58, 5, 5)]
+    pygame.display.quit()
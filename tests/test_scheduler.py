@@ -0,0 +1,42 @@
+from .context import orbits
+from orbits.scheduler import FrameScheduler
+
+
+class FakeClock:
+    """Advances by a fixed amount every time a step runs."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def step(self, cost):
+        def run():
+            self.now += cost
+        return run
+
+
+def test_fixed_mode_runs_k_steps():
+    clock = FakeClock()
+    scheduler = FrameScheduler('fixed', steps_per_frame=7, clock=clock)
+    assert scheduler.run_frame(clock.step(0.01)) == 7
+    assert scheduler.last_steps == 7
+
+
+def test_max_mode_fills_the_budget():
+    clock = FakeClock()
+    scheduler = FrameScheduler('max', budget=0.1, clock=clock)
+    for _ in range(5):
+        steps = scheduler.run_frame(clock.step(0.001))
+    assert 95 <= steps <= 100
+    # A step longer than the budget still runs once per frame
+    assert scheduler.run_frame(clock.step(1.0)) == 1
+
+
+def test_toggle():
+    scheduler = FrameScheduler()
+    scheduler.toggle()
+    assert scheduler.mode == 'max'
+    scheduler.toggle()
+    assert scheduler.mode == 'fixed'
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from .context import orbits
+from orbits.trails import Trails
+
+
+def test_ring_buffer_order_and_decimation():
+    trails = Trails(length=4, every=3)
+    for step in range(30):
+        trails.record(np.full((2, 2), float(step)))
+    history = trails.history()
+    assert history.shape == (4, 2, 2)
+    assert history[:, 0, 0].tolist() == [18.0, 21.0, 24.0, 27.0]
+    assert trails.nbytes == 4 * 2 * 2 * 8
+
+
+def test_restart_on_new_body_count():
+    trails = Trails(length=3)
+    trails.record(np.zeros((2, 2)))
+    trails.record(np.ones((2, 2)))
+    assert len(trails.history()) == 2
+    trails.record(np.ones((1, 2)))
+    assert trails.history().shape == (1, 1, 2)
+    with pytest.raises(ValueError):
+        Trails(length=1)
@@ -1,11 +1,10 @@
-from nose.tools import *
-from .context imort orbits
+from .context import orbits
 
 def setup():
-	print "SETUP!"
+	print("SETUP!")
 
 def teardown():
-	print "TEARDOWN!"
+	print("TEARDOWN!")
 	
 def test_basic():
-	print "I RAN!"
+	print("I RAN!")